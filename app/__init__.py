@@ -7,6 +7,8 @@ from flask_sqlalchemy import SQLAlchemy
 
 # local import
 from instance.config import app_config
+from app.cache import KPICache
+from app.ngram import NgramIndex
 
 # initialize sql-alchemy
 db = SQLAlchemy()
@@ -17,6 +19,12 @@ bcrypt = Bcrypt()
 # initialize CORS
 cors = CORS()
 
+# initialize the per-company KPI response cache
+kpi_cache = KPICache()
+
+# initialize the founder and user directory fallback index
+directory_index = NgramIndex()
+
 
 def create_app(config_name):
     app = Flask(__name__, instance_relative_config=True)
@@ -27,13 +35,19 @@ def create_app(config_name):
     db.init_app(app)
     bcrypt.init_app(app)
     cors.init_app(app)
+    kpi_cache.init_app(app)
+    directory_index.init_app(app)
 
     from app.apis import (
         auth_blueprint,
         companies_blueprint,
+        directory_blueprint,
+        ingest_blueprint,
         kpi_blueprint
     )
     from app import models      # noqa
+    from app.writer import metric_writer
+    metric_writer.init_app(app)
 
     @app.route('/')
     def index():
@@ -42,4 +56,6 @@ def create_app(config_name):
     app.register_blueprint(companies_blueprint)
     app.register_blueprint(kpi_blueprint)
     app.register_blueprint(auth_blueprint)
+    app.register_blueprint(directory_blueprint)
+    app.register_blueprint(ingest_blueprint)
     return app
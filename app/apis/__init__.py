@@ -5,5 +5,7 @@ from flask import Blueprint
 companies_blueprint = Blueprint('companies', __name__)
 kpi_blueprint = Blueprint('kpi', __name__)
 auth_blueprint = Blueprint('auth', __name__)
+directory_blueprint = Blueprint('directory', __name__)
+ingest_blueprint = Blueprint('ingest', __name__)
 
-from app.apis import companies, kpi, auth      # noqa
+from app.apis import companies, kpi, auth, directory, ingest      # noqa
@@ -7,7 +7,7 @@ from flask import (
 
 import os
 from typing import Callable, Any, Tuple
-from app import bcrypt, db
+from app import bcrypt, db, queries
 from app.apis import auth_blueprint as auth
 from app.models import User
 
@@ -57,7 +57,7 @@ def register() -> Tuple[object, int]:
     password: str = request.json['password']
     staff: bool = True if request.json.get('staff') else False
 
-    user: User = User.query.filter_by(email=email).first()
+    user: User = queries.first_by(User, email=email)
     if user:
         return jsonify({
             'status': 'failure',
@@ -91,7 +91,7 @@ def login() -> Tuple[object, int]:
     password = request.json['password']
 
     try:
-        user = User.query.filter_by(email=email).first()
+        user = queries.first_by(User, email=email)
 
         if user and bcrypt.check_password_hash(
             user.password, password
@@ -136,7 +136,7 @@ def logout(resp: int = None):
 @auth.route('/auth/status', methods=['GET'])
 @protected_route
 def user_status(resp: int = None) -> Tuple[object, int]:
-    user: User = User.query.get(resp)
+    user: User = queries.get(User, resp)
     return jsonify({
         'status': 'success',
         'data': {
@@ -153,7 +153,7 @@ def user_status(resp: int = None) -> Tuple[object, int]:
 @auth.route('/auth/change', methods=['PUT'])
 @protected_route
 def change(resp: int = None) -> Tuple[object, int]:
-    user: User = User.query.get(resp)
+    user: User = queries.get(User, resp)
 
     new_email: str = request.json['new_email']
     old_password: str = request.json['old_password']
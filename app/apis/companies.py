@@ -8,36 +8,260 @@ from flask import (
 )
 from sqlalchemy.exc import IntegrityError
 
-from typing import Dict, Tuple, Any
+import re
+import json
+import base64
 
-from app import db
+from typing import Dict, List, Tuple, Any
+
+from app import db, kpi_cache, queries
 from app.apis import companies_blueprint as company
-from app.apis.kpi import get_kpi_for_company
+from app.apis.kpi import (
+    get_kpi_for_company,
+    get_latest_kpi,
+    kpi_variant,
+    metric_list,
+    week_window,
+)
 from app.apis.auth import protected_route
 from app.models import Company, Founder, User
 
 
-def get_all_companies() -> Tuple[object, int]:
-    companies: Dict[str, Dict[str, Any]] = {}
-    for startup in Company.query.all():
-        companies[startup.name] = {
-            'id': startup.id,
-            'website': startup.website,
-            'bio': startup.bio,
-            'founders': list(map(
+MAX_PAGE_SIZE = 100
+DEFAULT_PAGE_SIZE = 50
+PAGE_ORDERS = {
+    'id': Company.id,
+    'name': Company.name,
+}
+COMPANY_FIELDS = ('name', 'website', 'bio', 'founders')
+COMPANY_INCLUDES = ('founders', 'metrics', 'latest')
+
+
+def field_list(args: Dict[str, str]) -> List[str]:
+    """Parse the fields parameter, every field when it is not given"""
+    if not args.get('fields'):
+        return list(COMPANY_FIELDS)
+
+    fields = [field.strip() for field in args['fields'].split(',')]
+    unknown = [field for field in fields if field not in COMPANY_FIELDS]
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(unknown)}')
+    return fields
+
+
+def include_list(args: Dict[str, str]) -> List[str]:
+    """Parse the include parameter, nothing when it is not given"""
+    if not args.get('include'):
+        return []
+
+    includes = [include.strip() for include in args['include'].split(',')]
+    unknown = [
+        include for include in includes if include not in COMPANY_INCLUDES
+    ]
+    if unknown:
+        raise ValueError(f'unknown includes: {", ".join(unknown)}')
+    return includes
+
+
+def company_query(fields: List[str], listing: bool = False) -> Any:
+    """Query companies selecting only the columns of the requested fields.
+    The listing is keyed by name, so it always loads the name
+    """
+    columns = [
+        getattr(Company, field) for field in fields if field != 'founders'
+    ]
+    if listing and Company.name not in columns:
+        columns.append(Company.name)
+    # load_only always keeps the primary key
+    query = Company.query.options(db.load_only(*columns or [Company.id]))
+
+    # founders are loaded for every company at once with a second query,
+    # so the number of queries does not grow with the portfolio, and
+    # joined to a single company
+    if 'founders' in fields:
+        query = query.options(
+            db.subqueryload(Company.founders) if listing
+            else db.joinedload(Company.founders))
+    return query
+
+
+def company_data(company: Company, fields: List[str]) -> Dict[str, Any]:
+    data: Dict[str, Any] = {'id': company.id}
+    for field in fields:
+        if field == 'founders':
+            data['founders'] = list(map(
                 lambda founder: {
                     'name': founder.name,
                     'email': founder.email,
                     'role': founder.role
                 },
-                startup.founders
-            )),
+                company.founders
+            ))
+        else:
+            data[field] = getattr(company, field)
+    return data
+
+
+def encode_cursor(order: str, after: Any) -> str:
+    """Return an opaque cursor pointing right after a company"""
+    return base64.urlsafe_b64encode(
+        json.dumps([order, after]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, Any]:
+    try:
+        order, after = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise ValueError('invalid cursor')
+    if not isinstance(order, str) or order not in PAGE_ORDERS:
+        raise ValueError('invalid cursor')
+    # a tampered cursor must not reach the comparison with the column
+    expected = int if order == 'id' else str
+    if isinstance(after, bool) or not isinstance(after, expected):
+        raise ValueError('invalid cursor')
+    return order, after
+
+
+def page_parameters(args: Dict[str, str]) -> Tuple[int, str, Any]:
+    """Parse limit, order and cursor into (limit, order, after)"""
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    # the cursor remembers the order it was issued for
+    if args.get('cursor'):
+        order, after = decode_cursor(args['cursor'])
+    else:
+        order, after = args.get('order', 'id'), None
+    if order not in PAGE_ORDERS:
+        raise ValueError(f'order must be one of {", ".join(PAGE_ORDERS)}')
+
+    return limit, order, after
+
+
+def search_parameters(args: Dict[str, str]) -> Tuple[List[str], int, int]:
+    """Parse q, limit and offset into (terms, limit, offset)"""
+    terms = re.findall(r'[^\W_]+', args.get('q', '').lower())
+    if not terms:
+        raise ValueError('q must contain at least one word')
+
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+        offset = int(args.get('offset', 0))
+    except ValueError:
+        raise ValueError('limit and offset must be integers')
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+    if offset < 0:
+        raise ValueError('offset must not be negative')
+
+    return terms, limit, offset
+
+
+def search_companies(terms: List[str], limit: int = DEFAULT_PAGE_SIZE,
+                     offset: int = 0) -> Tuple[int, List[Dict[str, Any]]]:
+    """Return the number of companies matching every term, as a prefix,
+    and one page of them, best match first. PostgreSQL ranks the indexed
+    search_vector, SQLite the companies_fts table
+    """
+    if db.engine.dialect.name == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        rows = db.session.execute(db.text("""
+            SELECT id, name, website, rank, count(*) OVER () AS total
+            FROM (
+                SELECT companies.id, companies.name, companies.website,
+                       -bm25(companies_fts, 10.0, 5.0, 1.0) AS rank
+                FROM companies_fts
+                JOIN companies ON companies.id = companies_fts.rowid
+                WHERE companies_fts MATCH :match
+            )
+            ORDER BY rank DESC, id
+            LIMIT :limit OFFSET :offset
+        """), {'match': match, 'limit': limit, 'offset': offset}).fetchall()
+        count = db.text(
+            'SELECT count(*) FROM companies_fts '
+            'WHERE companies_fts MATCH :match')
+
+        def matches() -> int:
+            return db.session.execute(count, {'match': match}).scalar()
+    else:
+        query = db.func.to_tsquery(
+            'english', ' & '.join(f'{term}:*' for term in terms))
+        rank = db.func.ts_rank(Company.search_vector, query)
+        matching = db.session.query(Company.id) \
+            .filter(Company.search_vector.op('@@')(query))
+        rows = matching.add_columns(
+            Company.name,
+            Company.website,
+            rank.label('rank'),
+            db.func.count().over().label('total'),
+        ).order_by(rank.desc(), Company.id).limit(limit).offset(offset).all()
+        matches = matching.count
+
+    # past the last page there is no row to carry the total
+    if rows:
+        total = rows[0].total
+    else:
+        total = matches() if offset else 0
+    return total, [
+        {
+            'id': row.id,
+            'name': row.name,
+            'website': row.website,
+            'rank': row.rank,
         }
+        for row in rows
+    ]
 
-    return jsonify({
-        'total': Company.query.count(),
+
+def get_all_companies() -> Tuple[object, int]:
+    """Return every company, or a page of them when limit or cursor is
+    given. Pages are read with keyset pagination on the id or name index,
+    so a deep page costs the same as the first one
+    """
+    paginated = 'limit' in request.args or 'cursor' in request.args
+    try:
+        fields = field_list(request.args)
+        if paginated:
+            limit, order, after = page_parameters(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    query = company_query(fields, listing=True)
+    if paginated:
+        column = PAGE_ORDERS[order]
+        if after is not None:
+            query = query.filter(column > after)
+        # one extra row tells whether there is a next page
+        startups: List[Company] = \
+            query.order_by(column).limit(limit + 1).all()
+        next_cursor = encode_cursor(
+            order, getattr(startups[limit - 1], order)
+        ) if len(startups) > limit else None
+        startups = startups[:limit]
+    else:
+        startups = query.all()
+
+    # the name is already the key of every company
+    fields = [field for field in fields if field != 'name']
+    companies: Dict[str, Dict[str, Any]] = {}
+    for startup in startups:
+        companies[startup.name] = company_data(startup, fields)
+
+    response_obj: Dict[str, Any] = {
+        'total': len(startups),
         'companies': companies
-    }), 200
+    }
+    if paginated:
+        response_obj['next_cursor'] = next_cursor
+
+    return jsonify(response_obj), 200
 
 
 def create_company() -> Tuple[object, int]:
@@ -84,7 +308,7 @@ def companies(resp: int = None) -> Tuple[object, int]:
     """GET to retrieve all the companies
     POST to create a new company
     """
-    user: User = User.query.get(resp)
+    user: User = queries.get(User, resp)
     if not user.staff:
         return jsonify({
             'status': 'failure',
@@ -102,10 +326,37 @@ def companies(resp: int = None) -> Tuple[object, int]:
         }), 405
 
 
+@company.route('/companies/search', methods=['GET'])
+@protected_route
+def search(resp: int = None) -> Tuple[object, int]:
+    """Full-text search over the name, website and bio of the companies"""
+    try:
+        terms, limit, offset = search_parameters(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    user: User = queries.get(User, resp)
+    if not user.staff:
+        return jsonify({
+            'status': 'failure',
+            'message': 'non-staff members not allowed'
+        }), 401
+
+    total, companies = search_companies(terms, limit, offset)
+    return jsonify({
+        'total': total,
+        'companies': companies,
+        'next_offset': offset + limit if offset + limit < total else None,
+    }), 200
+
+
 @company.route('/companies/<int:company_id>', methods=['PUT'])
 @protected_route
 def update_companies(company_id: int, resp: int = None) -> Tuple[object, int]:
-    user = User.query.get(resp)
+    user = queries.get(User, resp)
     if not user.staff \
         and (not user.founder_info
              or user.founder_info.company_id != company_id):
@@ -114,7 +365,7 @@ def update_companies(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'user not authorized to this view'
         }), 401
 
-    company = Company.query.get(company_id)
+    company = queries.get(Company, company_id)
 
     if not company:
         return jsonify({
@@ -128,7 +379,7 @@ def update_companies(company_id: int, resp: int = None) -> Tuple[object, int]:
 @company.route('/companies/<int:company_id>', methods=['GET'])
 @protected_route
 def get_company(company_id: int, resp: int = None) -> Tuple[object, int]:
-    user = User.query.get(resp)
+    user = queries.get(User, resp)
     if not user.staff \
         and (not user.founder_info
              or user.founder_info.company_id != company_id):
@@ -137,7 +388,23 @@ def get_company(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'user not authorized to this view'
         }), 401
 
-    company = Company.query.get(company_id)
+    try:
+        fields = field_list(request.args)
+        includes = include_list(request.args)
+        if 'metrics' in includes or 'latest' in includes:
+            window = week_window(request.args)
+            metrics = metric_list(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    if 'founders' in includes and 'founders' not in fields:
+        fields.append('founders')
+
+    # founders are only queried when they are asked for
+    company = company_query(fields).get(company_id)
 
     if not company:
         return jsonify({
@@ -145,19 +412,21 @@ def get_company(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'company not found'
         }), 404
 
-    data = {
-        'id': company.id,
-        'name': company.name,
-        'website': company.website,
-        'founders': list(map(
-            lambda founder: {
-                'name': founder.name,
-                'email': founder.email,
-                'role': founder.role,
-            },
-            list(company.founders)
-        )),
-        'bio': company.bio
-    }
+    data = company_data(company, fields)
+
+    # the metrics share the cached series of GET /companies/<id>/metrics
+    if 'metrics' in includes:
+        variant = kpi_variant(window, metrics)
+        version = Company.kpi_version_of(company_id)
+        data['metrics'] = kpi_cache.get(company_id, variant, version)
+        if data['metrics'] is None:
+            data['metrics'] = get_kpi_for_company(
+                company_id, metrics=metrics, **window)
+            kpi_cache.set(company_id, data['metrics'], variant, version)
+
+    if 'latest' in includes:
+        data['latest'] = get_latest_kpi(
+            [company_id], window.get('last', 12), metrics
+        ).get(company_id, {})
 
     return jsonify(data), 200
@@ -0,0 +1,165 @@
+# server/app/apis/directory.py
+
+from flask import (
+    jsonify,
+    request,
+)
+
+from typing import Dict, List, Tuple, Any
+from app import db, directory_index, queries
+from app.apis import directory_blueprint as directory
+from app.apis.auth import protected_route
+from app.models import Founder, User
+
+
+MAX_LOOKUP_SIZE = 50
+DEFAULT_LOOKUP_SIZE = 10
+
+# whether pg_trgm is installed, per database
+trigram_support: Dict[str, bool] = {}
+
+
+def has_trigrams() -> bool:
+    url = str(db.engine.url)
+    if url not in trigram_support:
+        trigram_support[url] = db.engine.dialect.name == 'postgresql' and \
+            db.session.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            ).scalar() is not None
+    return trigram_support[url]
+
+
+def lookup_parameters(args: Dict[str, str]) -> Tuple[str, int]:
+    """Parse q and limit into (query, limit)"""
+    query = args.get('q', '').strip()
+    if not query:
+        raise ValueError('q must not be empty')
+
+    try:
+        limit = int(args.get('limit', DEFAULT_LOOKUP_SIZE))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if not 0 < limit <= MAX_LOOKUP_SIZE:
+        raise ValueError(f'limit must be between 1 and {MAX_LOOKUP_SIZE}')
+
+    return query, limit
+
+
+def directory_records() -> List[Dict[str, Any]]:
+    """Every founder, and every user who is not a founder"""
+    founders = db.session.query(
+        Founder.id, Founder.name, Founder.email, Founder.company_id
+    ).order_by(Founder.id)
+    users = db.session.query(User.id, User.name, User.email) \
+        .filter(User.founder_id.is_(None)).order_by(User.id)
+    return [
+        {
+            'kind': 'founder',
+            'id': founder.id,
+            'name': founder.name,
+            'email': founder.email,
+            'company_id': founder.company_id,
+        }
+        for founder in founders
+    ] + [
+        {
+            'kind': 'user',
+            'id': user.id,
+            'name': user.name,
+            'email': user.email,
+            'company_id': None,
+        }
+        for user in users
+    ]
+
+
+def trigram_lookup(query: str, limit: int) -> List[Dict[str, Any]]:
+    """Same lookup as directory_index.search, answered by the trigram
+    indexes: ILIKE 'query%' for the prefixes and the <% operator for the
+    fuzzy matches (doubled % for the driver's parameter style)
+    """
+    prefix = query.replace('\\', '\\\\') \
+        .replace('%', '\\%').replace('_', '\\_') + '%'
+    needle = db.literal(query)
+
+    def people(Model: Any, kind: str, company_id: Any) -> Any:
+        return db.select([
+            db.literal(kind).label('kind'),
+            Model.id,
+            Model.name,
+            Model.email,
+            company_id.label('company_id'),
+            db.or_(
+                Model.name.ilike(prefix),
+                Model.email.ilike(prefix),
+            ).label('prefix'),
+            db.func.greatest(
+                db.func.word_similarity(needle, Model.name),
+                db.func.word_similarity(needle, Model.email),
+            ).label('score'),
+        ]).where(db.or_(
+            Model.name.ilike(prefix),
+            Model.email.ilike(prefix),
+            needle.op('<%%')(Model.name),
+            needle.op('<%%')(Model.email),
+        ))
+
+    matches = db.union_all(
+        people(Founder, 'founder', Founder.company_id),
+        people(User, 'user', db.null()).where(User.founder_id.is_(None)),
+    ).alias('matches')
+    rows = db.session.execute(
+        db.select([matches]).order_by(
+            matches.c.prefix.desc(),
+            matches.c.score.desc(),
+            matches.c.name,
+            matches.c.id,
+        ).limit(limit)
+    )
+    return [
+        {
+            'kind': row.kind,
+            'id': row.id,
+            'name': row.name,
+            'email': row.email,
+            'company_id': row.company_id,
+            'score': round(row.score or 0.0, 4),
+        }
+        for row in rows
+    ]
+
+
+def lookup(query: str, limit: int = DEFAULT_LOOKUP_SIZE) \
+        -> List[Dict[str, Any]]:
+    """Founders and users whose name or email starts with the query, then
+    those close to it, best match first
+    """
+    if has_trigrams():
+        return trigram_lookup(query, limit)
+    return directory_index.search(query, directory_records, limit)
+
+
+@directory.route('/directory', methods=['GET'])
+@protected_route
+def get_directory(resp: int = None) -> Tuple[object, int]:
+    """Typeahead lookup over founder and user names and emails"""
+    try:
+        query, limit = lookup_parameters(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    user: User = queries.get(User, resp)
+    if not user.staff:
+        return jsonify({
+            'status': 'failure',
+            'message': 'non-staff members not allowed'
+        }), 401
+
+    people = lookup(query, limit)
+    return jsonify({
+        'total': len(people),
+        'people': people,
+    }), 200
@@ -0,0 +1,213 @@
+# server/app/apis/ingest.py
+
+import json
+from flask import (
+    current_app,
+    jsonify,
+    request,
+)
+
+from typing import Any, Dict, IO, Iterator, List, Optional, Tuple
+from sqlalchemy.exc import SQLAlchemyError
+from app import db, kpi_cache, queries
+from app.apis import ingest_blueprint as ingest
+from app.apis.auth import protected_route
+from app.importer import Row, merge, stage, staging_table
+from app.models import METRICS, Company, MetricWeek, User, metric_value
+
+
+# data points written per transaction
+BATCH_SIZE = 1000
+# longest line read, anything longer is skipped as an error
+MAX_LINE_SIZE = 4096
+# line errors listed in the response, the others are only counted
+MAX_REPORTED_ERRORS = 100
+
+
+def body_lines(stream: IO[bytes]) \
+        -> Iterator[Tuple[int, Optional[bytes]]]:
+    """Read (line number, line) pairs off the request body, one line at
+    a time. Lines longer than MAX_LINE_SIZE are skipped and yielded as
+    None
+    """
+    number = 0
+    while True:
+        line = stream.readline(MAX_LINE_SIZE + 1)
+        if not line:
+            return
+        number += 1
+        if len(line) > MAX_LINE_SIZE:
+            # drain the rest of the line
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(MAX_LINE_SIZE)
+            yield number, None
+        else:
+            yield number, line
+
+
+def body_stream() -> IO[bytes]:
+    """Return the request body as a stream. Werkzeug only reads a body
+    without a Content-Length when the server says it has decoded the
+    chunks itself, which gunicorn does without saying so
+    """
+    chunked = 'chunked' in request.headers.get('Transfer-Encoding', '')
+    if request.content_length is None and chunked:
+        return request.environ['wsgi.input']
+    return request.stream
+
+
+def parse_point(line: Optional[bytes]) -> Tuple[str, int, float]:
+    """Parse one {"metric": ..., "week": ..., "value": ...} line into
+    (metric, week, value)
+    """
+    if line is None:
+        raise ValueError(f'line longer than {MAX_LINE_SIZE} bytes')
+    try:
+        point = json.loads(line.decode())
+    except ValueError:
+        raise ValueError('invalid JSON')
+    if not isinstance(point, dict):
+        raise ValueError('a data point must be an object')
+
+    metric = point.get('metric')
+    if metric not in METRICS:
+        raise ValueError(f'unknown metric {metric!r}')
+    week = point.get('week')
+    if isinstance(week, bool) or not isinstance(week, int) or week < 0:
+        raise ValueError('week must be a non-negative integer')
+    return metric, week, metric_value(point.get('value'))
+
+
+def write_batch(company_id: int, points: Dict[Tuple[str, int], float]) \
+        -> None:
+    """Merge a batch of data points of a company and commit it"""
+    rows: List[Row] = [
+        (company_id, metric, week, value)
+        for (metric, week), value in points.items()
+    ]
+    metrics = {metric for metric, week in points}
+    try:
+        with staging_table():
+            stage(rows)
+            merge(metrics)
+        # the counters are locked before the company row, in the order
+        # of BaseMetric.save_all, so that both cannot deadlock
+        MetricWeek.sync(company_id)
+        tracked = 0
+        for metric in metrics:
+            tracked |= METRICS[metric].tracked_bit()
+        Company.track_metric(company_id, tracked)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def ingest_points(company_id: int, stream: IO[bytes]) -> Dict[str, Any]:
+    """Read data points of a company off an NDJSON stream and write them
+    BATCH_SIZE at a time. A week given twice keeps the last value.
+
+    When a batch cannot be written, reading stops there: the report then
+    holds the data points already committed and 'resume_from_line', the
+    first line of the batch that was lost, to send the rest again from
+    """
+    ingested = failed = 0
+    errors: List[Dict[str, Any]] = []
+    # keyed by (metric, week): the merge cannot touch a row twice
+    batch: Dict[Tuple[str, int], float] = {}
+    # first line of the batch being read, and the lines it failed
+    batch_start, batch_failed = 1, 0
+
+    def write() -> bool:
+        nonlocal ingested, failed, errors, batch, batch_start, batch_failed
+        try:
+            write_batch(company_id, batch)
+        except SQLAlchemyError:
+            current_app.logger.exception(
+                'ingestion of company %s stopped at line %s',
+                company_id, batch_start)
+            # the lines of the lost batch are to be sent again
+            failed -= batch_failed
+            errors = [error for error in errors
+                      if error['line'] < batch_start]
+            return False
+        ingested += len(batch)
+        batch = {}
+        batch_failed = 0
+        return True
+
+    for number, line in body_lines(stream):
+        if not batch and not batch_failed:
+            batch_start = number
+        if line is not None and not line.strip():
+            continue
+        try:
+            metric, week, value = parse_point(line)
+        except ValueError as e:
+            failed += 1
+            batch_failed += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({'line': number, 'message': str(e)})
+            continue
+
+        batch[metric, week] = value
+        if len(batch) == BATCH_SIZE:
+            if not write():
+                return {'ingested': ingested, 'failed': failed,
+                        'errors': errors, 'resume_from_line': batch_start}
+
+    if batch and not write():
+        return {'ingested': ingested, 'failed': failed,
+                'errors': errors, 'resume_from_line': batch_start}
+
+    return {'ingested': ingested, 'failed': failed, 'errors': errors}
+
+
+@ingest.route('/companies/<int:company_id>/metrics/ingest', methods=['POST'])
+@protected_route
+def ingest_metrics(company_id: int, resp: int = None) -> Tuple[object, int]:
+    """Write the data points of an NDJSON body, one
+    {"metric": ..., "week": ..., "value": ...} object per line. The body
+    is read as it arrives, and every batch is committed on its own
+    """
+    user = queries.get(User, resp)
+    if not user.staff \
+        and (not user.founder_info
+             or user.founder_info.company_id != company_id):
+        return jsonify({
+            'status': 'failure',
+            'message': 'user not authorized to this view'
+        }), 401
+
+    company = queries.get(Company, company_id)
+
+    if not company:
+        return jsonify({
+            'status': 'failure',
+            'message': 'company not found'
+        }), 404
+
+    report = ingest_points(company_id, body_stream())
+    if 'resume_from_line' in report:
+        if report['ingested']:
+            kpi_cache.invalidate(company_id)
+        report.update({
+            'status': 'failure',
+            'message': 'ingestion stopped by a database error, send the '
+                       'lines from resume_from_line again',
+        })
+        return jsonify(report), 500
+
+    if not report['ingested']:
+        report.update({
+            'status': 'failure',
+            'message': 'no data points ingested',
+        })
+        return jsonify(report), 400
+
+    kpi_cache.invalidate(company_id)
+    report.update({
+        'status': 'success',
+        'message': 'data points ingested',
+    })
+    return jsonify(report), 201
@@ -1,51 +1,617 @@
 # server/app/apis/kpi.py
 
+import re
+import json
+import hashlib
 import datetime
+import operator
 from flask import (
+    current_app,
     jsonify,
     request,
 )
 
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, List, NamedTuple, Optional, Tuple
+from sqlalchemy.dialects.postgresql import aggregate_order_by
 
-from app import db
+from app import db, kpi_cache, queries
 from app.apis import kpi_blueprint as kpi
 from app.apis.auth import protected_route
-from app.models import User, Company, BaseMetric
+from app.models import (
+    User,
+    Company,
+    BaseMetric,
+    DuplicateSubmission,
+    IdempotencyKey,
+    METRICS,
+    MetricPoint,
+    MetricSubmission,
+    WeekAhead,
+    metric_value,
+)
+from app.writer import QueueFull, metric_writer
+
+KPI: Dict[str, Any] = METRICS
+
+MAX_SCREEN_WEEKS = 520
+SCREEN_OPERATORS = {
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '=': operator.eq,
+    '!=': operator.ne,
+}
+SCREEN_PREDICATE = re.compile(
+    r'^(\w+)\.(latest|delta|growth)(?::(\d+))?(<=|>=|!=|<|>|=)'
+    r'(-?\d+(?:\.\d+)?)$')
+
+
+class Predicate(NamedTuple):
+    """metric.measure:weeks op value, e.g. mrr.growth:4>0.1"""
+    metric: str
+    measure: str
+    weeks: int
+    op: str
+    value: float
+
+    @property
+    def name(self) -> str:
+        if self.measure == 'latest':
+            return f'{self.metric}.latest'
+        return f'{self.metric}.{self.measure}:{self.weeks}'
+
+
+def week_window(args: Dict[str, str]) -> Dict[str, int]:
+    """Parse the since_week, until_week and last query parameters"""
+    window: Dict[str, int] = {}
+    for param in ('since_week', 'until_week', 'last'):
+        if param not in args:
+            continue
+        try:
+            window[param] = int(args[param])
+        except ValueError:
+            raise ValueError(f'{param} must be an integer')
+        if window[param] < 0:
+            raise ValueError(f'{param} must not be negative')
+
+    return window
+
+
+def metric_list(args: Dict[str, str]) -> List[str]:
+    """Parse the metrics query parameter against the KPI registry,
+    None meaning every metric
+    """
+    if not args.get('metrics'):
+        return None
+    metrics = list(dict.fromkeys(
+        metric.strip() for metric in args['metrics'].split(',')))
+    unknown = [metric for metric in metrics if metric not in KPI]
+    if unknown:
+        raise ValueError(f'unknown metrics: {", ".join(unknown)}')
+    return metrics
+
+
+def screen_predicates(args: Dict[str, str]) -> List[Predicate]:
+    """Parse the where query parameter, a comma separated list of
+    predicates over the latest value, the N-week delta or the N-week
+    growth (N defaults to 1) of metrics of the KPI registry
+    """
+    if not args.get('where'):
+        raise ValueError('where must hold at least one predicate')
+
+    predicates = []
+    for text in args['where'].split(','):
+        match = SCREEN_PREDICATE.match(text.strip())
+        if not match:
+            raise ValueError(f'invalid predicate: {text}')
+        metric, measure, weeks, op, value = match.groups()
+        if metric not in KPI:
+            raise ValueError(f'unknown metrics: {metric}')
+        if measure == 'latest' and weeks is not None:
+            raise ValueError(f'latest takes no weeks: {text}')
+        weeks = int(weeks) if weeks is not None else 1
+        if not 0 < weeks <= MAX_SCREEN_WEEKS:
+            raise ValueError(
+                f'weeks must be between 1 and {MAX_SCREEN_WEEKS}: {text}')
+        predicates.append(Predicate(metric, measure, weeks, op, float(value)))
+
+    return predicates
+
+
+def metric_corrections(body: Dict[str, Any]) \
+        -> Dict[Any, Dict[Optional[int], float]]:
+    """Parse a PUT body into {Metric: {week: value}}. A metric maps to
+    {week: value, ...} to correct given weeks, or to a single value to
+    correct its last week (a None week)
+    """
+    if not body or not isinstance(body, dict):
+        raise ValueError('empty metrics')
+
+    unknown = [metric for metric in body if metric not in KPI]
+    if unknown:
+        raise ValueError(f'unknown metrics: {", ".join(unknown)}')
+
+    corrections: Dict[Any, Dict[Optional[int], float]] = {}
+    for metric, values in body.items():
+        if not isinstance(values, dict):
+            corrections[KPI[metric]] = {None: metric_value(values)}
+            continue
+        if not values:
+            raise ValueError(f'no weeks given for {metric}')
+        corrections[KPI[metric]] = {}
+        for week, value in values.items():
+            if not re.match(r'^\d+$', week):
+                raise ValueError(
+                    f'weeks must be non-negative integers: {metric}.{week}')
+            corrections[KPI[metric]][int(week)] = metric_value(value)
+    return corrections
+
+
+def submission_week(args: Dict[str, str]) -> Optional[int]:
+    """Parse the week query parameter of a metric submission"""
+    if 'week' not in args:
+        return None
+    try:
+        week = int(args['week'])
+    except ValueError:
+        raise ValueError('week must be an integer')
+    if week < 0:
+        raise ValueError('week must not be negative')
+    return week
+
+
+def idempotency_key(headers: Dict[str, str]) -> Optional[str]:
+    """Parse the Idempotency-Key header of a metric submission"""
+    key = headers.get('Idempotency-Key')
+    if key is None:
+        return None
+    key = key.strip()
+    if not 0 < len(key) <= 255:
+        raise ValueError('Idempotency-Key must be 1 to 255 characters')
+    return key
+
+
+def submission_fingerprint(body: Dict[str, Any], week: int = None) -> str:
+    return hashlib.sha256(
+        json.dumps([body, week], sort_keys=True).encode()).hexdigest()
+
+
+def submission_response(body: Dict[str, Any], weeks: Dict[str, int]) \
+        -> Dict[str, Any]:
+    return {
+        'status': 'success',
+        'message': 'metrics added',
+        'metrics_added': dict(body),
+        'weeks': weeks,
+    }
 
-KPI: Dict[str, Any] = {}
-for Metric in BaseMetric.__subclasses__():
-    KPI[Metric.__tablename__] = Metric
 
+def replay_submission(submission: IdempotencyKey,
+                      fingerprint: str) -> Tuple[object, int]:
+    """Answer a retried submission as the first one was answered"""
+    if submission.fingerprint != fingerprint:
+        return jsonify({
+            'status': 'failure',
+            'message': 'Idempotency-Key already used for another submission'
+        }), 422
+
+    response = jsonify(submission_response(
+        request.json, json.loads(submission.weeks)))
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response, 201
+
+
+def queue_submission(company_id: int, values: Dict[Any, float],
+                     week: Optional[int], key: Optional[str],
+                     fingerprint: Optional[str]) -> Tuple[object, int]:
+    """Hand a validated submission to the write-behind queue and answer
+    with the id its status is asked for with
+    """
+    try:
+        submission_id = metric_writer.submit(
+            company_id, values, week=week, key=key, fingerprint=fingerprint)
+    except QueueFull:
+        response = jsonify({
+            'status': 'failure',
+            'message': 'too many submissions queued, retry later'
+        })
+        response.headers['Retry-After'] = '1'
+        return response, 503
+
+    response = jsonify({
+        'status': 'success',
+        'message': 'metrics queued',
+        'metrics_added': dict(request.json),
+        'submission': submission_id,
+    })
+    response.headers['Location'] = \
+        f'/companies/{company_id}/submissions/{submission_id}'
+    return response, 202
+
+
+def kpi_variant(window: Dict[str, int], metrics: List[str]) -> Tuple:
+    """Key of a company's cached series for the given parameters"""
+    return (tuple(sorted(window.items())), tuple(metrics or ()))
+
+
+def company_id_list(args: Dict[str, str]) -> List[int]:
+    """Parse the ids query parameter, None meaning every company"""
+    if not args.get('ids'):
+        return None
+    try:
+        return [int(company_id) for company_id in args['ids'].split(',')]
+    except ValueError:
+        raise ValueError('ids must be a list of integers')
+
+
+def missing_companies(company_ids: List[int]) -> List[int]:
+    """Return the ids that do not belong to any company"""
+    if company_ids is None:
+        return []
+    found = {company.id for company in Company.query
+             .with_entities(Company.id)
+             .filter(Company.id.in_(company_ids))}
+    return sorted(set(company_ids) - found)
+
+
+def week_conditions(columns: Any, since_week: int = None,
+                    until_week: int = None) -> List[Any]:
+    conditions = []
+    if since_week is not None:
+        conditions.append(columns.week >= since_week)
+    if until_week is not None:
+        conditions.append(columns.week <= until_week)
+    return conditions
+
+
+def metric_rows(company_ids: List[int] = None,
+                metrics: List[str] = None) -> Any:
+    """Build one statement yielding (company_id, metric, week, value,
+    updated_at) rows of the given metrics (or all of them) of the given
+    companies (or all of them): a UNION ALL over the metric tables, or a
+    single range scan of metric_points in the long-format storage mode.
+    Tables of metrics that were not asked for are never touched
+    """
+    metrics = metrics or list(KPI)
+
+    def scope(Model: Any) -> Any:
+        if company_ids is None:
+            return Model.company_id.isnot(None)
+        return Model.company_id.in_(company_ids)
+
+    if current_app.config.get('METRIC_STORAGE') == 'points':
+        return db.select([
+            MetricPoint.company_id,
+            MetricPoint.metric,
+            MetricPoint.week,
+            MetricPoint.value,
+            MetricPoint.updated_at,
+        ]).where(db.and_(
+            scope(MetricPoint),
+            MetricPoint.metric.in_(metrics)
+        ))
+
+    # metrics no company in scope has data for are skipped: the mask is
+    # computed once and a branch whose bit is not set is never scanned
+    companies = Company.__table__
+    scope_mask = db.select([
+        db.func.bit_or(companies.c.tracked_metrics).label('mask')
+    ])
+    if company_ids is not None:
+        scope_mask = scope_mask.where(companies.c.id.in_(company_ids))
+    scope_mask = scope_mask.cte('tracked_metrics')
+    tracked = db.select([scope_mask.c.mask]).as_scalar()
+
+    return db.union_all(*[
+        db.select([
+            KPI[metric].company_id,
+            db.literal(metric).label('metric'),
+            KPI[metric].week,
+            KPI[metric].value,
+            KPI[metric].updated_at,
+        ]).where(db.and_(
+            tracked.op('&')(KPI[metric].tracked_bit()) != 0,
+            scope(KPI[metric])
+        ))
+        for metric in metrics
+    ])
+
+
+def recent_metric_rows(company_ids: List[int] = None, points: int = 12,
+                       metrics: List[str] = None) -> Any:
+    """Build one statement yielding (company_id, metric, week, value,
+    recency) rows of the last N weeks of the given metrics (or all of
+    them) of the given companies (or all of them). recency numbers the
+    weeks from the latest one.
+
+    Each series is read with a LATERAL top-N lookup walking its
+    (company_id, week) index backwards, so long histories are never
+    scanned and the numbering needs no sort
+    """
+    companies = Company.__table__
+    storage = MetricPoint if \
+        current_app.config.get('METRIC_STORAGE') == 'points' else None
+
+    branches = []
+    for metric in metrics or KPI:
+        Model = storage or KPI[metric]
+        conditions = [Model.company_id == companies.c.id]
+        if Model is MetricPoint:
+            conditions.append(MetricPoint.metric == metric)
+        recent = db.select([
+            Model.week,
+            Model.value,
+            db.func.row_number().over(order_by=Model.week.desc())
+            .label('recency'),
+        ]).where(
+            db.and_(*conditions)
+        ).order_by(Model.week.desc()).limit(points).lateral()
+
+        branch = db.select([
+            companies.c.id.label('company_id'),
+            db.literal(metric).label('metric'),
+            recent.c.week,
+            recent.c.value,
+            recent.c.recency,
+        ]).select_from(companies.join(recent, db.true())).where(
+            # only companies with data for the metric are looked up
+            companies.c.tracked_metrics.op('&')(KPI[metric].tracked_bit())
+            != 0
+        )
+        if company_ids is not None:
+            branch = branch.where(companies.c.id.in_(company_ids))
+        branches.append(branch)
+
+    return db.union_all(*branches)
+
+
+def get_kpi_for_companies(company_ids: List[int] = None,
+                          since_week: int = None, until_week: int = None,
+                          last: int = None,
+                          metrics: List[str] = None
+                          ) -> Dict[int, Dict[str, Any]]:
+    """Return the series of the given metrics (all of them when metrics is
+    None) of the given companies (all of them when company_ids is None),
+    keyed by company id. The series are
+    restricted to the weeks between since_week and until_week and to the
+    last N of them, while 'weeks' and 'last_updated' always describe the
+    full series
+    """
+    if company_ids is None:
+        company_ids = [company.id for company in
+                       Company.query.with_entities(Company.id)]
+        scope = None
+    else:
+        scope = company_ids
 
-def get_kpi_for_company(company_id) -> Dict[str, Any]:
     # default time before adding new metrics
     default_time = datetime.datetime.utcnow() - datetime.timedelta(days=10)
-    metric_field = {}
+    companies: Dict[int, Dict[str, Any]] = {}
+
+    for company_id in company_ids:
+        companies[company_id] = {}
+        for metric in metrics or KPI:
+            companies[company_id][metric] = {
+                'weeks': 0,
+                'last_updated': default_time,
+                'data': []
+            }
+
+    # every series is folded into a single row carrying its totals and
+    # the values of the requested window as an array, so neither ORM
+    # instances nor one row per data point are built on the way back
+    rows = metric_rows(scope, metrics).alias('metric_rows')
+    columns = [
+        rows.c.company_id,
+        rows.c.metric,
+        rows.c.week,
+        rows.c.value,
+        rows.c.updated_at,
+    ]
+    if last is not None:
+        # the weeks are numbered inside the window only, so that 'last'
+        # picks the last N weeks of the window
+        partition = [rows.c.company_id, rows.c.metric]
+        window = week_conditions(rows.c, since_week, until_week)
+        if window:
+            partition.append(db.and_(*window))
+        columns.append(db.func.row_number().over(
+            partition_by=partition,
+            order_by=rows.c.week.desc()
+        ).label('recency'))
+    ranked = db.select(columns).alias('ranked')
+
+    conditions = week_conditions(ranked.c, since_week, until_week)
+    if last is not None:
+        conditions.append(ranked.c.recency <= last)
+    data = db.func.array_agg(aggregate_order_by(ranked.c.value, ranked.c.week))
+    if conditions:
+        data = data.filter(db.and_(*conditions))
+
+    statement = db.select([
+        ranked.c.company_id,
+        ranked.c.metric,
+        db.func.count().label('weeks'),
+        db.func.max(ranked.c.updated_at).label('last_updated'),
+        data.label('data'),
+    ]).group_by(ranked.c.company_id, ranked.c.metric)
+
+    for company_id, metric, weeks, last_updated, values in \
+            db.session.execute(statement).fetchall():
+        if company_id not in companies:
+            # company created after the list of ids was read
+            continue
+        companies[company_id][metric] = {
+            'weeks': weeks,
+            'last_updated': last_updated,
+            'data': values or [],
+        }
 
-    for metric in KPI:
-        kpi_query = KPI[metric].query.filter_by(company_id=company_id)
-        total_weeks = kpi_query.count()
-        values = kpi_query.order_by(KPI[metric].week).all()
-        last_updated = KPI[metric].get_last_updated(company_id).updated_at \
-            if KPI[metric].get_last_updated(company_id) else default_time
+    return companies
+
+
+def recent_values(company_ids: List[int] = None, points: int = 12,
+                  metrics: List[str] = None) -> Any:
+    """Build one statement yielding a row per company (of every company,
+    or of the given ones): its id, then for each of the given metrics (or
+    all of them) the values of its last N weeks, latest first, or NULL
+    when the company has no data for the metric.
+
+    Each array is an ARRAY(subquery) walking the (company_id, week)
+    index backwards, so the series come back ordered and nothing is
+    sorted, numbered or grouped around them
+    """
+    companies = Company.__table__
+    storage = MetricPoint if \
+        current_app.config.get('METRIC_STORAGE') == 'points' else None
+
+    columns = [companies.c.id]
+    for metric in metrics or KPI:
+        Model = storage or KPI[metric]
+        conditions = [Model.company_id == companies.c.id]
+        if Model is MetricPoint:
+            conditions.append(MetricPoint.metric == metric)
+        recent = db.select([Model.value]).where(db.and_(*conditions))\
+            .order_by(Model.week.desc()).limit(points).as_scalar()
+        columns.append(db.case([(
+            # only companies with data for the metric are looked up
+            companies.c.tracked_metrics.op('&')(KPI[metric].tracked_bit())
+            != 0,
+            db.func.array(recent)
+        )]).label(metric))
+
+    statement = db.select(columns)
+    if company_ids is not None:
+        statement = statement.where(companies.c.id.in_(company_ids))
+    return statement
+
+
+def get_latest_kpi(company_ids: List[int] = None, points: int = 12,
+                   metrics: List[str] = None) -> Dict[int, Dict[str, Any]]:
+    """Return the latest value, week-over-week delta and last N points of
+    each metric (or of the given ones) of every company (or of the given
+    ones), keyed by company id then metric, for the metrics they have
+    data for. Every company is read as a single row holding one array
+    per metric, so only the grid itself crosses the wire
+    """
+    metrics = metrics or list(KPI)
+    # the delta needs the week before the latest one
+    statement = recent_values(company_ids, max(points, 2), metrics)
+
+    companies: Dict[int, Dict[str, Any]] = {}
+    for row in db.session.execute(statement).fetchall():
+        for metric, values in zip(metrics, row[1:]):
+            if not values:
+                continue
+            companies.setdefault(row[0], {})[metric] = {
+                'latest': values[0],
+                'delta': values[0] - values[1] if len(values) > 1 else None,
+                'spark': values[:points][::-1],
+            }
+
+    return companies
+
+
+def get_kpi_overview(company_ids: List[int] = None, points: int = 12,
+                     metrics: List[str] = None) -> Dict[int, Dict[str, Any]]:
+    """Return the name of every company (or of the given ones) with the
+    latest value, week-over-week delta and last N points of each metric
+    (or of the given ones) it has data for, see get_latest_kpi
+    """
+    query = Company.query.with_entities(Company.id, Company.name)
+    if company_ids is not None:
+        query = query.filter(Company.id.in_(company_ids))
+    companies: Dict[int, Dict[str, Any]] = {
+        company.id: {'name': company.name, 'metrics': {}}
+        for company in query
+    }
 
-        metric_field[metric] = {
-            'weeks': total_weeks,
-            'last_updated': last_updated,
-            'data': list(map(
-                lambda value: value.value,
-                values
-            ))
+    for company_id, latest in \
+            get_latest_kpi(company_ids, points, metrics).items():
+        if company_id not in companies:
+            # company created after the list of companies was read
+            continue
+        companies[company_id]['metrics'] = latest
+
+    return companies
+
+
+def screen_companies(predicates: List[Predicate],
+                     company_ids: List[int] = None) -> List[Dict[str, Any]]:
+    """Return the companies (of every company, or of the given ones)
+    satisfying every predicate, with the value each predicate was
+    evaluated on. Only the last weeks the predicates look at are read,
+    and the whole screen runs as a single statement: companies missing
+    a value a predicate needs do not match
+    """
+    metrics = list(dict.fromkeys(predicate.metric for predicate in predicates))
+    points = max(predicate.weeks for predicate in predicates) + 1
+    rows = recent_metric_rows(company_ids, points, metrics)\
+        .alias('metric_rows')
+
+    def value_at(metric: str, recency: int) -> Any:
+        return db.func.max(db.case([(
+            db.and_(rows.c.metric == metric, rows.c.recency == recency),
+            rows.c.value
+        )]))
+
+    measures = []
+    for predicate in predicates:
+        latest = value_at(predicate.metric, 1)
+        if predicate.measure == 'latest':
+            measures.append(latest)
+            continue
+        past = value_at(predicate.metric, predicate.weeks + 1)
+        if predicate.measure == 'delta':
+            measures.append(latest - past)
+        else:
+            measures.append(
+                (latest - past) / db.func.nullif(db.func.abs(past), 0))
+
+    screen = db.select(
+        [rows.c.company_id] + [
+            measure.label(f'measure_{i}')
+            for i, measure in enumerate(measures)
+        ]
+    ).group_by(rows.c.company_id).having(db.and_(*[
+        SCREEN_OPERATORS[predicate.op](measure, predicate.value)
+        for predicate, measure in zip(predicates, measures)
+    ])).alias('screen')
+
+    companies = Company.__table__
+    statement = db.select([companies.c.id, companies.c.name, screen]).\
+        select_from(companies.join(
+            screen, screen.c.company_id == companies.c.id)).\
+        order_by(companies.c.id)
+
+    return [
+        {
+            'id': row[0],
+            'name': row[1],
+            'values': {
+                predicate.name: row[3 + i]
+                for i, predicate in enumerate(predicates)
+            },
         }
+        for row in db.session.execute(statement).fetchall()
+    ]
+
 
-    return metric_field
+def get_kpi_for_company(company_id: int, since_week: int = None,
+                        until_week: int = None, last: int = None,
+                        metrics: List[str] = None) -> Dict[str, Any]:
+    """Return the series of the metrics of a company,
+    see get_kpi_for_companies
+    """
+    return get_kpi_for_companies(
+        [company_id], since_week, until_week, last, metrics)[company_id]
 
 
 @kpi.route('/metrics', methods=['GET'])
 @protected_route
 def get_metrics_list(resp: int = None) -> Tuple[object, int]:
-    if not User.query.get(resp):
+    if not queries.get(User, resp):
         return jsonify({
             'status': 'failure',
             'message': 'user not authorized to this view'
@@ -63,10 +629,144 @@ def get_metrics_list(resp: int = None) -> Tuple[object, int]:
     return jsonify(response_obj), 200
 
 
+@kpi.route('/metrics/cache', methods=['GET'])
+@protected_route
+def get_cache_stats(resp: int = None) -> Tuple[object, int]:
+    user = queries.get(User, resp)
+    if not user.staff:
+        return jsonify({
+            'status': 'failure',
+            'message': 'non-staff members not allowed'
+        }), 401
+
+    return jsonify(kpi_cache.stats()), 200
+
+
+@kpi.route('/companies/metrics', methods=['GET'])
+@protected_route
+def get_portfolio_metrics(resp: int = None) -> Tuple[object, int]:
+    """GET the metrics of every company, or of the companies listed
+    in ?ids=1,2,3, in a fixed number of queries
+    """
+    # parameters are validated before any database work
+    try:
+        window = week_window(request.args)
+        company_ids = company_id_list(request.args)
+        metrics = metric_list(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    user = queries.get(User, resp)
+    if not user.staff:
+        return jsonify({
+            'status': 'failure',
+            'message': 'non-staff members not allowed'
+        }), 401
+
+    missing = missing_companies(company_ids)
+    if missing:
+        return jsonify({
+            'status': 'failure',
+            'message': 'company not found',
+            'ids': missing
+        }), 404
+
+    companies = get_kpi_for_companies(
+        company_ids, metrics=metrics, **window)
+
+    return jsonify({
+        'total': len(companies),
+        'companies': companies
+    }), 200
+
+
+@kpi.route('/companies/metrics/overview', methods=['GET'])
+@protected_route
+def get_portfolio_overview(resp: int = None) -> Tuple[object, int]:
+    """GET the latest value, week-over-week delta and the last 12
+    (or ?last=N) points of each metric of every company
+    """
+    # parameters are validated before any database work
+    try:
+        window = week_window(request.args)
+        company_ids = company_id_list(request.args)
+        metrics = metric_list(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    user = queries.get(User, resp)
+    if not user.staff:
+        return jsonify({
+            'status': 'failure',
+            'message': 'non-staff members not allowed'
+        }), 401
+
+    missing = missing_companies(company_ids)
+    if missing:
+        return jsonify({
+            'status': 'failure',
+            'message': 'company not found',
+            'ids': missing
+        }), 404
+
+    companies = get_kpi_overview(
+        company_ids, window.get('last', 12), metrics)
+
+    return jsonify({
+        'total': len(companies),
+        'companies': companies
+    }), 200
+
+
+@kpi.route('/companies/metrics/screen', methods=['GET'])
+@protected_route
+def get_portfolio_screen(resp: int = None) -> Tuple[object, int]:
+    """GET the companies whose metrics satisfy every predicate of
+    ?where=mrr.growth:4>0.1,cpa.delta:4<0
+    """
+    # parameters are validated before any database work
+    try:
+        predicates = screen_predicates(request.args)
+        company_ids = company_id_list(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    user = queries.get(User, resp)
+    if not user.staff:
+        return jsonify({
+            'status': 'failure',
+            'message': 'non-staff members not allowed'
+        }), 401
+
+    missing = missing_companies(company_ids)
+    if missing:
+        return jsonify({
+            'status': 'failure',
+            'message': 'company not found',
+            'ids': missing
+        }), 404
+
+    companies = screen_companies(predicates, company_ids)
+
+    return jsonify({
+        'total': len(companies),
+        'companies': companies
+    }), 200
+
+
 @kpi.route('/companies/<int:company_id>', methods=['POST'])
 @protected_route
 def post_company(company_id: int, resp: int = None) -> Tuple[object, int]:
-    user = User.query.get(resp)
+    user = queries.get(User, resp)
     if not user.staff \
         and (not user.founder_info
              or user.founder_info.company_id != company_id):
@@ -81,6 +781,20 @@ def post_company(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'empty metrics'
         }), 400
 
+    if not isinstance(request.json, dict):
+        return jsonify({
+            'status': 'failure',
+            'message': 'metrics must be an object'
+        }), 400
+
+    # the whole submission is checked before anything is written
+    unknown = [metric for metric in request.json if metric not in KPI]
+    if unknown:
+        return jsonify({
+            'status': 'failure',
+            'message': f'unknown metrics: {", ".join(unknown)}'
+        }), 400
+
     for metric in request.json:
         if request.json[metric] == '':
             return jsonify({
@@ -88,7 +802,35 @@ def post_company(company_id: int, resp: int = None) -> Tuple[object, int]:
                 'message': 'one of the metrics is empty'
             }), 400
 
-    company = Company.query.get(company_id)
+    try:
+        values = {
+            KPI[metric]: metric_value(request.json[metric])
+            for metric in request.json
+        }
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    try:
+        week = submission_week(request.args)
+        key = idempotency_key(request.headers)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    # a retry is answered from the key store without writing anything
+    fingerprint = None
+    if key is not None:
+        fingerprint = submission_fingerprint(request.json, week)
+        submission = IdempotencyKey.find(company_id, key)
+        if submission is not None:
+            return replay_submission(submission, fingerprint)
+
+    company = queries.get(Company, company_id)
 
     if not company:
         return jsonify({
@@ -96,27 +838,81 @@ def post_company(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'company not found'
         }), 404
 
-    response_data: Dict[str, Any] = {
-        'metrics_added': {}
-    }
+    if current_app.config.get('METRIC_WRITES') == 'queue':
+        return queue_submission(company_id, values, week, key, fingerprint)
+
+    try:
+        weeks = BaseMetric.save_all(
+            company_id, values, week=week, key=key, fingerprint=fingerprint)
+    except DuplicateSubmission as e:
+        # a concurrent retry got there first
+        return replay_submission(e.submission, fingerprint)
+    except WeekAhead as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    kpi_cache.invalidate(company_id)
+
+    return jsonify(submission_response(request.json, weeks)), 201
 
-    for metric in request.json:
-        KPI[metric](
-            company_id=company_id,
-            value=request.json[metric]
-        ).save()
-        response_data['metrics_added'][metric] = request.json[metric]
 
-    response_data['status'] = 'success'
-    response_data['message'] = 'metrics added'
+@kpi.route('/companies/<int:company_id>/submissions/<submission_id>',
+           methods=['GET'])
+@protected_route
+def get_submission(company_id: int, submission_id: str,
+                   resp: int = None) -> Tuple[object, int]:
+    """Status of a submission queued by POST /companies/<id>: queued,
+    written (with the weeks it was written at) or failed
+    """
+    user = queries.get(User, resp)
+    if not user.staff \
+        and (not user.founder_info
+             or user.founder_info.company_id != company_id):
+        return jsonify({
+            'status': 'failure',
+            'message': 'user not authorized to this view'
+        }), 401
 
-    return jsonify(response_data), 201
+    submission = MetricSubmission.find(company_id, submission_id)
+    if submission is not None:
+        state: Dict[str, Any] = {
+            'id': submission.id,
+            'state': submission.state,
+        }
+        if submission.weeks is not None:
+            state['weeks'] = json.loads(submission.weeks)
+        if submission.message is not None:
+            state['message'] = submission.message
+    elif metric_writer.queued(submission_id):
+        state = {'id': submission_id, 'state': 'queued'}
+    else:
+        return jsonify({
+            'status': 'failure',
+            'message': 'submission not found'
+        }), 404
+
+    return jsonify({
+        'status': 'success',
+        'submission': state,
+    }), 200
 
 
 @kpi.route('/companies/<int:company_id>/metrics', methods=['GET'])
 @protected_route
 def get_metrics(company_id: int, resp: int = None) -> Tuple[object, int]:
-    user = User.query.get(resp)
+    # parameters are validated before any database work
+    try:
+        window = week_window(request.args)
+        metrics = metric_list(request.args)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    user = queries.get(User, resp)
     if not user.staff \
         and (not user.founder_info
              or user.founder_info.company_id != company_id):
@@ -125,14 +921,20 @@ def get_metrics(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'user not authorized to this view'
         }), 401
 
-    company = Company.query.get(company_id)
-    if not company:
+    # the version read first also proves that the company exists
+    version = Company.kpi_version_of(company_id)
+    if version is None:
         return jsonify({
             'status': 'failure',
             'message': 'company not found'
         }), 404
 
-    response_obj = get_kpi_for_company(company_id)
+    variant = kpi_variant(window, metrics)
+    response_obj = kpi_cache.get(company_id, variant, version)
+    if response_obj is None:
+        response_obj = get_kpi_for_company(
+            company_id, metrics=metrics, **window)
+        kpi_cache.set(company_id, response_obj, variant, version)
 
     return jsonify(response_obj), 200
 
@@ -140,7 +942,7 @@ def get_metrics(company_id: int, resp: int = None) -> Tuple[object, int]:
 @kpi.route('/companies/<int:company_id>/metrics', methods=['PUT'])
 @protected_route
 def put_metric(company_id: int, resp: int = None) -> Tuple[object, int]:
-    user = User.query.get(resp)
+    user = queries.get(User, resp)
     if not user.staff \
         and (not user.founder_info
              or user.founder_info.company_id != company_id):
@@ -149,7 +951,15 @@ def put_metric(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'user not authorized to this view'
         }), 401
 
-    company = Company.query.get(company_id)
+    try:
+        corrections = metric_corrections(request.json)
+    except ValueError as e:
+        return jsonify({
+            'status': 'failure',
+            'message': str(e)
+        }), 400
+
+    company = queries.get(Company, company_id)
 
     if not company:
         return jsonify({
@@ -157,19 +967,31 @@ def put_metric(company_id: int, resp: int = None) -> Tuple[object, int]:
             'message': 'company not found'
         }), 404
 
-    for metric in request.json:
-        # if there is no data in the database
-        if KPI[metric].query.count() == 0:
-            return jsonify({
-                'status': 'failure',
-                'message': 'there is no data to update'
-            }), 400
+    matched = BaseMetric.correct_all(company_id, corrections)
+    if not matched:
+        return jsonify({
+            'status': 'failure',
+            'message': 'there is no data to update'
+        }), 400
 
-    for metric in request.json:
-        KPI[metric].get_last_updated(company_id).value = request.json[metric]
-        db.session.commit()
+    # corrections of the last week are reported under the week they hit
+    updated: Dict[str, List[int]] = {}
+    unmatched: Dict[str, List[Any]] = {}
+    for Metric, values in corrections.items():
+        metric = Metric.__tablename__
+        weeks = matched.get(metric, {})
+        for week in values:
+            if week in weeks:
+                updated.setdefault(metric, []).append(weeks[week])
+            else:
+                unmatched.setdefault(metric, []).append(
+                    'latest' if week is None else week)
+
+    kpi_cache.invalidate(company_id)
 
     return jsonify({
         'status': 'success',
-        'message': 'resource updated'
+        'message': 'resource updated',
+        'updated': updated,
+        'unmatched': unmatched,
     }), 200
@@ -0,0 +1,91 @@
+# server/app/cache.py
+
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class KPICache(object):
+    """Bounded LRU cache with a TTL for per-company KPI responses.
+
+    Entries are keyed by company id plus an optional variant (e.g. the
+    query parameters of the request), so that every cached response of a
+    company can be dropped at once when one of its metrics is written.
+    The cache lives in the worker process, so entries also carry the
+    version of the company's KPIs they were built from (a counter every
+    write bumps in the database): an entry read with another version is
+    a miss, whichever worker handled the write.
+    """
+
+    def __init__(self, app=None) -> None:
+        self.maxsize = 1024
+        self.ttl = 60
+        self._lock = threading.Lock()
+        self._entries: Dict[
+            Tuple[int, Hashable], Tuple[float, Optional[int], Any]] = \
+            OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.maxsize = app.config.get('KPI_CACHE_SIZE', self.maxsize)
+        self.ttl = app.config.get('KPI_CACHE_TTL', self.ttl)
+        self.clear()
+
+    def get(self, company_id: int, variant: Hashable = None,
+            version: int = None) -> Any:
+        """Return the cached value or None on a miss"""
+        key = (company_id, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic() \
+                    or entry[1] != version:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, company_id: int, value: Any, variant: Hashable = None,
+            version: int = None):
+        """Cache a value built from the given version of the company's
+        KPIs, read before the value was
+        """
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._entries[(company_id, variant)] = \
+                (time.monotonic() + self.ttl, version, value)
+            self._entries.move_to_end((company_id, variant))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, company_id: int) -> None:
+        """Drop every cached response of a company"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == company_id]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,251 @@
+# server/app/importer.py
+
+import io
+import csv
+import math
+import contextlib
+from flask import current_app
+from typing import Any, Dict, IO, Iterable, Iterator, List, Set, Tuple
+from sqlalchemy.dialects.postgresql import insert
+
+from app import db
+from app.models import METRICS, Company, MetricPoint, MetricWeek
+
+# rows validated, and sent to the staging table, at a time
+BATCH_SIZE = 10000
+# problems reported before giving up on a file
+MAX_ERRORS = 20
+
+# Every imported data point goes through this temporary table first, so
+# the metric tables are merged into with a few set-based statements
+staging = db.Table(
+    'metric_import', db.MetaData(),
+    db.Column('company_id', db.Integer, nullable=False),
+    db.Column('metric', db.String(64), nullable=False),
+    db.Column('week', db.Integer, nullable=False),
+    db.Column('value', db.Float, nullable=False),
+    db.Index('ix_metric_import', 'company_id', 'metric', 'week'),
+    prefixes=['TEMPORARY'],
+)
+
+Row = Tuple[int, str, int, float]
+
+
+def read_records(file: IO[str]) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """Read (line number, record) pairs of a CSV or TSV file with a
+    header of company (name) or company_id, metric, week and value
+    """
+    header = file.readline()
+    delimiter = '\t' if '\t' in header else ','
+    columns = [column.strip() for column in header.split(delimiter)]
+    missing = {'metric', 'week', 'value'} - set(columns)
+    if not ({'company', 'company_id'} & set(columns)):
+        missing.add('company')
+    if missing:
+        raise ValueError(f'missing columns: {", ".join(sorted(missing))}')
+
+    reader = csv.DictReader(file, fieldnames=columns, delimiter=delimiter)
+    for line, record in enumerate(reader, start=2):
+        yield line, record
+
+
+def batches(records: Iterable[Any], size: int = BATCH_SIZE) \
+        -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for record in records:
+        batch.append(record)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def company_ids(batch: List[Tuple[int, Dict[str, str]]]) -> Dict[str, int]:
+    """Map the company names and ids of a batch to the ids of the
+    companies that exist, with one query
+    """
+    names: Set[str] = set()
+    ids: Set[int] = set()
+    for line, record in batch:
+        if record.get('company_id'):
+            try:
+                ids.add(int(record['company_id']))
+            except ValueError:
+                pass
+        elif record.get('company'):
+            names.add(record['company'].strip())
+    if not names and not ids:
+        return {}
+
+    companies: Dict[str, int] = {}
+    for row in db.session.query(Company.id, Company.name).filter(db.or_(
+            Company.id.in_(ids or [-1]), Company.name.in_(names or ['']))):
+        companies[str(row.id)] = companies[row.name] = row.id
+    return companies
+
+
+def validate(batch: List[Tuple[int, Dict[str, str]]],
+             seen: Set[Tuple[int, str, int]]) \
+        -> Tuple[List[Row], List[str]]:
+    """Return the rows of a batch that are valid and the problems of
+    the others. seen holds the data points already read from the file
+    """
+    companies = company_ids(batch)
+    rows: List[Row] = []
+    errors: List[str] = []
+    for line, record in batch:
+        company = (record.get('company_id') or record.get('company') or '')
+        company = company.strip()
+        metric = (record.get('metric') or '').strip()
+        if company not in companies:
+            errors.append(f'line {line}: unknown company {company!r}')
+            continue
+        if metric not in METRICS:
+            errors.append(f'line {line}: unknown metric {metric!r}')
+            continue
+        try:
+            week = int(record.get('week') or '')
+            value = float(record.get('value') or '')
+        except ValueError:
+            errors.append(f'line {line}: week and value must be numbers')
+            continue
+        if not math.isfinite(value):
+            errors.append(f'line {line}: value must be finite')
+            continue
+        if week < 0:
+            errors.append(f'line {line}: week must not be negative')
+            continue
+
+        key = (companies[company], metric, week)
+        if key in seen:
+            errors.append(f'line {line}: {metric} week {week} of '
+                          f'{company!r} is given twice')
+            continue
+        seen.add(key)
+        rows.append(key + (value,))
+    return rows, errors
+
+
+@contextlib.contextmanager
+def staging_table() -> Iterator[None]:
+    """Create the staging table for the current transaction"""
+    connection = db.session.connection()
+    staging.create(bind=connection)
+    yield
+    staging.drop(bind=connection)
+
+
+def stage(rows: List[Row]) -> None:
+    """Load rows into the staging table: with COPY on PostgreSQL, with
+    an executemany INSERT elsewhere
+    """
+    connection = db.session.connection()
+    if connection.dialect.name == 'postgresql':
+        buffer = io.StringIO()
+        for company_id, metric, week, value in rows:
+            buffer.write(f'{company_id}\t{metric}\t{week}\t{value!r}\n')
+        buffer.seek(0)
+        cursor = connection.connection.cursor()
+        cursor.copy_expert(
+            'COPY metric_import (company_id, metric, week, value) '
+            'FROM STDIN', buffer)
+    else:
+        connection.execute(staging.insert(), [
+            {'company_id': company_id, 'metric': metric,
+             'week': week, 'value': value}
+            for company_id, metric, week, value in rows
+        ])
+
+
+def merge(metrics: Set[str]) -> None:
+    """Update the data points that already exist with the staged values
+    and insert the others
+    """
+    if current_app.config.get('METRIC_STORAGE') == 'points':
+        targets = [(MetricPoint.__table__, None)]
+    else:
+        targets = [(METRICS[metric].__table__, metric) for metric in metrics]
+
+    postgresql = db.session.connection().dialect.name == 'postgresql'
+    if postgresql:
+        # temporary tables are never analyzed on their own
+        db.session.execute('ANALYZE metric_import')
+
+    for table, metric in targets:
+        columns = [staging.c.company_id, staging.c.week, staging.c.value]
+        names = ['company_id', 'week', 'value']
+        if metric is None:
+            columns.insert(1, staging.c.metric)
+            names.insert(1, 'metric')
+            new = db.select(columns)
+            keys = ['company_id', 'metric', 'week']
+        else:
+            new = db.select(columns).where(staging.c.metric == metric)
+            keys = ['company_id', 'week']
+
+        if postgresql:
+            # the unique (company_id, week) indexes are the merge keys
+            upsert = insert(table).from_select(names, new)
+            db.session.execute(upsert.on_conflict_do_update(
+                index_elements=keys,
+                set_={
+                    'value': upsert.excluded.value,
+                    'updated_at': db.func.current_timestamp(),
+                }
+            ))
+            continue
+
+        staged = db.and_(*[staging.c[key] == table.c[key] for key in keys]) \
+            if metric is None else db.and_(
+                staging.c.metric == metric,
+                *[staging.c[key] == table.c[key] for key in keys])
+        db.session.execute(table.update().where(
+            db.exists().where(staged)
+        ).values(
+            value=db.select([staging.c.value]).where(staged).as_scalar(),
+            updated_at=db.func.current_timestamp(),
+        ))
+        db.session.execute(table.insert().from_select(
+            names, new.where(~db.exists().where(staged))))
+
+
+def import_metrics(file: IO[str]) -> Dict[str, int]:
+    """Import the data points of a CSV or TSV file in a single
+    transaction: existing weeks get the new value, missing weeks are
+    added. Nothing is imported when any row is invalid.
+    Return the number of data points, companies and metrics imported
+    """
+    seen: Set[Tuple[int, str, int]] = set()
+    errors: List[str] = []
+    try:
+        with staging_table():
+            for batch in batches(read_records(file)):
+                rows, problems = validate(batch, seen)
+                errors.extend(problems)
+                if len(errors) >= MAX_ERRORS:
+                    break
+                if not errors:
+                    stage(rows)
+            if errors:
+                raise ValueError('\n'.join(errors[:MAX_ERRORS]))
+
+            metrics = {metric for company_id, metric, week in seen}
+            merge(metrics)
+        # the counters are locked before the company rows, in the order
+        # of BaseMetric.save_all, so that both cannot deadlock
+        MetricWeek.sync()
+        Company.refresh_tracked_metrics()
+        if seen:
+            Company.metrics_changed(
+                sorted({company_id for company_id, _, _ in seen}))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return {
+        'data_points': len(seen),
+        'companies': len({company_id for company_id, _, _ in seen}),
+        'metrics': len(metrics),
+    }
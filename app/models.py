@@ -3,12 +3,42 @@
 import os
 import abc
 import jwt
+import json
+import math
 import datetime
-from app import db, bcrypt
+from app import db, bcrypt, directory_index, queries
 from flask import current_app
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import event, DDL
+from sqlalchemy.dialects.postgresql import TSVECTOR, insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declared_attr
 
 
+# Position of every metric in Company.tracked_metrics. The positions are
+# stored in the database: new metrics go at the end of the list.
+TRACKED_METRICS = [
+    'active_users', 'automation_percents', 'conversion_rate', 'cpa',
+    'engagement', 'marketing_spent', 'mrr', 'other_1', 'other_2',
+    'paying_users', 'pilots', 'preorders', 'product_releases', 'sales',
+    'subscribers', 'traffic',
+]
+
+# times a data point is written again after its week was already taken
+WEEK_RETRIES = 3
+
+
+def metric_value(value: Any) -> float:
+    """Check a data point value sent as JSON: a finite number, booleans
+    and strings excluded
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError('metric values must be numbers')
+    if not math.isfinite(value):
+        raise ValueError('metric values must be finite numbers')
+    return float(value)
+
+
 class Company(db.Model):
 
     __tablename__ = 'companies'
@@ -16,8 +46,27 @@ class Company(db.Model):
     name = db.Column(db.String(255), nullable=False, unique=True)
     website = db.Column(db.String(255), nullable=False, unique=True)
     bio = db.Column(db.Text)
+    # one bit per metric of TRACKED_METRICS the company has data for,
+    # set by BaseMetric.save, so reads can skip the empty metric tables
+    tracked_metrics = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # bumped by every write to the company's metrics, in the writing
+    # transaction, so that cached KPI responses of every worker go stale
+    kpi_version = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # kept up to date by a trigger on PostgreSQL (see below), never
+    # selected unless it is asked for
+    search_vector = db.deferred(
+        db.Column(TSVECTOR().with_variant(db.Text(), 'sqlite')))
+
+    __table_args__ = (
+        db.Index(
+            'ix_companies_search_vector', 'search_vector',
+            postgresql_using='gin'
+        ),
+    )
 
-    founders = db.relationship('Founder', backref='company', lazy='dynamic')
+    founders = db.relationship('Founder', backref='company')
     sales = db.relationship('Sale', backref='company', lazy='dynamic')
     traffic = db.relationship('Traffic', backref='company', lazy='dynamic')
     active_users = db.relationship('ActiveUser', backref='company', lazy='dynamic')
@@ -42,12 +91,139 @@ class Company(db.Model):
         db.session.add(self)
         db.session.commit()
 
+    @staticmethod
+    def track_metric(company_id: int, bits: int) -> None:
+        """Flag one or more metrics as having data and bump the KPI
+        version of the company, in the current transaction. Done in SQL
+        so that concurrent writers cannot lose a bit or a version
+        """
+        companies = Company.__table__
+        db.session.execute(
+            companies.update().where(companies.c.id == company_id).values(
+                tracked_metrics=companies.c.tracked_metrics.op('|')(bits),
+                kpi_version=companies.c.kpi_version + 1,
+            )
+        )
+
+    @staticmethod
+    def metrics_changed(company_ids: List[int]) -> None:
+        """Bump the KPI version of some companies in the current
+        transaction, for writes that do not go through track_metric
+        """
+        companies = Company.__table__
+        db.session.execute(
+            companies.update().where(companies.c.id.in_(company_ids))
+            .values(kpi_version=companies.c.kpi_version + 1)
+        )
+
+    @staticmethod
+    def kpi_version_of(company_id: int) -> Optional[int]:
+        """Return the KPI version of a company, None when it does not
+        exist
+        """
+        return db.session.query(Company.kpi_version)\
+            .filter(Company.id == company_id).scalar()
+
+    @staticmethod
+    def refresh_tracked_metrics() -> None:
+        """Recompute tracked_metrics of every company from the data,
+        for writes that went around BaseMetric.save (bulk loads)
+        """
+        companies = Company.__table__
+        bits = []
+        for Metric in BaseMetric.__subclasses__():
+            series = Metric.storage().__table__
+            condition = series.c.company_id == companies.c.id
+            if Metric.storage() is MetricPoint:
+                condition = db.and_(
+                    condition, series.c.metric == Metric.__tablename__)
+            bits.append(db.case(
+                [(db.exists().where(condition), Metric.tracked_bit())],
+                else_=0
+            ))
+        tracked = bits[0]
+        for bit in bits[1:]:
+            tracked = tracked.op('|')(bit)
+        db.session.execute(companies.update().values(tracked_metrics=tracked))
+
+
+# Full-text search over name, website and bio. PostgreSQL fills
+# search_vector from a trigger, weighting the name above the website
+# and the website above the bio; the website is split on punctuation so
+# that 'demo' matches 'http://www.demo.com'. SQLite keeps an external
+# content FTS5 table in sync with triggers instead.
+company_search_ddl = {
+    'postgresql': [
+        """
+        CREATE OR REPLACE FUNCTION companies_search_vector_update()
+        RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english',
+                    coalesce(NEW.name, '')), 'A') ||
+                setweight(to_tsvector('english', regexp_replace(
+                    coalesce(NEW.website, ''), '[^[:alnum:]]+', ' ', 'g')),
+                    'B') ||
+                setweight(to_tsvector('english',
+                    coalesce(NEW.bio, '')), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+        """,
+        """
+        CREATE TRIGGER companies_search_vector_update
+        BEFORE INSERT OR UPDATE OF name, website, bio ON companies
+        FOR EACH ROW EXECUTE PROCEDURE companies_search_vector_update()
+        """,
+    ],
+    'sqlite': [
+        """
+        CREATE VIRTUAL TABLE companies_fts USING fts5(
+            name, website, bio, content='companies', content_rowid='id')
+        """,
+        """
+        CREATE TRIGGER companies_fts_insert AFTER INSERT ON companies BEGIN
+            INSERT INTO companies_fts (rowid, name, website, bio)
+            VALUES (new.id, new.name, new.website, new.bio);
+        END
+        """,
+        """
+        CREATE TRIGGER companies_fts_delete AFTER DELETE ON companies BEGIN
+            INSERT INTO companies_fts
+                (companies_fts, rowid, name, website, bio)
+            VALUES ('delete', old.id, old.name, old.website, old.bio);
+        END
+        """,
+        """
+        CREATE TRIGGER companies_fts_update AFTER UPDATE ON companies BEGIN
+            INSERT INTO companies_fts
+                (companies_fts, rowid, name, website, bio)
+            VALUES ('delete', old.id, old.name, old.website, old.bio);
+            INSERT INTO companies_fts (rowid, name, website, bio)
+            VALUES (new.id, new.name, new.website, new.bio);
+        END
+        """,
+    ],
+}
+
+for dialect, statements in company_search_ddl.items():
+    for statement in statements:
+        event.listen(
+            Company.__table__, 'after_create',
+            DDL(statement).execute_if(dialect=dialect)
+        )
+event.listen(
+    Company.__table__, 'after_drop',
+    DDL('DROP TABLE IF EXISTS companies_fts').execute_if(dialect='sqlite')
+)
+
 
 class Founder(db.Model):
 
     __tablename__ = 'founders'
     id = db.Column(db.Integer, primary_key=True)
-    company_id = db.Column(db.Integer, db.ForeignKey('companies.id'))
+    company_id = db.Column(
+        db.Integer, db.ForeignKey('companies.id'), index=True)
     name = db.Column(db.String(255))
     email = db.Column(
         db.String(255),
@@ -74,10 +250,10 @@ class User(db.Model):
     __tablename__ = 'users'
     id = db.Column(db.Integer, primary_key=True)
     founder_id = db.Column(
-        db.Integer, db.ForeignKey('founders.id')
+        db.Integer, db.ForeignKey('founders.id'), index=True
     )
     name = db.Column(db.String(255))
-    email = db.Column(db.String(255), nullable=False)
+    email = db.Column(db.String(255), nullable=False, index=True)
     password = db.Column(db.String(255), nullable=False)
     registered_on = db.Column(
         db.DateTime, nullable=False, default=db.func.current_timestamp())
@@ -126,6 +302,35 @@ class User(db.Model):
             return "Invalid token. Please log in again"
 
 
+# Typeahead lookups over founder and user names and emails go through
+# trigram GIN indexes when the pg_trgm extension can be installed, and
+# through the in-memory directory_index otherwise.
+def trigrams_available(ddl, target, bind, **kw) -> bool:
+    return bind.dialect.name == 'postgresql' and bind.execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).scalar() is not None
+
+
+for table in (Founder.__table__, User.__table__):
+    event.listen(
+        table, 'before_create',
+        DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        .execute_if(callable_=trigrams_available)
+    )
+    for column in ('name', 'email'):
+        event.listen(
+            table, 'after_create',
+            DDL(f'CREATE INDEX ix_{table.name}_{column}_trgm ON {table.name} '
+                f'USING gin ({column} gin_trgm_ops)')
+            .execute_if(callable_=trigrams_available)
+        )
+
+for model in (Founder, User):
+    for change in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(
+            model, change, lambda *args: directory_index.invalidate())
+
+
 class BaseMetric(db.Model):
 
     __abstract__ = True
@@ -135,6 +340,22 @@ class BaseMetric(db.Model):
     def company_id(cls):
         return db.Column(db.Integer, db.ForeignKey('companies.id'))
 
+    @declared_attr
+    def __table_args__(cls):
+        # every hot query filters on company_id and orders by either
+        # week (series) or updated_at (last updated); a week is only
+        # ever issued once per company
+        return (
+            db.Index(
+                f'ix_{cls.__tablename__}_company_id_week',
+                'company_id', 'week', unique=True
+            ),
+            db.Index(
+                f'ix_{cls.__tablename__}_company_id_updated_at',
+                'company_id', db.text('updated_at DESC')
+            ),
+        )
+
     id = db.Column(db.Integer, primary_key=True)
     value = db.Column(db.Float, nullable=False)
     week = db.Column(db.Integer, nullable=False)
@@ -144,19 +365,316 @@ class BaseMetric(db.Model):
         onupdate=db.func.current_timestamp()
     )
 
+    @classmethod
+    def storage(cls) -> object:
+        """Return the model the data points of this metric are stored in:
+        the metric's own table, or the shared metric_points table when
+        METRIC_STORAGE is set to 'points'
+        """
+        if current_app.config.get('METRIC_STORAGE') == 'points':
+            return MetricPoint
+        return cls
+
+    @classmethod
+    def series_criteria(cls, company_id: int = None) -> Dict[str, Any]:
+        """Return the filter_by criteria of the data points of this metric"""
+        criteria: Dict[str, Any] = {}
+        if cls.storage() is MetricPoint:
+            criteria['metric'] = cls.__tablename__
+        if company_id is not None:
+            criteria['company_id'] = company_id
+        return criteria
+
+    @classmethod
+    def series(cls, company_id: int = None) -> object:
+        """Return a query over the data points of this metric"""
+        return cls.storage().query.filter_by(
+            **cls.series_criteria(company_id))
+
+    @classmethod
+    def tracked_bit(cls) -> int:
+        """Return the bit of this metric in Company.tracked_metrics"""
+        return 1 << TRACKED_METRICS.index(cls.__tablename__)
+
     def save(self):
-        last = self.__class__.query.filter_by(company_id=self.company_id)\
-            .order_by(self.__class__.week.desc()).first()
-        self.week = last.week + 1 if last else 0
+        Model = self.storage()
+
+        def add(weeks: Dict[str, int]) -> None:
+            self.week = weeks[self.__tablename__]
+            if Model is MetricPoint:
+                db.session.add(MetricPoint(
+                    company_id=self.company_id,
+                    metric=self.__tablename__,
+                    week=self.week,
+                    value=self.value
+                ))
+            else:
+                db.session.add(self)
+
+        BaseMetric.record(self.company_id, [type(self)], add)
 
-        db.session.add(self)
-        db.session.commit()
+    @staticmethod
+    def save_all(company_id: int, values: Dict[Any, float],
+                 week: int = None, key: str = None,
+                 fingerprint: str = None,
+                 commit: bool = True) -> Dict[str, int]:
+        """Add the next data point of several metrics of a company in one
+        transaction: one statement for the weeks, one INSERT per table and
+        a single commit. Nothing is written when any of it fails. Return
+        the week of every data point.
+
+        Given a week, every data point is written at that week instead,
+        replacing the values already there; WeekAhead is raised when the
+        week is past the next week of one of the metrics. Given an
+        idempotency key, the submission is recorded under it in the same
+        transaction, and DuplicateSubmission is raised when the key is
+        already taken.
+
+        Without commit, the data points are written in a savepoint of the
+        current transaction, which is left for the caller to commit
+        """
+        points = current_app.config.get('METRIC_STORAGE') == 'points'
+
+        def write(weeks: Dict[str, int]) -> None:
+            if key is not None:
+                IdempotencyKey.claim(company_id, key, fingerprint, weeks)
+
+            rows = []
+            for Metric, value in values.items():
+                row = {
+                    'company_id': company_id,
+                    'week': weeks[Metric.__tablename__],
+                    'value': value,
+                }
+                if points:
+                    row['metric'] = Metric.__tablename__
+                rows.append((Metric.storage().__table__, row))
+
+            if week is not None:
+                for table, row in rows:
+                    BaseMetric.upsert(table, row)
+            elif points:
+                db.session.execute(
+                    MetricPoint.__table__.insert(), [row for _, row in rows])
+            else:
+                for table, row in rows:
+                    db.session.execute(table.insert(), row)
+
+        if week is None:
+            return BaseMetric.record(company_id, list(values), write, commit)
+
+        weeks = {Metric.__tablename__: week for Metric in values}
+        transaction = db.session if commit else db.session.begin_nested()
+        try:
+            # a week may replace a data point or follow the last one, but
+            # not leave a gap in the series
+            next_weeks = MetricWeek.next_weeks(company_id, list(weeks))
+            ahead = {
+                metric: next_week for metric, next_week in next_weeks.items()
+                if week > next_week
+            }
+            if ahead:
+                raise WeekAhead(week, ahead)
+            write(weeks)
+            tracked = 0
+            for Metric in values:
+                tracked |= Metric.tracked_bit()
+            Company.track_metric(company_id, tracked)
+            # the counters move past a week written ahead of them
+            MetricWeek.sync(company_id)
+            transaction.commit()
+        except Exception:
+            transaction.rollback()
+            raise
+        return weeks
+
+    @staticmethod
+    def upsert(table: Any, row: Dict[str, Any]) -> None:
+        """Insert a data point, or set the value of the one already at
+        its week
+        """
+        keys = [key for key in ('company_id', 'metric', 'week') if key in row]
+        if db.engine.dialect.name == 'postgresql':
+            statement = insert(table).values(**row)
+            db.session.execute(statement.on_conflict_do_update(
+                index_elements=keys,
+                set_={
+                    'value': statement.excluded.value,
+                    'updated_at': db.func.current_timestamp(),
+                }
+            ))
+            return
+
+        updated = db.session.execute(table.update().where(db.and_(*[
+            table.c[key] == row[key] for key in keys
+        ])).values(
+            value=row['value'], updated_at=db.func.current_timestamp()))
+        if not updated.rowcount:
+            db.session.execute(table.insert(), row)
+
+    @staticmethod
+    def record(company_id: int, Metrics: List[Any],
+               write: Callable[[Dict[str, int]], None],
+               commit: bool = True) -> Dict[str, int]:
+        """Take the next week of some metrics of a company from their
+        counters, write the data points with them and commit, or release
+        the savepoint they were written in.
+
+        The unique (company_id, week) indexes turn a week taken twice
+        into an IntegrityError; this happens when rows were written
+        around the counters, which are then resynchronised from the data
+        before trying again
+        """
+        for attempt in range(WEEK_RETRIES):
+            transaction = db.session if commit else db.session.begin_nested()
+            try:
+                weeks = MetricWeek.issue(
+                    company_id, [Metric.__tablename__ for Metric in Metrics])
+                write(weeks)
+                tracked = 0
+                for Metric in Metrics:
+                    tracked |= Metric.tracked_bit()
+                Company.track_metric(company_id, tracked)
+                transaction.commit()
+                return weeks
+            except IntegrityError:
+                transaction.rollback()
+                if attempt == WEEK_RETRIES - 1:
+                    raise
+                MetricWeek.sync(company_id)
+                if commit:
+                    db.session.commit()
+            except Exception:
+                transaction.rollback()
+                raise
+
+    @staticmethod
+    def last_weeks(company_id: int = None) -> Any:
+        """Select the last week of every metric of every company with
+        data, or of a single company
+        """
+        if current_app.config.get('METRIC_STORAGE') == 'points':
+            last = db.select([
+                MetricPoint.company_id,
+                MetricPoint.metric,
+                db.func.max(MetricPoint.week).label('week'),
+            ]).group_by(MetricPoint.company_id, MetricPoint.metric)
+            if company_id is not None:
+                last = last.where(MetricPoint.company_id == company_id)
+            return last
+
+        selects = []
+        for Metric in BaseMetric.__subclasses__():
+            if company_id is None:
+                select = db.select([
+                    Metric.company_id,
+                    db.literal(Metric.__tablename__).label('metric'),
+                    db.func.max(Metric.week).label('week'),
+                ]).group_by(Metric.company_id)
+            else:
+                # without GROUP BY the max is read off the end of the
+                # (company_id, week) index; no data gives a NULL week
+                select = db.select([
+                    db.literal(company_id).label('company_id'),
+                    db.literal(Metric.__tablename__).label('metric'),
+                    db.func.max(Metric.week).label('week'),
+                ]).where(Metric.company_id == company_id)
+            selects.append(select)
+        return db.union_all(*selects)
+
+    @staticmethod
+    def correct_all(company_id: int,
+                    corrections: Dict[Any, Dict[Optional[int], float]]) \
+            -> Dict[str, Dict[Optional[int], int]]:
+        """Set the values of existing data points of a company, given as
+        {Metric: {week: value}} where a None week stands for the last
+        one, in one transaction: one query finds the data points, one
+        UPDATE per table sets them. Return the week every correction was
+        applied to, by metric, leaving out those without a data point
+        """
+        points = current_app.config.get('METRIC_STORAGE') == 'points'
+        selects = []
+        for Metric, values in corrections.items():
+            table = MetricPoint if points else Metric
+            criteria = [table.company_id == company_id]
+            if points:
+                criteria.append(MetricPoint.metric == Metric.__tablename__)
+            name = db.literal(Metric.__tablename__).label('metric')
+
+            weeks = [week for week in values if week is not None]
+            if weeks:
+                selects.append(db.select([
+                    name, table.week, table.week.label('requested'),
+                ]).where(db.and_(table.week.in_(weeks), *criteria)))
+            if None in values:
+                # weeks are never negative: -1 marks the last week
+                selects.append(db.select([
+                    name,
+                    db.func.max(table.week).label('week'),
+                    db.literal(-1).label('requested'),
+                ]).where(db.and_(*criteria)))
+
+        matched: Dict[str, Dict[Optional[int], int]] = {}
+        for row in db.session.execute(db.union_all(*selects)):
+            if row.week is not None:
+                requested = None if row.requested == -1 else row.requested
+                matched.setdefault(row.metric, {})[requested] = row.week
+
+        # {metric: {week: value}}, a correction of the given week winning
+        # over one of the last week
+        updates: Dict[str, Dict[int, float]] = {}
+        for Metric, values in corrections.items():
+            weeks = matched.get(Metric.__tablename__, {})
+            for requested in sorted(weeks, key=lambda week: week is not None):
+                updates.setdefault(Metric.__tablename__, {})[
+                    weeks[requested]] = values[requested]
+
+        try:
+            if points:
+                table = MetricPoint.__table__
+                if updates:
+                    db.session.execute(table.update().where(db.and_(
+                        table.c.company_id == company_id,
+                        db.or_(*[
+                            db.and_(table.c.metric == metric,
+                                    table.c.week.in_(list(values)))
+                            for metric, values in updates.items()
+                        ]),
+                    )).values(
+                        value=db.case([
+                            (db.and_(table.c.metric == metric,
+                                     table.c.week == week), value)
+                            for metric, values in updates.items()
+                            for week, value in values.items()
+                        ]),
+                        updated_at=db.func.current_timestamp(),
+                    ))
+            else:
+                Metrics = {
+                    Metric.__tablename__: Metric for Metric in corrections
+                }
+                for metric, values in updates.items():
+                    table = Metrics[metric].__table__
+                    db.session.execute(table.update().where(db.and_(
+                        table.c.company_id == company_id,
+                        table.c.week.in_(list(values)),
+                    )).values(
+                        value=db.case(values, value=table.c.week),
+                        updated_at=db.func.current_timestamp(),
+                    ))
+            if updates:
+                Company.metrics_changed([company_id])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return matched
 
     @classmethod
     def get_last_updated(cls, company_id: int) -> object:
         """Return a data point that is last updated/created"""
-        return cls.query.filter_by(company_id=company_id)\
-            .order_by(cls.updated_at.desc()).first()
+        return queries.first_by(
+            cls.storage(), '-updated_at', **cls.series_criteria(company_id))
 
     @abc.abstractclassmethod
     def get_custom_name(cls) -> str:
@@ -164,6 +682,306 @@ class BaseMetric(db.Model):
         ...
 
 
+class MetricPoint(db.Model):
+    """Long-format storage holding the data points of every metric,
+    used instead of the per-metric tables when METRIC_STORAGE is 'points'
+    """
+
+    __tablename__ = 'metric_points'
+    __table_args__ = (
+        db.Index(
+            'ix_metric_points_company_id_metric_updated_at',
+            'company_id', 'metric', db.text('updated_at DESC')
+        ),
+    )
+
+    company_id = db.Column(
+        db.Integer, db.ForeignKey('companies.id'), primary_key=True)
+    metric = db.Column(db.String(64), primary_key=True)
+    week = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.Float, nullable=False)
+    updated_at = db.Column(
+        db.DateTime, nullable=False,
+        default=db.func.current_timestamp(),
+        onupdate=db.func.current_timestamp()
+    )
+
+    def __repr__(self):
+        return f'<{self.metric} of company {self.company_id}, ' \
+            f'week {self.week}: {self.value}>'
+
+    @staticmethod
+    def copy_storage(storage: str) -> int:
+        """Replace the data points of a storage mode ('tables' or
+        'points') with a copy of the other one, then reset the week
+        counters, tracked_metrics and KPI versions from the copy, in a
+        single transaction. Return the number of data points copied
+        """
+        points = MetricPoint.__table__
+        copied = 0
+        try:
+            if storage == 'points':
+                db.session.execute(points.delete())
+            for Metric in BaseMetric.__subclasses__():
+                table = Metric.__table__
+                metric = db.literal(Metric.__tablename__)
+                if storage == 'points':
+                    result = db.session.execute(points.insert().from_select(
+                        ['company_id', 'metric', 'week', 'value',
+                         'updated_at'],
+                        db.select([
+                            table.c.company_id, metric, table.c.week,
+                            table.c.value, table.c.updated_at,
+                        ]).where(table.c.company_id.isnot(None))
+                    ))
+                else:
+                    db.session.execute(table.delete())
+                    result = db.session.execute(table.insert().from_select(
+                        ['company_id', 'week', 'value', 'updated_at'],
+                        db.select([
+                            points.c.company_id, points.c.week,
+                            points.c.value, points.c.updated_at,
+                        ]).where(points.c.metric == metric)
+                    ))
+                copied += result.rowcount
+
+            # both storages now hold the same data points; the counters
+            # are locked before the company rows, as in save_all
+            MetricWeek.sync()
+            Company.refresh_tracked_metrics()
+            Company.metrics_changed(
+                [company_id for company_id, in db.session.query(Company.id)])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return copied
+
+
+class MetricWeek(db.Model):
+    """Counter of the next week number of every metric of every company.
+
+    Taking a week increments the counter row in the writing transaction,
+    so concurrent submissions for a company queue on the row instead of
+    reading the same last week, and a rolled back submission gives its
+    week back.
+    """
+
+    __tablename__ = 'metric_weeks'
+
+    company_id = db.Column(
+        db.Integer, db.ForeignKey('companies.id'), primary_key=True)
+    metric = db.Column(db.String(64), primary_key=True)
+    next_week = db.Column(db.Integer, nullable=False)
+
+    @staticmethod
+    def issue(company_id: int, metrics: List[str]) -> Dict[str, int]:
+        """Take the next week of some metrics of a company, in the
+        current transaction. A metric without a counter starts at week 0
+        """
+        # rows are always locked in the same order
+        metrics = sorted(metrics)
+        weeks = MetricWeek.__table__
+        if db.engine.dialect.name == 'postgresql':
+            upsert = insert(weeks).values([
+                {'company_id': company_id, 'metric': metric, 'next_week': 1}
+                for metric in metrics
+            ])
+            rows = db.session.execute(upsert.on_conflict_do_update(
+                index_elements=[weeks.c.company_id, weeks.c.metric],
+                set_={'next_week': weeks.c.next_week + 1}
+            ).returning(weeks.c.metric, weeks.c.next_week))
+            return {row.metric: row.next_week - 1 for row in rows}
+
+        # elsewhere the UPDATE takes the write lock first; a counter
+        # created concurrently fails on the primary key and is retried
+        criteria = db.and_(
+            weeks.c.company_id == company_id, weeks.c.metric.in_(metrics))
+        db.session.execute(weeks.update().where(criteria).values(
+            next_week=weeks.c.next_week + 1))
+        issued = {
+            row.metric: row.next_week - 1
+            for row in db.session.execute(
+                db.select([weeks.c.metric, weeks.c.next_week]).where(criteria))
+        }
+        missing = [metric for metric in metrics if metric not in issued]
+        if missing:
+            db.session.execute(weeks.insert(), [
+                {'company_id': company_id, 'metric': metric, 'next_week': 1}
+                for metric in missing
+            ])
+            issued.update((metric, 0) for metric in missing)
+        return issued
+
+    @staticmethod
+    def next_weeks(company_id: int, metrics: List[str]) -> Dict[str, int]:
+        """Read the next week of some metrics of a company, locking their
+        counters until the end of the transaction
+        """
+        next_weeks = {metric: 0 for metric in metrics}
+        rows = db.session.query(MetricWeek.metric, MetricWeek.next_week)\
+            .filter(MetricWeek.company_id == company_id,
+                    MetricWeek.metric.in_(sorted(metrics)))\
+            .with_for_update()
+        next_weeks.update(rows)
+        return next_weeks
+
+    @staticmethod
+    def sync(company_id: int = None) -> None:
+        """Reset the counters of every company, or of a single one, from
+        the data, for writes that went around BaseMetric.save (bulk loads)
+        """
+        weeks = MetricWeek.__table__
+        delete = weeks.delete()
+        if company_id is not None:
+            delete = delete.where(weeks.c.company_id == company_id)
+        db.session.execute(delete)
+
+        last = BaseMetric.last_weeks(company_id).alias('last')
+        db.session.execute(weeks.insert().from_select(
+            ['company_id', 'metric', 'next_week'],
+            db.select([
+                last.c.company_id, last.c.metric, last.c.week + 1
+            ]).where(db.and_(
+                last.c.company_id.isnot(None), last.c.week.isnot(None)))
+        ))
+
+
+class DuplicateSubmission(Exception):
+    """A submission was already recorded under its idempotency key"""
+
+    def __init__(self, submission: 'IdempotencyKey') -> None:
+        super().__init__(submission.key)
+        self.submission = submission
+
+
+class WeekAhead(Exception):
+    """A data point was given a week past the next week of its metric,
+    which would leave a gap in the series
+    """
+
+    def __init__(self, week: int, next_weeks: Dict[str, int]) -> None:
+        super().__init__(f'week {week} is past the next week of ' + ', '.join(
+            f'{metric} ({next_week})'
+            for metric, next_week in sorted(next_weeks.items())))
+        self.week = week
+        self.next_weeks = next_weeks
+
+
+class IdempotencyKey(db.Model):
+    """Metric submissions recorded under the Idempotency-Key their client
+    sent, so that a retried submission is answered without writing it
+    again. Keys expire after IDEMPOTENCY_KEY_TTL seconds
+    """
+
+    __tablename__ = 'idempotency_keys'
+
+    company_id = db.Column(
+        db.Integer, db.ForeignKey('companies.id'), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    # sha256 of the submission, to tell a retry from a reused key
+    fingerprint = db.Column(db.String(64), nullable=False)
+    # {metric: week} the submission was written at, as JSON
+    weeks = db.Column(db.Text, nullable=False)
+    created_at = db.Column(
+        db.DateTime, nullable=False, index=True,
+        default=db.func.current_timestamp()
+    )
+
+    @staticmethod
+    def expiry() -> datetime.datetime:
+        """Return the creation time before which keys have expired"""
+        return datetime.datetime.now() - datetime.timedelta(
+            seconds=current_app.config.get('IDEMPOTENCY_KEY_TTL', 86400))
+
+    @staticmethod
+    def find(company_id: int, key: str) -> 'IdempotencyKey':
+        """Return the submission recorded under a key, if not expired"""
+        return IdempotencyKey.query.filter(
+            IdempotencyKey.company_id == company_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.created_at >= IdempotencyKey.expiry(),
+        ).first()
+
+    @staticmethod
+    def claim(company_id: int, key: str, fingerprint: str,
+              weeks: Dict[str, int]) -> None:
+        """Record a submission under a key in the current transaction,
+        dropping the expired keys on the way. Raise DuplicateSubmission
+        when the key is taken; a concurrent submission under the same key
+        is waited for
+        """
+        keys = IdempotencyKey.__table__
+        expiry = IdempotencyKey.expiry()
+        db.session.execute(keys.delete().where(keys.c.created_at < expiry))
+
+        row = {
+            'company_id': company_id,
+            'key': key,
+            'fingerprint': fingerprint,
+            'weeks': json.dumps(weeks, sort_keys=True),
+            'created_at': datetime.datetime.now(),
+        }
+        if db.engine.dialect.name == 'postgresql':
+            claimed = db.session.execute(
+                insert(keys).values(**row).on_conflict_do_nothing()
+            ).rowcount
+        else:
+            claimed = IdempotencyKey.find(company_id, key) is None
+            if claimed:
+                db.session.execute(keys.insert(), row)
+        if not claimed:
+            raise DuplicateSubmission(IdempotencyKey.find(company_id, key))
+
+
+class MetricSubmission(db.Model):
+    """Outcome of a metric submission written behind its request, kept
+    SUBMISSION_TTL seconds for its status to be asked for
+    """
+
+    __tablename__ = 'metric_submissions'
+
+    id = db.Column(db.String(32), primary_key=True)
+    company_id = db.Column(
+        db.Integer, db.ForeignKey('companies.id'), nullable=False)
+    # 'written' or 'failed'
+    state = db.Column(db.String(16), nullable=False)
+    # {metric: week} the submission was written at, as JSON
+    weeks = db.Column(db.Text)
+    message = db.Column(db.Text)
+    created_at = db.Column(
+        db.DateTime, nullable=False, index=True,
+        default=db.func.current_timestamp()
+    )
+
+    @staticmethod
+    def find(company_id: int, submission_id: str) -> 'MetricSubmission':
+        return MetricSubmission.query.filter_by(
+            id=submission_id, company_id=company_id).first()
+
+    @staticmethod
+    def record_all(outcomes: List[Dict[str, Any]]) -> None:
+        """Record the outcome of several submissions in the current
+        transaction, dropping the expired ones on the way
+        """
+        submissions = MetricSubmission.__table__
+        expiry = datetime.datetime.now() - datetime.timedelta(
+            seconds=current_app.config.get('SUBMISSION_TTL', 86400))
+        db.session.execute(
+            submissions.delete().where(submissions.c.created_at < expiry))
+
+        now = datetime.datetime.now()
+        db.session.execute(submissions.insert(), [{
+            'id': outcome['id'],
+            'company_id': outcome['company_id'],
+            'state': outcome['state'],
+            'weeks': json.dumps(outcome['weeks'], sort_keys=True)
+            if outcome.get('weeks') is not None else None,
+            'message': outcome.get('message'),
+            'created_at': now,
+        } for outcome in outcomes])
+
+
 class Sale(BaseMetric):
 
     __tablename__ = 'sales'
@@ -306,3 +1124,9 @@ class Other2(BaseMetric):
     @classmethod
     def get_custom_name(cls) -> str:
         return 'Other metric 2'
+
+
+# every metric model by table name
+METRICS: Dict[str, Any] = {
+    Metric.__tablename__: Metric for Metric in BaseMetric.__subclasses__()
+}
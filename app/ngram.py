@@ -0,0 +1,126 @@
+# server/app/ngram.py
+
+import re
+import heapq
+import math
+import time
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Set, Tuple
+
+# same default as pg_trgm.word_similarity_threshold
+SIMILARITY_THRESHOLD = 0.6
+
+
+def trigrams(text: str) -> Set[str]:
+    """Split a text into trigrams the way pg_trgm does: every word is
+    lowercased and padded with two spaces in front and one behind, so
+    that the start of a word has trigrams of its own
+    """
+    grams: Set[str] = set()
+    for word in re.findall(r'[^\W_]+', (text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(query: Set[str], text: Set[str]) -> float:
+    """Share of the query's trigrams found in the text"""
+    return len(query & text) / len(query) if query else 0.0
+
+
+class NgramIndex(object):
+    """In-memory trigram index over a few text fields of some records,
+    used for typeahead lookups where pg_trgm is not available.
+
+    The records are loaded lazily on the first lookup and again once the
+    index has been invalidated or its TTL has expired. Like the KPI
+    cache it lives in the worker process, so writes handled by another
+    worker only show up here once the TTL expires.
+    """
+
+    def __init__(self, fields: Iterable[str] = ('name', 'email'),
+                 app=None) -> None:
+        self.fields = tuple(fields)
+        self.ttl = 60
+        self._lock = threading.Lock()
+        self._records: List[Dict[str, Any]] = None
+        # lowercased text and trigrams of every field of every record
+        self._fields: List[Tuple[Tuple[str, Set[str]], ...]] = []
+        self._postings: Dict[str, Set[int]] = {}
+        self._expires = 0.0
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app) -> None:
+        self.ttl = app.config.get('DIRECTORY_INDEX_TTL', self.ttl)
+        self.invalidate()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._records = None
+
+    def build(self, records: List[Dict[str, Any]]) -> None:
+        fields = [
+            tuple(
+                ((record.get(field) or '').lower(),
+                 trigrams(record.get(field)))
+                for field in self.fields
+            )
+            for record in records
+        ]
+        postings: Dict[str, Set[int]] = defaultdict(set)
+        for position, record_fields in enumerate(fields):
+            for text, grams in record_fields:
+                for gram in grams:
+                    postings[gram].add(position)
+
+        with self._lock:
+            self._records = records
+            self._fields = fields
+            self._postings = dict(postings)
+            self._expires = time.monotonic() + self.ttl
+
+    def search(self, query: str, load: Callable[[], List[Dict[str, Any]]],
+               limit: int = 10) -> List[Dict[str, Any]]:
+        """Return the records with a field starting with the query, then
+        those with a field similar enough to it, best match first. Every
+        record carries its score
+        """
+        if self._records is None or self._expires < time.monotonic():
+            self.build(load())
+
+        query = query.lower()
+        query_grams = trigrams(query)
+        with self._lock:
+            records, fields = self._records, self._fields
+            shared: Counter = Counter()
+            for gram in query_grams:
+                shared.update(self._postings.get(gram, ()))
+
+        # A similar field shares at least `required` of the query's
+        # trigrams and a prefix misses at most its last one, so records
+        # sharing fewer over all their fields are not scored at all
+        required = min(
+            math.ceil(SIMILARITY_THRESHOLD * len(query_grams)),
+            len(query_grams) - 1) or 1
+        candidates = [
+            position for position, count in shared.items()
+            if count >= required
+        ]
+
+        matches = []
+        for position in candidates:
+            prefix, score = False, 0.0
+            for text, grams in fields[position]:
+                prefix = prefix or text.startswith(query)
+                score = max(score, word_similarity(query_grams, grams))
+            if prefix or score >= SIMILARITY_THRESHOLD:
+                matches.append((not prefix, -score, position))
+
+        # positions follow the order records were loaded in
+        return [
+            dict(records[position], score=round(-score, 4))
+            for not_prefix, score, position in heapq.nsmallest(limit, matches)
+        ]
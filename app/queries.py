@@ -0,0 +1,40 @@
+# server/app/queries.py
+
+from sqlalchemy import bindparam
+from sqlalchemy.ext import baked
+from typing import Any
+
+from app import db
+
+# Registry of the hot statements: every handler loads the user, most
+# load the company and every metric write looks up the last data point.
+# Baked queries build each statement once per shape (model, criteria,
+# order) and keep its compiled form, so later calls only bind the values.
+bakery = baked.bakery(size=200)
+
+
+def get(Model: Any, ident: Any) -> Any:
+    """Model.query.get(ident), looking in the identity map first"""
+    query = bakery(lambda session: session.query(Model), Model)
+    return query(db.session()).get(ident)
+
+
+def first_by(Model: Any, order_by: str = None, **criteria: Any) -> Any:
+    """Model.query.filter_by(**criteria).order_by(order_by).first(),
+    where order_by is a column name, prefixed by '-' to sort it
+    descending
+    """
+    query = bakery(lambda session: session.query(Model), Model)
+    for name in sorted(criteria):
+        # the criteria are applied later on: name is bound now
+        query.add_criteria(
+            lambda q, name=name:
+                q.filter(getattr(Model, name) == bindparam(name)),
+            Model, name)
+    if order_by:
+        column = getattr(Model, order_by.lstrip('-'))
+        query.add_criteria(
+            lambda q: q.order_by(
+                column.desc() if order_by.startswith('-') else column),
+            Model, order_by)
+    return query(db.session()).params(**criteria).first()
@@ -0,0 +1,216 @@
+# server/app/writer.py
+
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+from flask import current_app
+from typing import Any, Dict, List, NamedTuple, Optional
+from sqlalchemy.exc import SQLAlchemyError
+
+from app import db, kpi_cache
+from app.models import (
+    BaseMetric,
+    DuplicateSubmission,
+    MetricSubmission,
+    WeekAhead,
+)
+
+# seconds spent writing the queued submissions when the worker exits
+SHUTDOWN_TIMEOUT = 30
+
+
+class QueueFull(Exception):
+    """The write-behind queue already holds METRIC_QUEUE_SIZE submissions"""
+
+
+class Submission(NamedTuple):
+    """A metric submission waiting to be written"""
+    id: str
+    company_id: int
+    values: Dict[Any, float]
+    week: Optional[int]
+    key: Optional[str]
+    fingerprint: Optional[str]
+
+
+def submission_id() -> str:
+    """Return a new submission id, which starts with the time it was
+    issued at, in milliseconds
+    """
+    return '%012x%s' % (int(time.time() * 1000), uuid.uuid4().hex[:20])
+
+
+def submitted_at(submission_id: str) -> Optional[float]:
+    """Return the time a submission id was issued at, None when the id
+    was not issued by submission_id
+    """
+    if len(submission_id) != 32:
+        return None
+    try:
+        int(submission_id, 16)
+    except ValueError:
+        return None
+    return int(submission_id[:12], 16) / 1000
+
+
+def save(submission: Submission) -> Dict[str, Any]:
+    """Write a submission in a savepoint of the current transaction and
+    return its outcome; a failed submission leaves the others alone
+    """
+    outcome: Dict[str, Any] = {
+        'id': submission.id,
+        'company_id': submission.company_id,
+    }
+    try:
+        weeks = BaseMetric.save_all(
+            submission.company_id, submission.values, week=submission.week,
+            key=submission.key, fingerprint=submission.fingerprint,
+            commit=False)
+    except DuplicateSubmission as e:
+        if e.submission.fingerprint != submission.fingerprint:
+            outcome.update({
+                'state': 'failed',
+                'message':
+                    'Idempotency-Key already used for another submission',
+            })
+            return outcome
+        # a retry of a submission already written
+        weeks = json.loads(e.submission.weeks)
+    except WeekAhead as e:
+        outcome.update({'state': 'failed', 'message': str(e)})
+        return outcome
+    except SQLAlchemyError:
+        current_app.logger.exception(
+            'metric submission %s not written', submission.id)
+        outcome.update({
+            'state': 'failed',
+            'message': 'metrics could not be saved',
+        })
+        return outcome
+
+    outcome.update({'state': 'written', 'weeks': weeks})
+    return outcome
+
+
+def write_batch(submissions: List[Submission]) -> None:
+    """Write several submissions and their outcomes in one transaction"""
+    try:
+        outcomes = [save(submission) for submission in submissions]
+        MetricSubmission.record_all(outcomes)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    for company_id in {
+            outcome['company_id'] for outcome in outcomes
+            if outcome['state'] == 'written'}:
+        kpi_cache.invalidate(company_id)
+
+
+class MetricWriter(object):
+    """Write-behind queue of metric submissions.
+
+    Requests put validated submissions on the queue and are answered
+    right away; a background thread takes them off METRIC_QUEUE_BATCH at
+    a time and writes every batch in a single transaction. At most
+    METRIC_QUEUE_SIZE submissions wait or are being written at a time,
+    QueueFull is raised beyond that. The queue lives in the worker
+    process: submissions still queued when it dies are lost, and show
+    as not found once METRIC_QUEUE_TIMEOUT is over.
+    """
+
+    def __init__(self, app=None) -> None:
+        self.maxsize = 1000
+        self.batch_size = 100
+        self.timeout = 300
+        self.app = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._queue: queue.Queue = queue.Queue()
+        self._pending = 0
+        self._thread: Optional[threading.Thread] = None
+
+        if app is not None:
+            self.init_app(app)
+        atexit.register(self.join, SHUTDOWN_TIMEOUT)
+
+    def init_app(self, app) -> None:
+        self.maxsize = app.config.get('METRIC_QUEUE_SIZE', self.maxsize)
+        self.batch_size = app.config.get(
+            'METRIC_QUEUE_BATCH', self.batch_size)
+        self.timeout = app.config.get('METRIC_QUEUE_TIMEOUT', self.timeout)
+        self.app = app
+
+    def submit(self, company_id: int, values: Dict[Any, float],
+               week: int = None, key: str = None,
+               fingerprint: str = None) -> str:
+        """Queue a submission and return its id"""
+        with self._lock:
+            if self._pending >= self.maxsize:
+                raise QueueFull()
+            self._pending += 1
+            # started here rather than at import: threads do not survive
+            # the fork of a worker
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name='metric-writer', daemon=True)
+                self._thread.start()
+
+        submission = Submission(
+            submission_id(), company_id, values, week, key, fingerprint)
+        self._queue.put(submission)
+        return submission.id
+
+    def queued(self, submission_id: str) -> bool:
+        """Whether a submission unknown to the database may still be
+        queued, by this worker or another one
+        """
+        issued = submitted_at(submission_id)
+        return issued is not None and time.time() - issued < self.timeout
+
+    def join(self, timeout: float = None) -> bool:
+        """Wait for every queued submission to be written. Return False
+        when some are still pending after timeout seconds
+        """
+        with self._idle:
+            return self._idle.wait_for(lambda: not self._pending, timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with self.app.app_context():
+                    self._write(batch)
+                    db.session.remove()
+            finally:
+                with self._idle:
+                    self._pending -= len(batch)
+                    self._idle.notify_all()
+
+    def _write(self, batch: List[Submission]) -> None:
+        try:
+            write_batch(batch)
+            return
+        except Exception:
+            if len(batch) == 1:
+                self.app.logger.exception(
+                    'metric submission %s lost', batch[0].id)
+                return
+
+        # the batch failed as a whole: write its submissions one by one,
+        # so that a single bad one only loses itself
+        for submission in batch:
+            self._write([submission])
+
+
+metric_writer = MetricWriter()
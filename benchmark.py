@@ -0,0 +1,295 @@
+# benchmark.py
+
+import time
+import random
+import tracemalloc
+import datetime
+import contextlib
+from typing import Callable, Dict, Iterator, List, Any
+
+from sqlalchemy import event
+from app import db, queries
+from app.apis.kpi import (
+    KPI,
+    get_kpi_for_company,
+    get_kpi_overview,
+    metric_rows,
+    screen_companies,
+    screen_predicates,
+)
+from app.apis.companies import search_companies
+from app.apis.directory import lookup
+from app.models import Company, Founder, MetricWeek, User
+
+
+@contextlib.contextmanager
+def count_queries() -> Iterator[List[str]]:
+    """Record every SQL statement sent to the database"""
+    statements: List[str] = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(fn: Callable[..., Any], *args: Any, runs: int = 50) -> Dict:
+    """Run fn a number of times and report query count, peak memory
+    allocated by a run (KiB) and latency (ms)
+    """
+    with count_queries() as queries:
+        fn(*args)
+    db.session.remove()
+
+    tracemalloc.start()
+    fn(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    db.session.remove()
+
+    samples: List[float] = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+        db.session.remove()
+
+    return {
+        'queries': len(queries),
+        'peak': peak / 1024,
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+    }
+
+
+def seed(companies: int = 20, weeks: int = 52,
+         tracked: int = None) -> List[int]:
+    """Insert synthetic companies, founders, users and a full history
+    for every metric (or for `tracked` random metrics of each company),
+    using bulk inserts
+    """
+    now = datetime.datetime.utcnow()
+    db.session.execute(Company.__table__.insert(), [
+        {
+            'name': f'Benchmark {i}',
+            'website': f'http://benchmark-{i}.example.com',
+            'bio': 'Synthetic company used for benchmarking.',
+        }
+        for i in range(companies)
+    ])
+    company_ids = [
+        company.id for company in Company.query
+        .filter(Company.name.like('Benchmark %')).order_by(Company.id)
+    ]
+
+    db.session.execute(Founder.__table__.insert(), [
+        {
+            'company_id': company_id,
+            'name': f'Founder {n} of {company_id}',
+            'email': f'founder-{n}@benchmark-{company_id}.example.com',
+            'role': 'CEO' if n == 0 else 'CTO',
+        }
+        for company_id in company_ids
+        for n in range(2)
+    ])
+    db.session.execute(db.text("""
+        INSERT INTO users (founder_id, name, email, password,
+                           registered_on, staff)
+        SELECT id, name, email, 'benchmark', now(), false FROM founders
+    """))
+
+    reported = {
+        company_id: random.sample(list(KPI), tracked or len(KPI))
+        for company_id in company_ids
+    }
+    for metric in KPI:
+        rows = [
+            {
+                'company_id': company_id,
+                'week': week,
+                'value': random.randint(0, 1000),
+                'updated_at': now - datetime.timedelta(weeks=weeks - week),
+            }
+            for company_id in company_ids if metric in reported[company_id]
+            for week in range(weeks)
+        ]
+        if rows:
+            db.session.execute(KPI[metric].__table__.insert(), rows)
+    Company.refresh_tracked_metrics()
+    MetricWeek.sync()
+    db.session.commit()
+
+    return company_ids
+
+
+def legacy_get_kpi_for_company(company_id: int) -> Dict[str, Any]:
+    """Per-metric fetch that get_kpi_for_company used to do,
+    kept here as the baseline to compare against
+    """
+    default_time = datetime.datetime.utcnow() - datetime.timedelta(days=10)
+    metric_field = {}
+
+    for metric in KPI:
+        kpi_query = KPI[metric].query.filter_by(company_id=company_id)
+        total_weeks = kpi_query.count()
+        values = kpi_query.order_by(KPI[metric].week).all()
+        last_updated = KPI[metric].get_last_updated(company_id).updated_at \
+            if KPI[metric].get_last_updated(company_id) else default_time
+
+        metric_field[metric] = {
+            'weeks': total_weeks,
+            'last_updated': last_updated,
+            'data': [value.value for value in values]
+        }
+
+    return metric_field
+
+
+def report(name: str, result: Dict) -> None:
+    print(f"{name:<40} {result['queries']:>8} {result['peak']:>10.0f} "
+          f"{result['p50']:>10.2f} {result['p95']:>10.2f}")
+
+
+def run(companies: int = 20, weeks: int = 52, runs: int = 50,
+        tracked: int = None) -> None:
+    company_ids = seed(companies, weeks, tracked)
+    company_id = company_ids[len(company_ids) // 2]
+
+    print(f'{companies} companies, {weeks} weeks of '
+          f'{tracked or "every"} metric{"s" if tracked else ""}\n')
+    print(f"{'benchmark':<40} {'queries':>8} {'peak (KiB)':>10} "
+          f"{'p50 (ms)':>10} {'p95 (ms)':>10}")
+    report('get_kpi_for_company (ORM, per metric)',
+           measure(legacy_get_kpi_for_company, company_id, runs=runs))
+    report('get_kpi_for_company (Core, array rows)',
+           measure(get_kpi_for_company, company_id, runs=runs))
+    report('get_kpi_overview (all companies)',
+           measure(get_kpi_overview, runs=runs))
+    report('screen_companies (two predicates)',
+           measure(screen_companies, screen_predicates(
+               {'where': 'mrr.growth:4>0.1,cpa.delta:4<0'}), runs=runs))
+    report('search_companies (ranked page)',
+           measure(search_companies, ['benchmark', str(company_id)],
+                   runs=runs))
+    report('directory lookup (typeahead)',
+           measure(lookup, f'founder-1@benchmark-{company_id}', runs=runs))
+    hot_queries(company_id, runs=runs)
+
+
+def hot_queries(company_id: int, runs: int = 50) -> None:
+    """Compare the hot statements built by the ORM on every call with
+    their baked counterparts from app.queries
+    """
+    Metric = KPI['sales']
+    user = User.query.filter(User.founder_id.isnot(None)).first()
+    email, user_id = user.email, user.id
+    db.session.remove()
+
+    statements = {
+        'User.query.get': (
+            lambda: User.query.get(user_id),
+            lambda: queries.get(User, user_id)),
+        'Company.query.get': (
+            lambda: Company.query.get(company_id),
+            lambda: queries.get(Company, company_id)),
+        'login email lookup': (
+            lambda: User.query.filter_by(email=email).first(),
+            lambda: queries.first_by(User, email=email)),
+        'last week (BaseMetric.save)': (
+            lambda: Metric.query.filter_by(company_id=company_id)
+            .order_by(Metric.week.desc()).first(),
+            lambda: queries.first_by(
+                Metric, '-week', company_id=company_id)),
+        'last updated (get_last_updated)': (
+            lambda: Metric.query.filter_by(company_id=company_id)
+            .order_by(Metric.updated_at.desc()).first(),
+            lambda: queries.first_by(
+                Metric, '-updated_at', company_id=company_id)),
+    }
+    for name, (orm, baked) in statements.items():
+        report(f'{name} (ORM)', measure(orm, runs=runs))
+        report(f'{name} (baked)', measure(baked, runs=runs))
+
+
+def explain_statements(company_id: int) -> Dict[str, Any]:
+    """The hot statements of the API, keyed by a readable name"""
+    Metric = KPI['sales']
+    founder = Founder.query.filter_by(company_id=company_id).first()
+    return {
+        'next week number (BaseMetric.save)': Metric.query
+        .filter_by(company_id=company_id)
+        .order_by(Metric.week.desc()).limit(1),
+        'last updated (BaseMetric.get_last_updated)': Metric.query
+        .filter_by(company_id=company_id)
+        .order_by(Metric.updated_at.desc()).limit(1),
+        'series (get_kpi_for_company)':
+            db.select([metric_rows([company_id]).alias()]),
+        'founders of a company': Founder.query
+        .filter_by(company_id=company_id),
+        'user of a founder': User.query.filter_by(founder_id=founder.id),
+        'login email lookup': User.query.filter_by(email=founder.email),
+    }
+
+
+def explain_plans(company_id: int) -> Dict[str, str]:
+    plans = {}
+    for name, statement in explain_statements(company_id).items():
+        if hasattr(statement, 'statement'):
+            statement = statement.statement
+        sql = statement.compile(
+            dialect=db.engine.dialect,
+            compile_kwargs={'literal_binds': True}
+        )
+        plans[name] = '\n'.join(
+            row[0] for row in db.session.execute(f'EXPLAIN {sql}'))
+    return plans
+
+
+def index_suite() -> List[Any]:
+    """The indexes that back the hot statements"""
+    tables = [KPI[metric].__table__ for metric in KPI] + \
+        [Founder.__table__, User.__table__]
+    return [index for table in tables for index in table.indexes]
+
+
+def explain(companies: int = 200, weeks: int = 260) -> None:
+    company_ids = seed(companies, weeks)
+    company_id = company_ids[len(company_ids) // 2]
+
+    indexes = index_suite()
+    for index in indexes:
+        index.drop(db.engine)
+    db.session.execute('ANALYZE')
+    db.session.commit()
+    before = explain_plans(company_id)
+
+    for index in indexes:
+        index.create(db.engine)
+    db.session.execute('ANALYZE')
+    db.session.commit()
+    after = explain_plans(company_id)
+
+    print(f'{companies} companies, {weeks} weeks of every metric\n')
+    for name in before:
+        print(f'== {name}')
+        print('-- without indexes')
+        print(before[name])
+        print('-- with indexes')
+        print(after[name])
+        print()
+
+    sequential = [name for name in after if 'Seq Scan' in after[name]]
+    if sequential:
+        print('Sequential scans remaining in:', ', '.join(sequential))
+    else:
+        print('No sequential scans remaining')
@@ -11,6 +11,20 @@ class Config(object):
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
     CORS_HEADERS = 'Content-Type'
     EXP = 3000
+    KPI_CACHE_SIZE = 1024
+    KPI_CACHE_TTL = 60
+    DIRECTORY_INDEX_TTL = 60
+    IDEMPOTENCY_KEY_TTL = 86400
+    # 'tables' keeps one table per metric, 'points' stores every
+    # data point in the shared metric_points table
+    METRIC_STORAGE = os.getenv('METRIC_STORAGE', 'tables')
+    # 'sync' writes a metric submission before answering it, 'queue'
+    # answers 202 and writes it behind the request, batched with others
+    METRIC_WRITES = os.getenv('METRIC_WRITES', 'sync')
+    METRIC_QUEUE_SIZE = 1000
+    METRIC_QUEUE_BATCH = 100
+    METRIC_QUEUE_TIMEOUT = 300
+    SUBMISSION_TTL = 86400
 
 
 class DevelopmentConfig(Config):
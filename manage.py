@@ -4,14 +4,17 @@ import os
 import random
 import coverage
 import unittest
+import benchmark as benchmarks
 
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 from populate import companies, KPI
 from app import db, create_app
+from app.importer import import_metrics
 from app.models import (
     Company,
     Founder,
+    MetricPoint,
     User,
 )
 
@@ -105,6 +108,67 @@ def populate():
     db.session.commit()
 
 
+@manager.command
+def importmetrics(path):
+    """Import the data points of a CSV or TSV file with the columns
+    company (name) or company_id, metric, week and value
+    """
+    try:
+        with open(path, newline='') as file:
+            imported = import_metrics(file)
+    except (OSError, ValueError) as e:
+        print(f'Nothing imported from {path}:')
+        print(e)
+        return 1
+
+    print(f'Imported {imported["data_points"]} data points of '
+          f'{imported["metrics"]} metrics for '
+          f'{imported["companies"]} companies')
+
+
+@manager.command
+def copymetrics(storage):
+    """Copy every data point into the storage mode METRIC_STORAGE is
+    switched to, 'tables' or 'points', and reset the week counters. Run
+    it with the web workers stopped
+    """
+    if storage not in ('tables', 'points'):
+        print("The storage mode is either 'tables' or 'points'")
+        return 1
+
+    copied = MetricPoint.copy_storage(storage)
+    print(f'Copied {copied} data points into the {storage} storage')
+
+
+@manager.command
+def benchmark(companies=20, weeks=52, runs=50, tracked=None):
+    """Reset the db, seed synthetic data and benchmark the read paths,
+    with every company reporting every metric or `tracked` of them
+    """
+    if is_production:
+        print('Refusing to benchmark against the production database')
+        return 1
+
+    db.drop_all()
+    db.create_all()
+    benchmarks.run(int(companies), int(weeks), int(runs),
+                   int(tracked) if tracked else None)
+
+
+@manager.command
+def explain(companies=200, weeks=260):
+    """Reset the db, seed synthetic data and EXPLAIN the hot queries
+    with and without their indexes
+    """
+    if is_production:
+        print('Refusing to reset the production database')
+        return 1
+
+    db.drop_all()
+    db.create_all()
+    benchmarks.explain(int(companies), int(weeks))
+
+
 @manager.command
 def cov():
     """Runs the unit tests with coverage."""
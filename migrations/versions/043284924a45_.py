@@ -0,0 +1,53 @@
+"""long-format metric_points storage
+
+Revision ID: 043284924a45
+Revises: 2df465eeedca
+Create Date: 2026-10-18 09:12:41.530718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '043284924a45'
+down_revision = '2df465eeedca'
+branch_labels = None
+depends_on = None
+
+metric_tables = [
+    'active_users', 'automation_percents', 'conversion_rate', 'cpa',
+    'engagement', 'marketing_spent', 'mrr', 'other_1', 'other_2',
+    'paying_users', 'pilots', 'preorders', 'product_releases', 'sales',
+    'subscribers', 'traffic',
+]
+
+
+def upgrade():
+    op.create_table('metric_points',
+    sa.Column('company_id', sa.Integer(), nullable=False),
+    sa.Column('metric', sa.String(length=64), nullable=False),
+    sa.Column('week', sa.Integer(), nullable=False),
+    sa.Column('value', sa.Float(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+    sa.PrimaryKeyConstraint('company_id', 'metric', 'week')
+    )
+
+    # copy the existing data points; should a week have been written
+    # twice, keep the most recently updated one. Data points written in
+    # the tables afterwards are copied over by manage.py copymetrics
+    for table in metric_tables:
+        op.execute(f"""
+            INSERT INTO metric_points
+                (company_id, metric, week, value, updated_at)
+            SELECT DISTINCT ON (company_id, week)
+                company_id, '{table}', week, value, updated_at
+            FROM {table}
+            WHERE company_id IS NOT NULL
+            ORDER BY company_id, week, updated_at DESC
+        """)
+
+
+def downgrade():
+    op.drop_table('metric_points')
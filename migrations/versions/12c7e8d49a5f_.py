@@ -0,0 +1,55 @@
+"""composite metric indexes and foreign key indexes
+
+Revision ID: 12c7e8d49a5f
+Revises: 043284924a45
+Create Date: 2026-10-18 10:02:17.204481
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '12c7e8d49a5f'
+down_revision = '043284924a45'
+branch_labels = None
+depends_on = None
+
+metric_tables = [
+    'active_users', 'automation_percents', 'conversion_rate', 'cpa',
+    'engagement', 'marketing_spent', 'mrr', 'other_1', 'other_2',
+    'paying_users', 'pilots', 'preorders', 'product_releases', 'sales',
+    'subscribers', 'traffic',
+]
+
+
+def upgrade():
+    for table in metric_tables:
+        op.create_index(
+            f'ix_{table}_company_id_week', table,
+            ['company_id', 'week'], unique=False)
+        op.create_index(
+            f'ix_{table}_company_id_updated_at', table,
+            ['company_id', sa.text('updated_at DESC')], unique=False)
+
+    op.create_index(
+        'ix_metric_points_company_id_metric_updated_at', 'metric_points',
+        ['company_id', 'metric', sa.text('updated_at DESC')], unique=False)
+    op.create_index(
+        'ix_founders_company_id', 'founders', ['company_id'], unique=False)
+    op.create_index(
+        'ix_users_founder_id', 'users', ['founder_id'], unique=False)
+    op.create_index('ix_users_email', 'users', ['email'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_users_email', table_name='users')
+    op.drop_index('ix_users_founder_id', table_name='users')
+    op.drop_index('ix_founders_company_id', table_name='founders')
+    op.drop_index(
+        'ix_metric_points_company_id_metric_updated_at',
+        table_name='metric_points')
+
+    for table in metric_tables:
+        op.drop_index(f'ix_{table}_company_id_updated_at', table_name=table)
+        op.drop_index(f'ix_{table}_company_id_week', table_name=table)
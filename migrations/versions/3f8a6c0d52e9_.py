@@ -0,0 +1,39 @@
+"""idempotency keys of metric submissions
+
+Revision ID: 3f8a6c0d52e9
+Revises: e7b2d94c1f60
+Create Date: 2026-10-18 19:12:47.530186
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8a6c0d52e9'
+down_revision = 'e7b2d94c1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('key', sa.String(length=255), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('weeks', sa.Text(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+        sa.PrimaryKeyConstraint('company_id', 'key')
+    )
+    op.create_index(
+        op.f('ix_idempotency_keys_created_at'), 'idempotency_keys',
+        ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_idempotency_keys_created_at'),
+        table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
@@ -0,0 +1,58 @@
+"""full-text search vector on companies
+
+Revision ID: 5b1e0d7c3a92
+Revises: 12c7e8d49a5f
+Create Date: 2026-10-18 11:40:52.318064
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e0d7c3a92'
+down_revision = '12c7e8d49a5f'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('companies', sa.Column(
+        'search_vector', postgresql.TSVECTOR(), nullable=True))
+    op.create_index(
+        'ix_companies_search_vector', 'companies', ['search_vector'],
+        unique=False, postgresql_using='gin')
+
+    op.execute("""
+        CREATE OR REPLACE FUNCTION companies_search_vector_update()
+        RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector :=
+                setweight(to_tsvector('english',
+                    coalesce(NEW.name, '')), 'A') ||
+                setweight(to_tsvector('english', regexp_replace(
+                    coalesce(NEW.website, ''), '[^[:alnum:]]+', ' ', 'g')),
+                    'B') ||
+                setweight(to_tsvector('english',
+                    coalesce(NEW.bio, '')), 'C');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER companies_search_vector_update
+        BEFORE INSERT OR UPDATE OF name, website, bio ON companies
+        FOR EACH ROW EXECUTE PROCEDURE companies_search_vector_update()
+    """)
+
+    # fill in the existing companies through the trigger
+    op.execute('UPDATE companies SET name = name')
+
+
+def downgrade():
+    op.execute(
+        'DROP TRIGGER companies_search_vector_update ON companies')
+    op.execute('DROP FUNCTION companies_search_vector_update()')
+    op.drop_index('ix_companies_search_vector', table_name='companies')
+    op.drop_column('companies', 'search_vector')
@@ -0,0 +1,40 @@
+"""outcomes of the metric submissions written behind their request
+
+Revision ID: 8d2e5b71a4c3
+Revises: 3f8a6c0d52e9
+Create Date: 2026-10-18 21:04:19.318562
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d2e5b71a4c3'
+down_revision = '3f8a6c0d52e9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'metric_submissions',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('state', sa.String(length=16), nullable=False),
+        sa.Column('weeks', sa.Text(), nullable=True),
+        sa.Column('message', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        op.f('ix_metric_submissions_created_at'), 'metric_submissions',
+        ['created_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index(
+        op.f('ix_metric_submissions_created_at'),
+        table_name='metric_submissions')
+    op.drop_table('metric_submissions')
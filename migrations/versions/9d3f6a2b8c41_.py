@@ -0,0 +1,47 @@
+"""trigram indexes for the founder and user directory
+
+Revision ID: 9d3f6a2b8c41
+Revises: 5b1e0d7c3a92
+Create Date: 2026-10-18 12:31:07.845210
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3f6a2b8c41'
+down_revision = '5b1e0d7c3a92'
+branch_labels = None
+depends_on = None
+
+trigram_indexes = [
+    (table, column)
+    for table in ('founders', 'users')
+    for column in ('name', 'email')
+]
+
+
+def trigrams_available():
+    # without the contrib package the directory falls back to the
+    # in-memory index (see app.models.trigrams_available)
+    return op.get_bind().execute(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+    ).scalar() is not None
+
+
+def upgrade():
+    if not trigrams_available():
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for table, column in trigram_indexes:
+        op.create_index(
+            f'ix_{table}_{column}_trgm', table, [column], unique=False,
+            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+
+
+def downgrade():
+    # the extension is left installed, other database objects may use it
+    # the indexes only exist where pg_trgm was available
+    for table, column in reversed(trigram_indexes):
+        op.execute(f'DROP INDEX IF EXISTS ix_{table}_{column}_trgm')
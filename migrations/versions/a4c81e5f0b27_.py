@@ -0,0 +1,45 @@
+"""tracked metrics bitmask on companies
+
+Revision ID: a4c81e5f0b27
+Revises: 9d3f6a2b8c41
+Create Date: 2026-10-18 14:05:33.617920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c81e5f0b27'
+down_revision = '9d3f6a2b8c41'
+branch_labels = None
+depends_on = None
+
+# positions of the bits, as in app.models.TRACKED_METRICS
+metric_tables = [
+    'active_users', 'automation_percents', 'conversion_rate', 'cpa',
+    'engagement', 'marketing_spent', 'mrr', 'other_1', 'other_2',
+    'paying_users', 'pilots', 'preorders', 'product_releases', 'sales',
+    'subscribers', 'traffic',
+]
+
+
+def upgrade():
+    op.add_column('companies', sa.Column(
+        'tracked_metrics', sa.Integer(), server_default='0', nullable=False))
+
+    # flag the metrics every company already has data for, in either
+    # storage mode
+    bits = ' | '.join(f"""
+        CASE WHEN EXISTS (
+            SELECT 1 FROM {table} WHERE company_id = companies.id
+        ) OR EXISTS (
+            SELECT 1 FROM metric_points
+            WHERE company_id = companies.id AND metric = '{table}'
+        ) THEN {1 << position} ELSE 0 END"""
+        for position, table in enumerate(metric_tables))
+    op.execute(f'UPDATE companies SET tracked_metrics = {bits}')
+
+
+def downgrade():
+    op.drop_column('companies', 'tracked_metrics')
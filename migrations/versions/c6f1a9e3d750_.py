@@ -0,0 +1,25 @@
+"""KPI version of the companies, for the response caches
+
+Revision ID: c6f1a9e3d750
+Revises: 8d2e5b71a4c3
+Create Date: 2026-10-18 23:41:55.082417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c6f1a9e3d750'
+down_revision = '8d2e5b71a4c3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('companies', sa.Column(
+        'kpi_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade():
+    op.drop_column('companies', 'kpi_version')
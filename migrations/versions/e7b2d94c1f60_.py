@@ -0,0 +1,78 @@
+"""per-company week counters and unique weeks
+
+Revision ID: e7b2d94c1f60
+Revises: a4c81e5f0b27
+Create Date: 2026-10-18 16:42:08.204513
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7b2d94c1f60'
+down_revision = 'a4c81e5f0b27'
+branch_labels = None
+depends_on = None
+
+metric_tables = [
+    'active_users', 'automation_percents', 'conversion_rate', 'cpa',
+    'engagement', 'marketing_spent', 'mrr', 'other_1', 'other_2',
+    'paying_users', 'pilots', 'preorders', 'product_releases', 'sales',
+    'subscribers', 'traffic',
+]
+
+
+def upgrade():
+    op.create_table(
+        'metric_weeks',
+        sa.Column('company_id', sa.Integer(), nullable=False),
+        sa.Column('metric', sa.String(length=64), nullable=False),
+        sa.Column('next_week', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['company_id'], ['companies.id'], ),
+        sa.PrimaryKeyConstraint('company_id', 'metric')
+    )
+
+    for table in metric_tables:
+        # concurrent submissions could give two data points the same
+        # week: renumber the series of the companies where it happened,
+        # in insertion order, before the weeks are made unique
+        op.execute(f"""
+            UPDATE {table} SET week = numbered.week
+            FROM (
+                SELECT id, row_number() OVER (
+                    PARTITION BY company_id ORDER BY week, id) - 1 AS week
+                FROM {table}
+                WHERE company_id IN (
+                    SELECT company_id FROM {table}
+                    GROUP BY company_id, week HAVING count(*) > 1)
+            ) AS numbered
+            WHERE {table}.id = numbered.id AND {table}.week <> numbered.week
+        """)
+        op.drop_index(f'ix_{table}_company_id_week', table_name=table)
+        op.create_index(
+            f'ix_{table}_company_id_week', table, ['company_id', 'week'],
+            unique=True)
+
+    # start every counter after the last week of either storage mode
+    last_weeks = ' UNION ALL '.join(
+        f"SELECT company_id, '{table}' AS metric, week FROM {table}"
+        for table in metric_tables)
+    op.execute(f"""
+        INSERT INTO metric_weeks (company_id, metric, next_week)
+        SELECT company_id, metric, max(week) + 1
+        FROM ({last_weeks}
+              UNION ALL SELECT company_id, metric, week FROM metric_points
+        ) AS weeks
+        WHERE company_id IS NOT NULL
+        GROUP BY company_id, metric
+    """)
+
+
+def downgrade():
+    for table in metric_tables:
+        op.drop_index(f'ix_{table}_company_id_week', table_name=table)
+        op.create_index(
+            f'ix_{table}_company_id_week', table, ['company_id', 'week'],
+            unique=False)
+    op.drop_table('metric_weeks')
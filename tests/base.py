@@ -1,9 +1,11 @@
 # server/tests/base.py
 
 import json
+import contextlib
 import app.models
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, Tuple
 from flask_testing import TestCase
+from sqlalchemy import event
 from app import create_app, db
 from tests.sample_data import kpis
 
@@ -45,6 +47,48 @@ class BaseTestClass(TestCase):
 
         return return_obj
 
+    @contextlib.contextmanager
+    def count_queries(self) -> Iterator[List[str]]:
+        """Record every SQL statement sent to the database"""
+        statements: List[str] = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+
+    def post_weeks(self, company_id: int, auth_token: str,
+                   weeks: int) -> None:
+        """POST the sample metrics of weeks 0 to weeks - 1"""
+        for week in range(weeks):
+            self.send_POST(
+                f'/companies/{company_id}',
+                data=self.kpi_for_week(week),
+                headers=self.get_authorized_header(auth_token)
+            )
+
+    def submit(self, company_id: int, data: Dict[str, Any], auth_token: str,
+               key: str = None, week: int = None) -> object:
+        """POST metrics, with an Idempotency-Key and a week when given"""
+        headers = self.get_authorized_header(auth_token)
+        if key is not None:
+            headers['Idempotency-Key'] = key
+        url = f'/companies/{company_id}'
+        if week is not None:
+            url += f'?week={week}'
+        return self.send_POST(url, data=data, headers=headers)
+
+    def series(self, Model: Any, company_id: int) -> List[Tuple[int, float]]:
+        """Return the (week, value) points stored for a company"""
+        return [
+            (point.week, point.value) for point in
+            Model.query.filter_by(company_id=company_id).order_by(Model.week)
+        ]
+
     def get_authorized_header(self, token: str) -> Dict[str, str]:
         return dict(Authorization=f'Bearer {token}')
 
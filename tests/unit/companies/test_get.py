@@ -7,6 +7,7 @@ from tests.sample_data import (
     data2,
     data3
 )
+from app.apis.companies import encode_cursor
 from app.models import Company, Founder
 
 
@@ -117,3 +118,222 @@ class CompanyGETTest(BaseTestClass):
 
             for founder in companies[name]['founders']:
                 self.assertIn('email', founder)
+
+    def test_get_all_companies_query_count_stays_flat(self):
+        auth_token = self.get_auth_token(staff=True)
+
+        counts = []
+        for data in [data1, data2, data3]:
+            self.send_POST(
+                '/companies', data,
+                headers=self.get_authorized_header(auth_token))
+            with self.count_queries() as queries:
+                response = self.client.get(
+                    '/companies',
+                    headers=self.get_authorized_header(auth_token))
+            self.assert200(response)
+            counts.append(len(queries))
+
+        self.assertEqual(counts, [counts[0]] * 3)
+        # user lookup, companies and their founders
+        self.assertEqual(counts[0], 3)
+
+    def get_pages(self, auth_token: str, query: str):
+        limit = query.split('&')[0]
+        pages = []
+        url = f'/companies?{query}'
+        while url:
+            response = self.client.get(
+                url, headers=self.get_authorized_header(auth_token))
+            self.assert200(response)
+            response_ = json.loads(response.data.decode())
+            pages.append(response_)
+            url = f'/companies?{limit}&cursor={response_["next_cursor"]}' \
+                if response_['next_cursor'] else None
+        return pages
+
+    def test_get_companies_by_pages_of_ids(self):
+        auth_token = self.get_auth_token(staff=True)
+        ids = [self.get_id_from_POST(data) for data in [data1, data2, data3]]
+
+        pages = self.get_pages(auth_token, 'limit=2')
+
+        self.assertEqual([page['total'] for page in pages], [2, 1])
+        self.assertEqual(
+            [company['id'] for page in pages
+             for company in sorted(page['companies'].values(),
+                                   key=lambda company: company['id'])],
+            ids)
+        self.assertIsNone(pages[-1]['next_cursor'])
+
+    def test_get_companies_by_pages_of_names(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        pages = self.get_pages(auth_token, 'limit=1&order=name')
+
+        self.assertEqual(
+            [list(page['companies']) for page in pages],
+            [[name] for name in sorted(
+                [data1['name'], data2['name'], data3['name']])]
+        )
+
+    def test_get_companies_without_parameters_is_not_paginated(self):
+        auth_token = self.get_auth_token(staff=True)
+        self.get_id_from_POST(data1)
+        response_ = self.GET_data(
+            '/companies', headers=self.get_authorized_header(auth_token))
+        self.assertNotIn('next_cursor', response_)
+        self.assertEqual(response_['total'], 1)
+
+    def test_get_companies_invalid_page_parameters(self):
+        auth_token = self.get_auth_token(staff=True)
+        tampered = [
+            'cursor=' + encode_cursor(order, after)
+            for order, after in (
+                ('id', 'abc'), ('id', True), ('name', 5),
+                (['id'], 1), ({'id': 1}, 1), ('id', [1]),
+            )
+        ]
+        for query in ['limit=0', 'limit=abc', 'limit=1&order=bio',
+                      'cursor=notacursor'] + tampered:
+            response = self.client.get(
+                f'/companies?{query}',
+                headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
+
+    def test_get_a_company_with_some_fields(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        with self.count_queries() as queries:
+            response_ = self.GET_data(
+                f'/companies/{company_id}?fields=name,website',
+                headers=self.get_authorized_header(auth_token))
+
+        self.assertDictEqual(response_, {
+            'id': company_id,
+            'name': data1['name'],
+            'website': data1['website'],
+        })
+        # user lookup and the company, without its bio or founders
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('companies.bio', queries[-1])
+
+    def test_get_a_company_with_founders_field(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}?fields=founders',
+            headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(set(response_), {'id', 'founders'})
+        self.assertEqual(
+            [founder['email'] for founder in response_['founders']],
+            [founder['email'] for founder in data1['founders']]
+        )
+
+    def test_get_all_companies_with_some_fields(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        with self.count_queries() as queries:
+            response_ = self.GET_data(
+                '/companies?fields=name',
+                headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(response_['total'], 3)
+        for name in response_['companies']:
+            self.assertEqual(set(response_['companies'][name]), {'id'})
+        # user lookup and the companies, without founders
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('companies.bio', queries[-1])
+
+    def test_get_companies_unknown_field(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for url in (f'/companies/{company_id}?fields=name,password',
+                    '/companies?fields=password'):
+            response = self.client.get(
+                url, headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
+            self.assertIn(
+                'unknown fields: password',
+                json.loads(response.data.decode())['message'])
+
+    def test_get_a_company_with_includes(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(3):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token))
+
+        with self.count_queries() as queries:
+            response_ = self.GET_data(
+                f'/companies/{company_id}?fields=name'
+                '&include=founders,metrics,latest',
+                headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(
+            set(response_), {'id', 'name', 'founders', 'metrics', 'latest'})
+        self.assertEqual(len(response_['founders']), 2)
+        self.assertEqual(
+            response_['metrics'],
+            self.GET_data(
+                f'/companies/{company_id}/metrics',
+                headers=self.get_authorized_header(auth_token)))
+        for metric in self.metrics:
+            self.assertEqual(
+                response_['latest'][metric]['latest'],
+                self.kpi_for_week(2)[metric])
+            self.assertEqual(
+                response_['latest'][metric]['delta'],
+                self.kpi_for_week(2)[metric] - self.kpi_for_week(1)[metric])
+        # user lookup, company with its founders, KPI version, series and
+        # latest values
+        self.assertEqual(len(queries), 5)
+
+    def test_get_a_company_includes_follow_metric_parameters(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(3):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token))
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}?include=metrics,latest'
+            '&metrics=sales,mrr&last=2',
+            headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(set(response_['metrics']), {'sales', 'mrr'})
+        self.assertEqual(set(response_['latest']), {'sales', 'mrr'})
+        self.assertEqual(
+            response_['metrics']['sales']['data'],
+            [self.kpi_for_week(i)['sales'] for i in range(1, 3)])
+        self.assertEqual(
+            response_['latest']['mrr']['spark'],
+            [self.kpi_for_week(i)['mrr'] for i in range(1, 3)])
+
+    def test_get_a_company_without_metrics_includes_empty_latest(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}?include=latest',
+            headers=self.get_authorized_header(auth_token))
+        self.assertEqual(response_['latest'], {})
+
+    def test_get_a_company_invalid_includes(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for query in ('include=kpis', 'include=metrics&metrics=emails',
+                      'include=latest&last=-1'):
+            response = self.client.get(
+                f'/companies/{company_id}?{query}',
+                headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
@@ -0,0 +1,112 @@
+# server/tests/unit/companies/test_search.py
+
+import json
+from tests.base import BaseTestClass
+from tests.sample_data import (
+    data1,
+    data2,
+    data3
+)
+from app import db
+from app.models import Company
+
+
+class CompanySearchTest(BaseTestClass):
+
+    def search(self, auth_token: str, query: str) -> object:
+        return self.client.get(
+            f'/companies/search?{query}',
+            headers=self.get_authorized_header(auth_token))
+
+    def search_names(self, auth_token: str, query: str):
+        response = self.search(auth_token, query)
+        self.assert200(response)
+        return [
+            company['name'] for company in
+            json.loads(response.data.decode())['companies']
+        ]
+
+    def test_search_by_name_prefix(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        self.assertEqual(self.search_names(auth_token, 'q=boo'), ['Boocoo'])
+        self.assertEqual(self.search_names(auth_token, 'q=AXX'), ['Axxos'])
+
+    def test_search_by_website_and_bio(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        self.assertEqual(self.search_names(auth_token, 'q=club'), ['Boocoo'])
+        self.assertEqual(
+            self.search_names(auth_token, 'q=humans'), ['Axxos'])
+        # every word has to match
+        self.assertEqual(
+            self.search_names(auth_token, 'q=specializing+humans'),
+            ['Axxos'])
+        self.assertEqual(
+            self.search_names(auth_token, 'q=random+humans'), [])
+
+    def test_search_ranks_names_above_bios(self):
+        auth_token = self.get_auth_token(staff=True)
+        self.get_id_from_POST({
+            'name': 'Other',
+            'website': 'http://other.com',
+            'bio': 'We sell the demo of a demo.',
+        })
+        self.get_id_from_POST(data1)
+
+        response_ = json.loads(
+            self.search(auth_token, 'q=demo').data.decode())
+
+        self.assertEqual(
+            [company['name'] for company in response_['companies']],
+            ['Demo', 'Other'])
+        self.assertGreater(
+            response_['companies'][0]['rank'],
+            response_['companies'][1]['rank'])
+
+    def test_search_follows_updates(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        company = Company.query.get(company_id)
+        company.bio = 'Now selling hovercrafts.'
+        db.session.commit()
+
+        self.assertEqual(
+            self.search_names(auth_token, 'q=hovercraft'), ['Demo'])
+        self.assertEqual(self.search_names(auth_token, 'q=special'), [])
+
+    def test_search_by_pages(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        pages = []
+        for offset in range(4):
+            response_ = json.loads(self.search(
+                auth_token, f'q=special&limit=1&offset={offset}'
+            ).data.decode())
+            pages.append(response_)
+
+        self.assertEqual([page['total'] for page in pages], [3, 3, 3, 3])
+        self.assertEqual(
+            [len(page['companies']) for page in pages], [1, 1, 1, 0])
+        self.assertEqual(
+            [page['next_offset'] for page in pages], [1, 2, None, None])
+        self.assertEqual(
+            len({page['companies'][0]['id'] for page in pages[:3]}), 3)
+
+    def test_search_invalid_parameters(self):
+        auth_token = self.get_auth_token(staff=True)
+        for query in ('', 'q=', 'q=%21%21', 'q=demo&limit=0',
+                      'q=demo&offset=-1', 'q=demo&limit=abc'):
+            self.assert400(self.search(auth_token, query))
+
+    def test_search_non_staff(self):
+        company_id = self.get_id_from_POST(data1)
+        auth_token = self.get_auth_token(company_id=company_id)
+        self.assert401(self.search(auth_token, 'q=demo'))
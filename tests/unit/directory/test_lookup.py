@@ -0,0 +1,118 @@
+# server/tests/unit/directory/test_lookup.py
+
+import json
+from tests.base import BaseTestClass
+from tests.sample_data import (
+    data1,
+    data2,
+    data3
+)
+from app import db
+from app.apis.directory import lookup
+from app.models import Founder, User
+from app.ngram import trigrams
+
+
+class DirectoryLookupTest(BaseTestClass):
+
+    def lookup(self, auth_token: str, query: str) -> object:
+        return self.client.get(
+            f'/directory?{query}',
+            headers=self.get_authorized_header(auth_token))
+
+    def emails(self, auth_token: str, query: str):
+        response = self.lookup(auth_token, query)
+        self.assert200(response)
+        return [
+            person['email'] for person in
+            json.loads(response.data.decode())['people']
+        ]
+
+    def test_trigrams_pad_the_start_of_words(self):
+        self.assertEqual(trigrams('Tu'), {'  t', ' tu', 'tu '})
+        self.assertEqual(
+            trigrams('tu@demo.com'),
+            trigrams('tu') | trigrams('demo') | trigrams('com'))
+
+    def test_lookup_by_name_prefix(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        self.assertEqual(
+            self.emails(auth_token, 'q=jan'), ['jane@boocoo.club'])
+        self.assertEqual(
+            sorted(self.emails(auth_token, 'q=Tu')),
+            ['tu@boocoo.club', 'tu@demo.com'])
+
+    def test_lookup_by_email(self):
+        auth_token = self.get_auth_token(staff=True)
+        for data in [data1, data2, data3]:
+            self.get_id_from_POST(data)
+
+        self.assertEqual(
+            sorted(self.emails(auth_token, 'q=axxos')),
+            ['david@axxos.io', 'nick@axxos.io', 'sed@axxos.io'])
+        # every sign in of the staff helper adds a staff user
+        self.assertEqual(
+            set(self.emails(auth_token, 'q=staff@')), {'staff@example.com'})
+
+    def test_lookup_is_fuzzy(self):
+        auth_token = self.get_auth_token(staff=True)
+        self.get_id_from_POST(data3)
+
+        # a typo in the middle of a word still finds it
+        self.assertEqual(
+            self.emails(auth_token, 'q=carrawy'), ['nick@axxos.io'])
+        self.assertEqual(self.emails(auth_token, 'q=zzz'), [])
+
+    def test_lookup_prefixes_come_first(self):
+        self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        Founder(
+            name='Sam Tuner', email='sam@demo.com', role='CFO',
+            company_id=company_id).save()
+
+        people = lookup('tu')
+        self.assertEqual(people[0]['email'], 'tu@demo.com')
+        self.assertGreaterEqual(people[0]['score'], people[-1]['score'])
+
+    def test_lookup_lists_founders_once(self):
+        self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        people = lookup('john')
+        self.assertEqual(len(people), 1)
+        self.assertEqual(people[0]['kind'], 'founder')
+        self.assertEqual(people[0]['company_id'], company_id)
+
+    def test_lookup_follows_writes(self):
+        auth_token = self.get_auth_token(staff=True)
+        self.assertEqual(self.emails(auth_token, 'q=grace'), [])
+
+        User(name='Grace', email='grace@example.com', password='x').save()
+        self.assertEqual(
+            self.emails(auth_token, 'q=grace'), ['grace@example.com'])
+
+        user = User.query.filter_by(email='grace@example.com').first()
+        user.name = 'Ada'
+        user.email = 'ada@example.com'
+        db.session.commit()
+        self.assertEqual(self.emails(auth_token, 'q=grace'), [])
+
+    def test_lookup_limit(self):
+        auth_token = self.get_auth_token(staff=True)
+        self.get_id_from_POST(data3)
+
+        self.assertEqual(len(self.emails(auth_token, 'q=axxos&limit=2')), 2)
+
+    def test_lookup_invalid_parameters(self):
+        auth_token = self.get_auth_token(staff=True)
+        for query in ('', 'q=', 'q=%20', 'q=tu&limit=0', 'q=tu&limit=51',
+                      'q=tu&limit=abc'):
+            self.assert400(self.lookup(auth_token, query))
+
+    def test_lookup_non_staff(self):
+        company_id = self.get_id_from_POST(data1)
+        auth_token = self.get_auth_token(company_id=company_id)
+        self.assert401(self.lookup(auth_token, 'q=tu'))
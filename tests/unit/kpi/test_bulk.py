@@ -0,0 +1,113 @@
+# server/tests/unit/kpi/test_bulk.py
+
+import json
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2, data3
+
+
+class KpiBulkGETTest(BaseTestClass):
+
+    def test_get_metrics_of_every_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_ids = [
+            self.get_id_from_POST(data) for data in (data1, data2, data3)]
+        self.post_weeks(company_ids[0], auth_token, 2)
+        self.post_weeks(company_ids[1], auth_token, 3)
+
+        response = self.client.get(
+            '/companies/metrics',
+            headers=self.get_authorized_header(auth_token))
+        self.assert200(response)
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response_['total'], 3)
+        for company_id, weeks in zip(company_ids, (2, 3, 0)):
+            metrics = response_['companies'][str(company_id)]
+            single = self.GET_data(
+                f'/companies/{company_id}/metrics',
+                headers=self.get_authorized_header(auth_token))
+            for metric in self.metrics:
+                self.assertEqual(metrics[metric]['weeks'], weeks)
+                self.assertEqual(
+                    metrics[metric]['data'], single[metric]['data'])
+
+    def test_get_metrics_of_listed_companies_with_window(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_ids = [
+            self.get_id_from_POST(data) for data in (data1, data2, data3)]
+        for company_id in company_ids:
+            self.post_weeks(company_id, auth_token, 3)
+
+        response_ = self.GET_data(
+            f'/companies/metrics?ids={company_ids[0]},{company_ids[2]}'
+            '&last=1',
+            headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(response_['total'], 2)
+        self.assertNotIn(str(company_ids[1]), response_['companies'])
+        for metric in self.metrics:
+            self.assertEqual(
+                response_['companies'][str(company_ids[2])][metric]['data'],
+                [self.kpi_for_week(2)[metric]]
+            )
+
+    def test_query_count_does_not_grow_with_the_portfolio(self):
+        auth_token = self.get_auth_token(staff=True)
+        counts = []
+        for data in (data1, data2, data3):
+            company_id = self.get_id_from_POST(data)
+            self.post_weeks(company_id, auth_token, 1)
+            with self.count_queries() as queries:
+                self.client.get(
+                    '/companies/metrics',
+                    headers=self.get_authorized_header(auth_token))
+            counts.append(len(queries))
+
+        self.assertEqual(len(set(counts)), 1)
+
+    def test_unknown_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        response = self.client.get(
+            f'/companies/metrics?ids={company_id},12345',
+            headers=self.get_authorized_header(auth_token))
+        self.assert404(response)
+        response_ = json.loads(response.data.decode())
+        self.assertIn('company not found', response_['message'])
+        self.assertEqual(response_['ids'], [12345])
+
+    def test_invalid_ids(self):
+        auth_token = self.get_auth_token(staff=True)
+        response = self.client.get(
+            '/companies/metrics?ids=1,abc',
+            headers=self.get_authorized_header(auth_token))
+        self.assert400(response)
+
+    def test_not_allowed_for_founders(self):
+        company_id = self.get_id_from_POST(data1)
+        auth_token = self.get_auth_token(company_id=company_id)
+        response = self.client.get(
+            '/companies/metrics',
+            headers=self.get_authorized_header(auth_token))
+        self.assert401(response)
+
+    def test_get_selected_metrics_of_every_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 1)
+
+        response_ = self.GET_data(
+            '/companies/metrics?metrics=traffic,cpa',
+            headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(
+            sorted(response_['companies'][str(company_id)]),
+            ['cpa', 'traffic'])
+
+    def test_unknown_metric(self):
+        auth_token = self.get_auth_token(staff=True)
+        for url in ('/companies/metrics', '/companies/metrics/overview'):
+            response = self.client.get(
+                f'{url}?metrics=emails',
+                headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
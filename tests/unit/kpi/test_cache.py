@@ -0,0 +1,149 @@
+# server/tests/unit/kpi/test_cache.py
+
+import json
+import time
+from app.cache import KPICache
+from app.models import BaseMetric, Sale
+from tests.base import BaseTestClass
+from tests.sample_data import data1
+
+
+class KPICacheTest(BaseTestClass):
+
+    def test_get_and_set(self):
+        cache = KPICache()
+        self.assertIsNone(cache.get(1))
+        cache.set(1, {'sales': {}})
+        self.assertEqual(cache.get(1), {'sales': {}})
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = KPICache()
+        cache.maxsize = 2
+        cache.set(1, 'one')
+        cache.set(2, 'two')
+        cache.get(1)
+        cache.set(3, 'three')
+        self.assertIsNone(cache.get(2))
+        self.assertEqual(cache.get(1), 'one')
+        self.assertEqual(cache.get(3), 'three')
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_expired_entry_is_a_miss(self):
+        cache = KPICache()
+        cache.ttl = 0.01
+        cache.set(1, 'one')
+        time.sleep(0.02)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_invalidate_drops_every_variant_of_a_company(self):
+        cache = KPICache()
+        cache.set(1, 'all')
+        cache.set(1, 'sales only', variant=('sales',))
+        cache.set(2, 'other company')
+        cache.invalidate(1)
+        self.assertIsNone(cache.get(1))
+        self.assertIsNone(cache.get(1, variant=('sales',)))
+        self.assertEqual(cache.get(2), 'other company')
+
+    def test_entry_of_another_version_is_a_miss(self):
+        cache = KPICache()
+        cache.set(1, 'one', version=3)
+        self.assertIsNone(cache.get(1, version=4))
+        self.assertEqual(cache.stats()['size'], 0)
+
+    def test_repeat_get_does_not_read_metrics(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.send_POST(
+            f'/companies/{company_id}', data=self.kpi_for_week(),
+            headers=self.get_authorized_header(auth_token))
+
+        first = self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+        with self.count_queries() as queries:
+            second = self.GET_data(
+                f'/companies/{company_id}/metrics',
+                headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(first, second)
+        # only the user lookup of the protected route and the KPI version
+        # of the company are left
+        self.assertEqual(len(queries), 2)
+
+    def test_post_invalidates_the_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.send_POST(
+            f'/companies/{company_id}', data=self.kpi_for_week(0),
+            headers=self.get_authorized_header(auth_token))
+        self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+
+        self.send_POST(
+            f'/companies/{company_id}', data=self.kpi_for_week(1),
+            headers=self.get_authorized_header(auth_token))
+        response_ = self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            self.assertEqual(response_[metric]['weeks'], 2)
+
+    def test_put_invalidates_the_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.send_POST(
+            f'/companies/{company_id}', data=self.kpi_for_week(0),
+            headers=self.get_authorized_header(auth_token))
+        self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+
+        self.send_PUT(
+            f'/companies/{company_id}/metrics', self.kpi_for_week(1),
+            headers=self.get_authorized_header(auth_token))
+        response_ = self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            self.assertEqual(
+                response_[metric]['data'][0], self.kpi_for_week(1)[metric])
+
+    def test_writes_of_other_workers_are_seen(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        url = f'/companies/{company_id}/metrics'
+        headers = self.get_authorized_header(auth_token)
+        self.send_POST(f'/companies/{company_id}', data={'sales': 1},
+                       headers=headers)
+        self.GET_data(url, headers=headers)
+
+        # writes that never reach this worker's cache
+        BaseMetric.save_all(company_id, {Sale: 2})
+        self.assertEqual(
+            self.GET_data(url, headers=headers)['sales']['data'], [1, 2])
+        BaseMetric.correct_all(company_id, {Sale: {0: 10}})
+        self.assertEqual(
+            self.GET_data(url, headers=headers)['sales']['data'], [10, 2])
+
+    def test_stats_for_staff(self):
+        auth_token = self.get_auth_token(staff=True)
+        response = self.client.get(
+            '/metrics/cache', headers=self.get_authorized_header(auth_token))
+        self.assert200(response)
+        response_ = json.loads(response.data.decode())
+        for counter in ('hits', 'misses', 'evictions', 'size'):
+            self.assertIn(counter, response_)
+
+    def test_stats_not_allowed_for_founders(self):
+        company_id = self.get_id_from_POST(data1)
+        auth_token = self.get_auth_token(company_id=company_id)
+        response = self.client.get(
+            '/metrics/cache', headers=self.get_authorized_header(auth_token))
+        self.assert401(response)
@@ -4,6 +4,8 @@ import json
 import datetime
 from tests.base import BaseTestClass
 from tests.sample_data import data1
+from app import db
+from app.apis.kpi import get_kpi_for_company
 
 
 class KpiGETTest(BaseTestClass):
@@ -115,3 +117,154 @@ class KpiGETTest(BaseTestClass):
                 weekly_kpis = self.kpi_for_week(i)
                 self.assertEqual(
                     response_[metric]['data'][i], weekly_kpis[metric])
+
+    def test_get_data_in_a_single_query(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(3):
+            self.send_POST(
+                f'/companies/{company_id}',
+                data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token)
+            )
+
+        with self.count_queries() as queries:
+            metrics = get_kpi_for_company(company_id)
+
+        self.assertEqual(len(queries), 1)
+        for metric in self.KPI:
+            self.assertEqual(metrics[metric]['weeks'], 3)
+            self.assertEqual(
+                metrics[metric]['data'],
+                [self.kpi_for_week(i)[metric] for i in range(3)]
+            )
+
+    def test_get_data_without_orm_instances(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 3)
+        db.session.expunge_all()
+
+        metrics = get_kpi_for_company(company_id)
+
+        # one row per series, nothing added to the identity map
+        self.assertEqual(len(db.session.identity_map), 0)
+        self.assertEqual(metrics['sales']['weeks'], 3)
+
+    def test_get_data_since_and_until_week(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 5)
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}/metrics?since_week=1&until_week=3',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            self.assertEqual(response_[metric]['weeks'], 5)
+            self.assertEqual(
+                response_[metric]['data'],
+                [self.kpi_for_week(i)[metric] for i in range(1, 4)]
+            )
+
+    def test_get_last_n_weeks(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 5)
+
+        with self.count_queries() as queries:
+            metrics = get_kpi_for_company(company_id, last=2)
+
+        self.assertEqual(len(queries), 1)
+        for metric in self.metrics:
+            self.assertEqual(metrics[metric]['weeks'], 5)
+            self.assertEqual(
+                metrics[metric]['data'],
+                [self.kpi_for_week(i)[metric] for i in range(3, 5)]
+            )
+
+    def test_get_last_n_weeks_of_a_window(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 5)
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}/metrics'
+            '?since_week=0&until_week=2&last=2',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            self.assertEqual(response_[metric]['weeks'], 5)
+            self.assertEqual(
+                response_[metric]['data'],
+                [self.kpi_for_week(i)[metric] for i in range(1, 3)]
+            )
+
+    def test_get_empty_window_keeps_totals(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 2)
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}/metrics?since_week=10',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            self.assertEqual(response_[metric]['weeks'], 2)
+            self.assertEqual(response_[metric]['data'], [])
+
+    def test_get_invalid_week_window(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for query in ('last=abc', 'since_week=-1'):
+            response = self.client.get(
+                f'/companies/{company_id}/metrics?{query}',
+                headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
+            response_ = json.loads(response.data.decode())
+            self.assertIn('failure', response_['status'])
+
+    def test_get_selected_metrics_only(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 2)
+
+        with self.count_queries() as queries:
+            metrics = get_kpi_for_company(
+                company_id, metrics=['sales', 'mrr'])
+
+        self.assertEqual(sorted(metrics), ['mrr', 'sales'])
+        self.assertEqual(len(queries), 1)
+        self.assertIn('sales', queries[0])
+        self.assertNotIn('traffic', queries[0])
+        self.assertEqual(
+            metrics['mrr']['data'],
+            [self.kpi_for_week(i)['mrr'] for i in range(2)]
+        )
+
+    def test_get_metric_names_with_spaces(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        response = self.client.get(
+            f'/companies/{company_id}/metrics?metrics=sales, mrr ',
+            headers=self.get_authorized_header(auth_token))
+
+        self.assert200(response)
+        self.assertEqual(
+            sorted(json.loads(response.data.decode())), ['mrr', 'sales'])
+
+    def test_get_unknown_metric(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+
+        with self.count_queries() as queries:
+            response = self.client.get(
+                f'/companies/{company_id}/metrics?metrics=sales,customers',
+                headers=self.get_authorized_header(auth_token))
+
+        self.assert400(response)
+        response_ = json.loads(response.data.decode())
+        self.assertIn('failure', response_['status'])
+        self.assertIn('unknown metrics: customers', response_['message'])
+        self.assertEqual(queries, [])
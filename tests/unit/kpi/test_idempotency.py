@@ -0,0 +1,169 @@
+# server/tests/unit/kpi/test_idempotency.py
+
+import json
+import datetime
+import threading
+from app import db
+from app.models import BaseMetric, IdempotencyKey, MetricPoint, MRR, Sale
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+
+
+class KpiIdempotentPOSTTest(BaseTestClass):
+
+    def test_retry_is_not_written_again(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        first = self.submit(
+            company_id, {'sales': 10, 'mrr': 20}, auth_token, key='abc')
+
+        with self.count_queries() as statements:
+            retry = self.submit(
+                company_id, {'mrr': 20, 'sales': 10}, auth_token, key='abc')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.headers.get('Idempotent-Replayed'), 'true')
+        self.assertEqual(
+            json.loads(retry.data.decode())['weeks'],
+            json.loads(first.data.decode())['weeks'])
+        self.assertFalse([
+            statement for statement in statements
+            if statement.startswith(('INSERT', 'UPDATE', 'DELETE'))
+        ])
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
+        self.assertEqual(self.series(MRR, company_id), [(0, 20)])
+
+    def test_new_key_is_a_new_submission(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.submit(company_id, {'sales': 10}, auth_token, key='abc')
+        response = self.submit(
+            company_id, {'sales': 10}, auth_token, key='def')
+
+        self.assertEqual(json.loads(response.data.decode())['weeks'],
+                         {'sales': 1})
+        self.assertEqual(self.series(Sale, company_id), [(0, 10), (1, 10)])
+
+    def test_keys_belong_to_a_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        demo = self.get_id_from_POST(data1)
+        boocoo = self.get_id_from_POST(data2)
+        self.submit(demo, {'sales': 10}, auth_token, key='abc')
+        self.submit(boocoo, {'sales': 20}, auth_token, key='abc')
+
+        self.assertEqual(self.series(Sale, demo), [(0, 10)])
+        self.assertEqual(self.series(Sale, boocoo), [(0, 20)])
+
+    def test_key_reused_for_another_submission(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.submit(company_id, {'sales': 10}, auth_token, key='abc')
+        response = self.submit(
+            company_id, {'sales': 11}, auth_token, key='abc')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertIn(
+            'Idempotency-Key already used',
+            json.loads(response.data.decode())['message'])
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
+
+    def test_expired_keys_are_dropped(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.submit(company_id, {'sales': 10}, auth_token, key='abc')
+        IdempotencyKey.query.update({
+            'created_at': datetime.datetime.now() - datetime.timedelta(
+                seconds=self.app.config['IDEMPOTENCY_KEY_TTL'] + 1)
+        })
+        db.session.commit()
+
+        response = self.submit(
+            company_id, {'sales': 10}, auth_token, key='abc')
+        self.assertIsNone(response.headers.get('Idempotent-Replayed'))
+        self.assertEqual(self.series(Sale, company_id), [(0, 10), (1, 10)])
+        self.assertEqual(IdempotencyKey.query.count(), 1)
+
+    def test_explicit_week_replaces_the_value(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for value in (10, 11):
+            response = self.submit(
+                company_id, {'sales': value}, auth_token, week=0)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(
+                json.loads(response.data.decode())['weeks'], {'sales': 0})
+        self.assertEqual(self.series(Sale, company_id), [(0, 11)])
+
+        # the next week may be given too, and the counter follows it
+        self.submit(company_id, {'sales': 12}, auth_token, week=1)
+        self.submit(company_id, {'sales': 13}, auth_token)
+        self.assertEqual(self.series(Sale, company_id),
+                         [(0, 11), (1, 12), (2, 13)])
+
+    def test_explicit_week_cannot_leave_a_gap(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.submit(company_id, {'sales': 10, 'mrr': 20}, auth_token)
+        self.submit(company_id, {'sales': 11}, auth_token)
+
+        response = self.submit(
+            company_id, {'sales': 12, 'mrr': 22}, auth_token, week=2)
+        self.assert400(response)
+        self.assertEqual(
+            json.loads(response.data.decode())['message'],
+            'week 2 is past the next week of mrr (1)')
+        self.assertEqual(self.series(Sale, company_id), [(0, 10), (1, 11)])
+        self.assertEqual(self.series(MRR, company_id), [(0, 20)])
+
+    def test_explicit_week_in_points_storage(self):
+        self.app.config['METRIC_STORAGE'] = 'points'
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for value in (10, 11):
+            self.submit(company_id, {'sales': value}, auth_token, week=0)
+        self.assert400(
+            self.submit(company_id, {'sales': 12}, auth_token, week=2))
+
+        self.assertEqual(
+            [(p.week, p.value) for p in MetricPoint.query.filter_by(
+                company_id=company_id, metric='sales')],
+            [(0, 11)])
+
+    def test_invalid_week_and_key(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for kwargs, message in (
+                ({'week': -1}, 'week must not be negative'),
+                ({'week': 'one'}, 'week must be an integer'),
+                ({'key': 'k' * 256}, 'Idempotency-Key must be')):
+            response = self.submit(
+                company_id, {'sales': 10}, auth_token, **kwargs)
+            self.assert400(response)
+            self.assertIn(
+                message, json.loads(response.data.decode())['message'])
+
+    def test_concurrent_retries_write_once(self):
+        company_id = self.get_id_from_POST(data1)
+        fingerprint = 'f' * 64
+        weeks = []
+
+        def submit():
+            with self.app.app_context():
+                try:
+                    weeks.append(BaseMetric.save_all(
+                        company_id, {Sale: 10}, key='abc',
+                        fingerprint=fingerprint))
+                except Exception as e:
+                    weeks.append(type(e).__name__)
+                db.session.remove()
+
+        workers = [threading.Thread(target=submit) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(sorted(map(str, weeks)), sorted(
+            ["{'sales': 0}"] + ['DuplicateSubmission'] * 3))
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
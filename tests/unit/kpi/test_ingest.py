@@ -0,0 +1,202 @@
+# server/tests/unit/kpi/test_ingest.py
+
+import io
+import json
+from unittest import mock
+from sqlalchemy import event
+from sqlalchemy.exc import OperationalError
+import app.apis.ingest
+from app import db
+from app.models import Company, MetricWeek, MRR, Sale
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+
+
+class KpiIngestTest(BaseTestClass):
+
+    def ndjson(self, *points, raw=()):
+        lines = [json.dumps(point) for point in points] + list(raw)
+        return ('\n'.join(lines) + '\n').encode()
+
+    def ingest(self, company_id, body, auth_token=None, chunked=False):
+        headers = self.get_authorized_header(
+            auth_token or self.get_auth_token(staff=True))
+        if chunked:
+            headers['Transfer-Encoding'] = 'chunked'
+            return self.client.post(
+                f'/companies/{company_id}/metrics/ingest',
+                input_stream=io.BytesIO(body), headers=headers,
+                content_type='application/x-ndjson')
+        return self.client.post(
+            f'/companies/{company_id}/metrics/ingest',
+            data=body, headers=headers,
+            content_type='application/x-ndjson')
+
+    def test_ingest_data_points(self):
+        company_id = self.get_id_from_POST(data1)
+        response = self.ingest(company_id, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 10},
+            {'metric': 'sales', 'week': 1, 'value': 11.5},
+            {'metric': 'mrr', 'week': 0, 'value': 20},
+        ))
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response_['status'], 'success')
+        self.assertEqual(response_['ingested'], 3)
+        self.assertEqual(response_['failed'], 0)
+        self.assertEqual(self.series(Sale, company_id), [(0, 10), (1, 11.5)])
+        self.assertEqual(self.series(MRR, company_id), [(0, 20)])
+        self.assertEqual(
+            Company.query.get(company_id).tracked_metrics,
+            Sale.tracked_bit() | MRR.tracked_bit())
+        self.assertEqual(
+            MetricWeek.query.get((company_id, 'sales')).next_week, 2)
+
+    def test_ingest_chunked_body(self):
+        company_id = self.get_id_from_POST(data1)
+        response = self.ingest(company_id, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 10},
+        ), chunked=True)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
+
+    def test_report_line_errors(self):
+        company_id = self.get_id_from_POST(data1)
+        response = self.ingest(company_id, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 10},
+            {'metric': 'revenue', 'week': 0, 'value': 1},
+            {'metric': 'sales', 'week': -1, 'value': 1},
+            {'metric': 'sales', 'week': 1, 'value': 'ten'},
+            raw=['{"metric": "sales"', '[1, 2]', ''],
+        ))
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response_['ingested'], 1)
+        self.assertEqual(response_['failed'], 5)
+        self.assertEqual(response_['errors'], [
+            {'line': 2, 'message': "unknown metric 'revenue'"},
+            {'line': 3, 'message': 'week must be a non-negative integer'},
+            {'line': 4, 'message': 'metric values must be numbers'},
+            {'line': 5, 'message': 'invalid JSON'},
+            {'line': 6, 'message': 'a data point must be an object'},
+        ])
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
+
+    def test_long_lines_are_skipped(self):
+        company_id = self.get_id_from_POST(data1)
+        response = self.ingest(company_id, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 1, 'note': 'x' * 10000},
+            {'metric': 'sales', 'week': 1, 'value': 2},
+        ))
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response_['errors'], [
+            {'line': 1, 'message': 'line longer than 4096 bytes'}])
+        self.assertEqual(self.series(Sale, company_id), [(1, 2)])
+
+    def test_nothing_ingested(self):
+        company_id = self.get_id_from_POST(data1)
+        response = self.ingest(company_id, b'')
+        self.assert400(response)
+        self.assertIn(
+            'no data points ingested',
+            json.loads(response.data.decode())['message'])
+
+    def test_later_lines_replace_earlier_ones(self):
+        company_id = self.get_id_from_POST(data1)
+        Sale(company_id=company_id, value=1).save()
+        self.ingest(company_id, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 5},
+            {'metric': 'sales', 'week': 0, 'value': 6},
+        ))
+        self.assertEqual(self.series(Sale, company_id), [(0, 6)])
+
+    def test_batches_are_committed_on_their_own(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        body = self.ndjson(*[
+            {'metric': 'sales', 'week': week, 'value': week}
+            for week in range(25)
+        ])
+        commits = []
+
+        def count(session):
+            commits.append(session)
+
+        event.listen(db.session, 'after_commit', count)
+        try:
+            with mock.patch.object(app.apis.ingest, 'BATCH_SIZE', 10):
+                response = self.ingest(company_id, body, auth_token)
+        finally:
+            event.remove(db.session, 'after_commit', count)
+
+        self.assertEqual(json.loads(response.data.decode())['ingested'], 25)
+        self.assertEqual(len(commits), 3)
+        self.assertEqual(len(self.series(Sale, company_id)), 25)
+
+    def test_counters_are_locked_before_the_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        with self.count_queries() as statements:
+            self.ingest(company_id, self.ndjson(
+                {'metric': 'sales', 'week': 0, 'value': 5},
+            ), auth_token)
+
+        writes = [
+            statement.split()[:3] for statement in statements
+            if statement.startswith(('DELETE', 'UPDATE companies'))
+        ]
+        # the order of BaseMetric.save_all, which a POST runs alongside
+        self.assertEqual(writes, [
+            ['DELETE', 'FROM', 'metric_weeks'],
+            ['UPDATE', 'companies', 'SET'],
+        ])
+
+    def test_database_error_reports_where_to_resume(self):
+        company_id = self.get_id_from_POST(data1)
+        points = [
+            {'metric': 'sales', 'week': week, 'value': week}
+            for week in range(25)
+        ]
+        # line 12 is invalid and belongs to the batch that is lost
+        body = self.ndjson(*points[:11]) + b'{\n' + self.ndjson(*points[11:])
+        write_batch = app.apis.ingest.write_batch
+        writes = []
+
+        def fail_second_batch(company_id, points):
+            writes.append(len(points))
+            if len(writes) == 2:
+                raise OperationalError('INSERT', {}, Exception('gone'))
+            write_batch(company_id, points)
+
+        with mock.patch.object(app.apis.ingest, 'BATCH_SIZE', 10), \
+                mock.patch.object(app.apis.ingest, 'write_batch',
+                                  side_effect=fail_second_batch):
+            response = self.ingest(company_id, body)
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(response_['ingested'], 10)
+        self.assertEqual(response_['resume_from_line'], 11)
+        self.assertEqual((response_['failed'], response_['errors']), (0, []))
+        self.assertEqual(writes, [10, 10])
+        self.assertEqual(
+            self.series(Sale, company_id), [(w, w) for w in range(10)])
+
+    def test_ingest_to_another_company(self):
+        company_id = self.get_id_from_POST(data1)
+        other_id = self.get_id_from_POST(data2)
+        auth_token = self.get_auth_token(company_id=other_id)
+        response = self.ingest(company_id, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 10},
+        ), auth_token)
+        self.assert401(response)
+
+    def test_ingest_to_invalid_company(self):
+        response = self.ingest(1233, self.ndjson(
+            {'metric': 'sales', 'week': 0, 'value': 10},
+        ))
+        self.assert404(response)
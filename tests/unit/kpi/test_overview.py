@@ -0,0 +1,90 @@
+# server/tests/unit/kpi/test_overview.py
+
+import json
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+
+
+class KpiOverviewTest(BaseTestClass):
+
+    def test_latest_value_delta_and_sparkline(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        empty_id = self.get_id_from_POST(data2)
+        self.post_weeks(company_id, auth_token, 4)
+
+        response = self.client.get(
+            '/companies/metrics/overview?last=3',
+            headers=self.get_authorized_header(auth_token))
+        self.assert200(response)
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response_['total'], 2)
+        company = response_['companies'][str(company_id)]
+        self.assertEqual(company['name'], data1['name'])
+        for metric in self.metrics:
+            overview = company['metrics'][metric]
+            self.assertEqual(overview['latest'], self.kpi_for_week(3)[metric])
+            self.assertAlmostEqual(
+                overview['delta'],
+                self.kpi_for_week(3)[metric] - self.kpi_for_week(2)[metric]
+            )
+            self.assertEqual(
+                overview['spark'],
+                [self.kpi_for_week(i)[metric] for i in range(1, 4)]
+            )
+        self.assertEqual(
+            response_['companies'][str(empty_id)]['metrics'], {})
+
+    def test_single_week_has_no_delta(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 1)
+
+        response_ = self.GET_data(
+            f'/companies/metrics/overview?ids={company_id}',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            overview = response_['companies'][str(company_id)]['metrics']
+            self.assertIsNone(overview[metric]['delta'])
+            self.assertEqual(len(overview[metric]['spark']), 1)
+
+    def test_single_point_keeps_delta(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 3)
+
+        response_ = self.GET_data(
+            f'/companies/metrics/overview?ids={company_id}&last=1',
+            headers=self.get_authorized_header(auth_token))
+
+        for metric in self.metrics:
+            overview = response_['companies'][str(company_id)]['metrics']
+            self.assertAlmostEqual(
+                overview[metric]['delta'],
+                self.kpi_for_week(2)[metric] - self.kpi_for_week(1)[metric]
+            )
+            self.assertEqual(
+                overview[metric]['spark'], [self.kpi_for_week(2)[metric]])
+
+    def test_not_allowed_for_founders(self):
+        company_id = self.get_id_from_POST(data1)
+        auth_token = self.get_auth_token(company_id=company_id)
+        response = self.client.get(
+            '/companies/metrics/overview',
+            headers=self.get_authorized_header(auth_token))
+        self.assert401(response)
+
+    def test_selected_metrics_only(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 2)
+
+        response_ = self.GET_data(
+            '/companies/metrics/overview?metrics=mrr',
+            headers=self.get_authorized_header(auth_token))
+
+        self.assertEqual(
+            list(response_['companies'][str(company_id)]['metrics']),
+            ['mrr'])
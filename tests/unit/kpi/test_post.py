@@ -2,6 +2,8 @@
 
 import json
 import app.models
+from sqlalchemy import event
+from app import db
 from tests.base import BaseTestClass
 from tests.sample_data import data1, kpis
 
@@ -156,3 +158,93 @@ class KpiPOSTTest(BaseTestClass):
 
                 # check for week number
                 self.assertEqual(metric_db[i].week, i)
+
+    def test_post_unknown_metric(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        response = self.send_POST(
+            f'/companies/{company_id}',
+            data={'sales': 123, 'revenue': 456},
+            headers=self.get_authorized_header(auth_token)
+        )
+        response_ = json.loads(response.data.decode())
+
+        self.assert400(response)
+        self.assertIn('failure', response_['status'])
+        self.assertIn('unknown metrics: revenue', response_['message'])
+        # nothing of the submission is written
+        self.assertIsNone(
+            app.models.Sale.query.filter_by(company_id=company_id).first())
+
+    def test_post_metric_that_is_not_a_number(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        response = self.send_POST(
+            f'/companies/{company_id}',
+            data={'sales': 123, 'traffic': 'a lot'},
+            headers=self.get_authorized_header(auth_token)
+        )
+        response_ = json.loads(response.data.decode())
+
+        self.assert400(response)
+        self.assertIn('metric values must be numbers', response_['message'])
+        self.assertIsNone(
+            app.models.Sale.query.filter_by(company_id=company_id).first())
+
+    def test_post_metric_values_follow_the_json_number_rule(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for data, message in (
+                ({'sales': 'nan'}, 'metric values must be numbers'),
+                ({'sales': '5'}, 'metric values must be numbers'),
+                ({'sales': True}, 'metric values must be numbers'),
+                ({'sales': float('nan')}, 'must be finite numbers'),
+                ({'sales': float('inf')}, 'must be finite numbers'),
+                (['sales'], 'metrics must be an object')):
+            response = self.send_POST(
+                f'/companies/{company_id}', data=data,
+                headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
+            self.assertIn(
+                message, json.loads(response.data.decode())['message'])
+        self.assertIsNone(
+            app.models.Sale.query.filter_by(company_id=company_id).first())
+
+    def test_post_metrics_with_different_histories(self):
+        """>\tevery metric of a submission takes its own next week"""
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for data in ({'sales': 1}, {'sales': 2, 'traffic': 3}):
+            self.send_POST(
+                f'/companies/{company_id}',
+                data=data,
+                headers=self.get_authorized_header(auth_token)
+            )
+
+        sales = app.models.Sale.query.filter_by(company_id=company_id) \
+            .order_by(app.models.Sale.week).all()
+        traffic = app.models.Traffic.query.filter_by(
+            company_id=company_id).all()
+        self.assertEqual([(s.week, s.value) for s in sales], [(0, 1), (1, 2)])
+        self.assertEqual([(t.week, t.value) for t in traffic], [(0, 3)])
+
+    def test_post_metrics_in_a_single_commit(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        commits = []
+
+        def count(session):
+            commits.append(session)
+
+        event.listen(db.session, 'after_commit', count)
+        try:
+            response = self.send_POST(
+                f'/companies/{company_id}',
+                data=self.kpi_for_week(),
+                headers=self.get_authorized_header(auth_token)
+            )
+        finally:
+            event.remove(db.session, 'after_commit', count)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(commits), 1)
@@ -0,0 +1,161 @@
+# server/tests/unit/kpi/test_queue.py
+
+import json
+import contextlib
+from sqlalchemy import event
+from app import db
+from app.models import MRR, Sale
+from app.writer import metric_writer
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+
+
+class KpiQueuedPOSTTest(BaseTestClass):
+
+    def setUp(self):
+        super().setUp()
+        self.app.config['METRIC_WRITES'] = 'queue'
+
+    def tearDown(self):
+        self.assertTrue(metric_writer.join(timeout=10))
+        super().tearDown()
+
+    @contextlib.contextmanager
+    def writes_held(self):
+        """Keep the writer waiting on the week counters"""
+        connection = db.engine.connect()
+        transaction = connection.begin()
+        connection.execute('LOCK TABLE metric_weeks IN EXCLUSIVE MODE')
+        try:
+            yield
+        finally:
+            transaction.rollback()
+            connection.close()
+
+    def status(self, company_id, submission_id, auth_token):
+        return self.client.get(
+            f'/companies/{company_id}/submissions/{submission_id}',
+            headers=self.get_authorized_header(auth_token))
+
+    def test_submission_is_written_behind_the_request(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        with self.writes_held():
+            response = self.submit(
+                company_id, {'sales': 10, 'mrr': 20}, auth_token)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(data['message'], 'metrics queued')
+            self.assertTrue(response.headers['Location'].endswith(
+                f'/companies/{company_id}/submissions/{data["submission"]}'))
+
+            queued = self.status(company_id, data['submission'], auth_token)
+            self.assertEqual(
+                json.loads(queued.data.decode())['submission']['state'],
+                'queued')
+        metric_writer.join(timeout=10)
+
+        written = json.loads(self.status(
+            company_id, data['submission'], auth_token).data.decode())
+        self.assertEqual(written['submission'], {
+            'id': data['submission'],
+            'state': 'written',
+            'weeks': {'mrr': 0, 'sales': 0},
+        })
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
+        self.assertEqual(self.series(MRR, company_id), [(0, 20)])
+
+    def test_queued_submissions_are_written_together(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        commits = []
+
+        def count(connection):
+            commits.append(connection)
+
+        with self.writes_held():
+            for value in range(5):
+                response = self.submit(
+                    company_id, {'sales': value}, auth_token)
+                self.assertEqual(response.status_code, 202)
+            event.listen(db.engine, 'commit', count)
+        try:
+            metric_writer.join(timeout=10)
+        finally:
+            event.remove(db.engine, 'commit', count)
+
+        # the first submission may have been taken on its own
+        self.assertLessEqual(len(commits), 2)
+        self.assertEqual(
+            self.series(Sale, company_id), [(w, w) for w in range(5)])
+
+    def test_full_queue_is_answered_503(self):
+        self.app.config['METRIC_QUEUE_SIZE'] = 1
+        metric_writer.init_app(self.app)
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        with self.writes_held():
+            accepted = self.submit(company_id, {'sales': 1}, auth_token)
+            rejected = self.submit(company_id, {'sales': 2}, auth_token)
+        metric_writer.join(timeout=10)
+
+        self.assertEqual(accepted.status_code, 202)
+        self.assertEqual(rejected.status_code, 503)
+        self.assertEqual(rejected.headers['Retry-After'], '1')
+        self.assertEqual(self.series(Sale, company_id), [(0, 1)])
+
+    def test_failed_submission_leaves_its_batch_alone(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        with self.writes_held():
+            first = self.submit(company_id, {'sales': 1}, auth_token, 'abc')
+            retry = self.submit(company_id, {'sales': 1}, auth_token, 'abc')
+            reused = self.submit(company_id, {'sales': 2}, auth_token, 'abc')
+            other = self.submit(company_id, {'mrr': 3}, auth_token)
+        metric_writer.join(timeout=10)
+
+        states = [
+            json.loads(self.status(
+                company_id,
+                json.loads(response.data.decode())['submission'],
+                auth_token).data.decode())['submission']
+            for response in (first, retry, reused, other)
+        ]
+        self.assertEqual([state['state'] for state in states],
+                         ['written', 'written', 'failed', 'written'])
+        self.assertEqual(states[1]['weeks'], {'sales': 0})
+        self.assertIn('Idempotency-Key already used', states[2]['message'])
+        self.assertEqual(self.series(Sale, company_id), [(0, 1)])
+        self.assertEqual(self.series(MRR, company_id), [(0, 3)])
+
+    def test_week_ahead_fails_behind_the_request(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        response = self.send_POST(
+            f'/companies/{company_id}?week=5', data={'sales': 1},
+            headers=self.get_authorized_header(auth_token))
+        metric_writer.join(timeout=10)
+
+        state = json.loads(self.status(
+            company_id, json.loads(response.data.decode())['submission'],
+            auth_token).data.decode())['submission']
+        self.assertEqual(state['state'], 'failed')
+        self.assertEqual(
+            state['message'], 'week 5 is past the next week of sales (0)')
+        self.assertEqual(self.series(Sale, company_id), [])
+
+    def test_unknown_submission(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        response = self.status(company_id, 'abc', auth_token)
+        self.assert404(response)
+        self.assertEqual(
+            json.loads(response.data.decode())['message'],
+            'submission not found')
+
+    def test_status_of_another_company(self):
+        company_id = self.get_id_from_POST(data1)
+        other_id = self.get_id_from_POST(data2)
+        response = self.status(
+            company_id, 'abc', self.get_auth_token(company_id=other_id))
+        self.assert401(response)
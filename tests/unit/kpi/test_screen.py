@@ -0,0 +1,112 @@
+# server/tests/unit/kpi/test_screen.py
+
+import json
+from typing import Dict, List
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2, data3
+from app.apis.kpi import screen_companies, screen_predicates
+
+
+class KpiScreenTest(BaseTestClass):
+
+    def add_series(self, company_id: int, series: Dict[str, List[float]]):
+        for metric, values in series.items():
+            for value in values:
+                self.KPI[metric](company_id=company_id, value=value).save()
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.demo = self.get_id_from_POST(data1)
+        self.boocoo = self.get_id_from_POST(data2)
+        self.axxos = self.get_id_from_POST(data3)
+        # MRR up 50% over 4 weeks, CPA down
+        self.add_series(self.demo, {
+            'mrr': [90, 100, 110, 130, 140, 150],
+            'cpa': [30, 28, 26, 25, 24, 20],
+        })
+        # MRR up 5% over 4 weeks, CPA down
+        self.add_series(self.boocoo, {
+            'mrr': [100, 100, 101, 102, 103, 105],
+            'cpa': [30, 30, 30, 30, 30, 29],
+        })
+        # MRR up 20% over 4 weeks, CPA up
+        self.add_series(self.axxos, {
+            'mrr': [10, 10, 11, 11, 12, 12],
+            'cpa': [5, 5, 5, 5, 5, 6],
+        })
+
+    def screen(self, auth_token: str, where: str) -> object:
+        return self.client.get(
+            f'/companies/metrics/screen?where={where}',
+            headers=self.get_authorized_header(auth_token))
+
+    def screen_ids(self, where: str) -> List[int]:
+        predicates = screen_predicates({'where': where})
+        return [company['id'] for company in screen_companies(predicates)]
+
+    def test_screen_growth_and_delta(self):
+        auth_token = self.get_auth_token(staff=True)
+        response = self.screen(auth_token, 'mrr.growth:4>0.1,cpa.delta:4<0')
+        self.assert200(response)
+        response_ = json.loads(response.data.decode())
+
+        self.assertEqual(response_['total'], 1)
+        self.assertEqual(response_['companies'], [{
+            'id': self.demo,
+            'name': data1['name'],
+            'values': {'mrr.growth:4': 0.5, 'cpa.delta:4': -8.0},
+        }])
+
+    def test_screen_latest_value(self):
+        self.assertEqual(
+            self.screen_ids('mrr.latest>=100'), [self.demo, self.boocoo])
+        self.assertEqual(self.screen_ids('cpa.latest=6'), [self.axxos])
+
+    def test_screen_defaults_to_one_week(self):
+        self.assertEqual(
+            self.screen_ids('mrr.delta>5'), [self.demo])
+        self.assertEqual(
+            self.screen_ids('mrr.delta!=0'), [self.demo, self.boocoo])
+
+    def test_screen_in_a_single_query(self):
+        predicates = screen_predicates(
+            {'where': 'mrr.growth:4>0.1,cpa.delta:2<0,sales.latest>0'})
+        with self.count_queries() as queries:
+            screen_companies(predicates)
+        self.assertEqual(len(queries), 1)
+
+    def test_screen_skips_companies_without_enough_history(self):
+        # six weeks back is before the first week of every company
+        self.assertEqual(self.screen_ids('mrr.delta:6>-1000'), [])
+        self.assertEqual(self.screen_ids('sales.latest>=0'), [])
+
+    def test_screen_some_companies(self):
+        auth_token = self.get_auth_token(staff=True)
+        response_ = json.loads(self.client.get(
+            '/companies/metrics/screen?where=mrr.latest>0'
+            f'&ids={self.boocoo},{self.axxos}',
+            headers=self.get_authorized_header(auth_token)
+        ).data.decode())
+        self.assertEqual(
+            [company['id'] for company in response_['companies']],
+            [self.boocoo, self.axxos])
+
+    def test_screen_unknown_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        response = self.client.get(
+            '/companies/metrics/screen?where=mrr.latest>0'
+            f'&ids={self.demo},12345',
+            headers=self.get_authorized_header(auth_token))
+        self.assert404(response)
+        self.assertEqual(json.loads(response.data.decode())['ids'], [12345])
+
+    def test_screen_invalid_predicates(self):
+        auth_token = self.get_auth_token(staff=True)
+        for where in ('', 'mrr>1', 'mrr.growth:4~1', 'emails.latest>1',
+                      'mrr.latest:4>1', 'mrr.delta:0>1', 'mrr.delta:521>1',
+                      'mrr.latest>abc'):
+            self.assert400(self.screen(auth_token, where))
+
+    def test_screen_non_staff(self):
+        auth_token = self.get_auth_token(company_id=self.demo)
+        self.assert401(self.screen(auth_token, 'mrr.latest>0'))
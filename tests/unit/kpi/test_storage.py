@@ -0,0 +1,177 @@
+# server/tests/unit/kpi/test_storage.py
+
+from app import db
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+from app.apis.kpi import get_kpi_for_company, get_kpi_overview
+from app.models import Company, MetricPoint, Sale
+
+
+class KpiPointsStorageTest(BaseTestClass):
+
+    def setUp(self) -> None:
+        super().setUp()
+        self.app.config['METRIC_STORAGE'] = 'points'
+
+    def test_post_stores_data_points_in_one_table(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(2):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token))
+
+        for metric in self.KPI:
+            self.assertEqual(self.KPI[metric].query.count(), 0)
+            points = MetricPoint.query.filter_by(
+                company_id=company_id, metric=metric
+            ).order_by(MetricPoint.week).all()
+            self.assertEqual([point.week for point in points], [0, 1])
+            self.assertEqual(
+                [point.value for point in points],
+                [self.kpi_for_week(i)[metric] for i in range(2)]
+            )
+
+    def test_get_reads_data_points_in_a_single_query(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(3):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token))
+
+        with self.count_queries() as queries:
+            metrics = get_kpi_for_company(company_id)
+
+        self.assertEqual(len(queries), 1)
+        for metric in self.KPI:
+            self.assertEqual(metrics[metric]['weeks'], 3)
+            self.assertEqual(
+                metrics[metric]['data'],
+                [self.kpi_for_week(i)[metric] for i in range(3)]
+            )
+
+    def test_last_updated_point_of_the_company(self):
+        auth_token = self.get_auth_token(staff=True)
+        first = self.get_id_from_POST(data1)
+        second = self.get_id_from_POST(data2)
+        for company_id in (first, second):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(0),
+                headers=self.get_authorized_header(auth_token))
+
+        point = Sale.get_last_updated(first)
+        self.assertEqual((point.company_id, point.metric), (first, 'sales'))
+
+    def test_put_updates_data_points(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.send_POST(
+            f'/companies/{company_id}', data=self.kpi_for_week(0),
+            headers=self.get_authorized_header(auth_token))
+
+        response = self.send_PUT(
+            f'/companies/{company_id}/metrics', self.kpi_for_week(1),
+            headers=self.get_authorized_header(auth_token))
+        self.assert200(response)
+
+        response_ = self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+        for metric in self.metrics:
+            self.assertEqual(
+                response_[metric]['data'], [self.kpi_for_week(1)[metric]])
+
+    def test_put_corrects_given_weeks_in_one_statement(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(3):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token))
+
+        with self.count_queries() as statements:
+            response = self.send_PUT(
+                f'/companies/{company_id}/metrics',
+                {'sales': {'0': 100}, 'mrr': {'1': 201}, 'cpa': 3},
+                headers=self.get_authorized_header(auth_token))
+        self.assert200(response)
+        self.assertEqual(len([
+            s for s in statements if s.startswith('UPDATE metric_points')
+        ]), 1)
+
+        points = {
+            (point.metric, point.week): point.value
+            for point in MetricPoint.query.filter_by(company_id=company_id)
+        }
+        self.assertEqual(points['sales', 0], 100)
+        self.assertEqual(points['mrr', 1], 201)
+        self.assertEqual(points['cpa', 2], 3)
+        self.assertEqual(points['sales', 1], self.kpi_for_week(1)['sales'])
+
+    def test_overview_reads_data_points(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for i in range(3):
+            self.send_POST(
+                f'/companies/{company_id}', data=self.kpi_for_week(i),
+                headers=self.get_authorized_header(auth_token))
+
+        overview = get_kpi_overview([company_id], points=2)[company_id]
+        for metric in self.metrics:
+            self.assertEqual(
+                overview['metrics'][metric]['spark'],
+                [self.kpi_for_week(i)[metric] for i in range(1, 3)]
+            )
+
+
+class MetricStorageCopyTest(BaseTestClass):
+
+    def post_week(self, company_id, auth_token, week):
+        self.send_POST(
+            f'/companies/{company_id}', data=self.kpi_for_week(week),
+            headers=self.get_authorized_header(auth_token))
+
+    def test_switch_to_points_after_writes_in_tables(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 2)
+        # a stale copy, as left by the migration
+        MetricPoint.query.delete()
+        db.session.add(MetricPoint(
+            company_id=company_id, metric='sales', week=5, value=1))
+        db.session.commit()
+        version = Company.kpi_version_of(company_id)
+
+        copied = MetricPoint.copy_storage('points')
+        self.app.config['METRIC_STORAGE'] = 'points'
+
+        self.assertEqual(copied, 2 * len(self.metrics))
+        self.assertEqual(Company.kpi_version_of(company_id), version + 1)
+        metrics = get_kpi_for_company(company_id)
+        for metric in self.metrics:
+            self.assertEqual(
+                metrics[metric]['data'],
+                [self.kpi_for_week(i)[metric] for i in range(2)]
+            )
+        # the counters follow the copy, not the stale week 5
+        self.post_week(company_id, auth_token, 2)
+        self.assertEqual(get_kpi_for_company(company_id)['sales']['data'], [
+            self.kpi_for_week(week)['sales'] for week in range(3)])
+
+    def test_switch_back_to_tables_after_writes_in_points(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 1)
+        self.app.config['METRIC_STORAGE'] = 'points'
+        MetricPoint.copy_storage('points')
+        self.post_week(company_id, auth_token, 1)
+
+        MetricPoint.copy_storage('tables')
+        self.app.config['METRIC_STORAGE'] = 'tables'
+
+        self.assertEqual(self.series(Sale, company_id), [
+            (week, self.kpi_for_week(week)['sales']) for week in range(2)])
+        self.post_week(company_id, auth_token, 2)
+        self.assertEqual(
+            [week for week, _ in self.series(Sale, company_id)], [0, 1, 2])
@@ -0,0 +1,79 @@
+# server/tests/unit/kpi/test_tracked.py
+
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+from app import db
+from app.apis.kpi import get_kpi_for_company, get_kpi_for_companies
+from app.models import Company, Sale, MRR
+
+
+class KpiTrackedMetricsTest(BaseTestClass):
+
+    def test_save_flags_the_metric(self):
+        company_id = self.get_id_from_POST(data1)
+        self.assertEqual(Company.query.get(company_id).tracked_metrics, 0)
+
+        for value in (1, 2):
+            Sale(company_id=company_id, value=value).save()
+        MRR(company_id=company_id, value=3).save()
+
+        self.assertEqual(
+            Company.query.get(company_id).tracked_metrics,
+            Sale.tracked_bit() | MRR.tracked_bit())
+
+    def test_save_flags_the_metric_in_points_storage(self):
+        self.app.config['METRIC_STORAGE'] = 'points'
+        company_id = self.get_id_from_POST(data1)
+        Sale(company_id=company_id, value=1).save()
+
+        self.assertEqual(
+            Company.query.get(company_id).tracked_metrics, Sale.tracked_bit())
+        self.assertEqual(
+            get_kpi_for_company(company_id)['sales']['data'], [1])
+
+    def test_bits_are_distinct(self):
+        bits = [Metric.tracked_bit() for Metric in self.KPI.values()]
+        self.assertEqual(len(set(bits)), len(self.KPI))
+
+    def test_untracked_metrics_keep_the_placeholder(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.send_POST(
+            f'/companies/{company_id}', data={'sales': 10, 'mrr': 20},
+            headers=self.get_authorized_header(auth_token))
+
+        metrics = get_kpi_for_company(company_id)
+        self.assertEqual(metrics['sales']['data'], [10])
+        self.assertEqual(metrics['mrr']['data'], [20])
+        for metric in set(self.KPI) - {'sales', 'mrr'}:
+            self.assertEqual(metrics[metric]['weeks'], 0)
+            self.assertEqual(metrics[metric]['data'], [])
+
+    def test_metrics_of_other_companies_are_read(self):
+        demo = self.get_id_from_POST(data1)
+        boocoo = self.get_id_from_POST(data2)
+        Sale(company_id=demo, value=1).save()
+        MRR(company_id=boocoo, value=2).save()
+
+        metrics = get_kpi_for_companies()
+        self.assertEqual(metrics[demo]['sales']['data'], [1])
+        self.assertEqual(metrics[demo]['mrr']['data'], [])
+        self.assertEqual(metrics[boocoo]['mrr']['data'], [2])
+
+    def test_refresh_after_bulk_insert(self):
+        company_id = self.get_id_from_POST(data1)
+        db.session.execute(Sale.__table__.insert(), [
+            {'company_id': company_id, 'week': week, 'value': week}
+            for week in range(3)
+        ])
+        db.session.commit()
+        # writes around BaseMetric.save are not seen until a refresh
+        self.assertEqual(get_kpi_for_company(company_id)['sales']['data'], [])
+
+        Company.refresh_tracked_metrics()
+        db.session.commit()
+
+        self.assertEqual(
+            Company.query.get(company_id).tracked_metrics, Sale.tracked_bit())
+        self.assertEqual(
+            get_kpi_for_company(company_id)['sales']['data'], [0, 1, 2])
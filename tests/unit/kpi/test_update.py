@@ -88,3 +88,105 @@ class KpiUpdateTest(BaseTestClass):
                 self.kpi_for_week(2)[metric],
                 updated_data[metric]['data'][~0]
             )
+
+    def test_update_given_weeks(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 4)
+
+        response = self.send_PUT(
+            f'/companies/{company_id}/metrics',
+            {'sales': {'0': 100, '2': 102.5}, 'mrr': {'1': 201}},
+            headers=self.get_authorized_header(auth_token)
+        )
+
+        self.assert200(response)
+        response_ = json.loads(response.data.decode())
+        self.assertEqual(response_['updated'], {'sales': [0, 2], 'mrr': [1]})
+        self.assertEqual(response_['unmatched'], {})
+
+        metrics = self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))
+        sales = [self.kpi_for_week(week)['sales'] for week in range(4)]
+        sales[0], sales[2] = 100, 102.5
+        self.assertEqual(metrics['sales']['data'], sales)
+        self.assertEqual(metrics['mrr']['data'][1], 201)
+        self.assertEqual(
+            metrics['traffic']['data'],
+            [self.kpi_for_week(week)['traffic'] for week in range(4)])
+
+    def test_update_reports_unmatched_weeks(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.send_POST(
+            f'/companies/{company_id}', {'sales': 1},
+            headers=self.get_authorized_header(auth_token))
+
+        response = self.send_PUT(
+            f'/companies/{company_id}/metrics',
+            {'sales': {'0': 10, '5': 15}, 'mrr': 20},
+            headers=self.get_authorized_header(auth_token)
+        )
+
+        self.assert200(response)
+        response_ = json.loads(response.data.decode())
+        self.assertEqual(response_['updated'], {'sales': [0]})
+        self.assertEqual(
+            response_['unmatched'], {'sales': [5], 'mrr': ['latest']})
+
+    def test_update_latest_is_the_last_week(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 3)
+        # correcting an old week makes it the last updated one
+        self.send_PUT(
+            f'/companies/{company_id}/metrics', {'sales': {'0': 10}},
+            headers=self.get_authorized_header(auth_token))
+
+        response = self.send_PUT(
+            f'/companies/{company_id}/metrics', {'sales': 30},
+            headers=self.get_authorized_header(auth_token))
+
+        response_ = json.loads(response.data.decode())
+        self.assertEqual(response_['updated'], {'sales': [2]})
+        data = self.GET_data(
+            f'/companies/{company_id}/metrics',
+            headers=self.get_authorized_header(auth_token))['sales']['data']
+        self.assertEqual((data[0], data[2]), (10, 30))
+
+    def test_update_invalid_corrections(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        for body, message in (
+                ({'revenue': 1}, 'unknown metrics: revenue'),
+                ({'sales': {'-1': 1}}, 'weeks must be non-negative'),
+                ({'sales': {'one': 1}}, 'weeks must be non-negative'),
+                ({'sales': {'0': 'ten'}}, 'metric values must be numbers'),
+                ({'sales': {'0': float('nan')}}, 'must be finite numbers'),
+                ({'sales': {}}, 'no weeks given for sales')):
+            response = self.send_PUT(
+                f'/companies/{company_id}/metrics', body,
+                headers=self.get_authorized_header(auth_token))
+            self.assert400(response)
+            self.assertIn(
+                message, json.loads(response.data.decode())['message'])
+
+    def test_update_in_one_transaction(self):
+        auth_token = self.get_auth_token(staff=True)
+        company_id = self.get_id_from_POST(data1)
+        self.post_weeks(company_id, auth_token, 3)
+
+        with self.count_queries() as statements:
+            response = self.send_PUT(
+                f'/companies/{company_id}/metrics',
+                {metric: {'0': 1, '2': 3} for metric in self.metrics},
+                headers=self.get_authorized_header(auth_token))
+        self.assert200(response)
+
+        # no count over the metric tables, one lookup of the data points,
+        # one UPDATE per table and the KPI version of the company
+        self.assertFalse([s for s in statements if 'count(' in s])
+        self.assertEqual(
+            len([s for s in statements if s.startswith('UPDATE')]),
+            len(self.metrics) + 1)
@@ -0,0 +1,124 @@
+# server/tests/unit/kpi/test_weeks.py
+
+import threading
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+from app import db
+from app.models import BaseMetric, MetricPoint, MetricWeek, Sale, Traffic
+
+
+class KpiWeekCounterTest(BaseTestClass):
+
+    def weeks(self, Model, company_id):
+        return [
+            point.week for point in
+            Model.query.filter_by(company_id=company_id).order_by(Model.id)
+        ]
+
+    def test_save_takes_the_week_from_the_counter(self):
+        company_id = self.get_id_from_POST(data1)
+        for value in range(3):
+            Sale(company_id=company_id, value=value).save()
+
+        self.assertEqual(self.weeks(Sale, company_id), [0, 1, 2])
+        counter = MetricWeek.query.get((company_id, 'sales'))
+        self.assertEqual(counter.next_week, 3)
+
+    def test_save_does_not_read_the_series(self):
+        company_id = self.get_id_from_POST(data1)
+        Sale(company_id=company_id, value=1).save()
+
+        with self.count_queries() as statements:
+            Sale(company_id=company_id, value=2).save()
+        self.assertFalse([
+            statement for statement in statements
+            if statement.lstrip().upper().startswith('SELECT')
+        ])
+
+    def test_counters_are_per_company_and_metric(self):
+        demo = self.get_id_from_POST(data1)
+        boocoo = self.get_id_from_POST(data2)
+        Sale(company_id=demo, value=1).save()
+        Sale(company_id=demo, value=2).save()
+        Sale(company_id=boocoo, value=3).save()
+        Traffic(company_id=demo, value=4).save()
+
+        self.assertEqual(self.weeks(Sale, demo), [0, 1])
+        self.assertEqual(self.weeks(Sale, boocoo), [0])
+        self.assertEqual(self.weeks(Traffic, demo), [0])
+
+    def test_rolled_back_week_is_given_back(self):
+        company_id = self.get_id_from_POST(data1)
+        self.assertEqual(MetricWeek.issue(company_id, ['sales']), {'sales': 0})
+        db.session.rollback()
+
+        Sale(company_id=company_id, value=1).save()
+        self.assertEqual(self.weeks(Sale, company_id), [0])
+
+    def test_rows_written_around_the_counter_are_caught_up(self):
+        company_id = self.get_id_from_POST(data1)
+        Sale(company_id=company_id, value=1).save()
+        db.session.execute(Sale.__table__.insert(), [
+            {'company_id': company_id, 'week': week, 'value': week}
+            for week in (1, 2)
+        ])
+        db.session.commit()
+
+        # week 1 is taken: the counter is resynchronised and week 3 used
+        Sale(company_id=company_id, value=3).save()
+        self.assertEqual(self.weeks(Sale, company_id), [0, 1, 2, 3])
+        self.assertEqual(
+            MetricWeek.query.get((company_id, 'sales')).next_week, 4)
+
+    def test_sync_from_the_data(self):
+        demo = self.get_id_from_POST(data1)
+        boocoo = self.get_id_from_POST(data2)
+        db.session.execute(Sale.__table__.insert(), [
+            {'company_id': company_id, 'week': week, 'value': week}
+            for company_id, weeks in ((demo, 3), (boocoo, 1))
+            for week in range(weeks)
+        ])
+        MetricWeek.sync()
+        db.session.commit()
+
+        self.assertEqual(
+            {(w.company_id, w.metric): w.next_week
+             for w in MetricWeek.query},
+            {(demo, 'sales'): 3, (boocoo, 'sales'): 1})
+
+    def test_points_storage_uses_the_counter(self):
+        self.app.config['METRIC_STORAGE'] = 'points'
+        company_id = self.get_id_from_POST(data1)
+        BaseMetric.save_all(company_id, {Sale: 1, Traffic: 2})
+        weeks = BaseMetric.save_all(company_id, {Sale: 3})
+
+        self.assertEqual(weeks, {'sales': 1})
+        self.assertEqual(
+            [p.week for p in MetricPoint.query.filter_by(
+                company_id=company_id, metric='sales').order_by('week')],
+            [0, 1])
+
+    def test_concurrent_saves_take_distinct_weeks(self):
+        company_id = self.get_id_from_POST(data1)
+        errors = []
+
+        def submit():
+            try:
+                with self.app.app_context():
+                    for value in range(5):
+                        BaseMetric.save_all(
+                            company_id, {Sale: value, Traffic: value})
+                    db.session.remove()
+            except Exception as e:
+                errors.append(e)
+
+        workers = [threading.Thread(target=submit) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(errors, [])
+        for Metric in (Sale, Traffic):
+            self.assertEqual(
+                sorted(self.weeks(Metric, company_id)), list(range(20)))
@@ -0,0 +1,126 @@
+# server/tests/unit/test_importer.py
+
+import io
+from app import db
+from app.importer import import_metrics
+from app.models import Company, MetricPoint, MetricWeek, MRR, Sale
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+
+
+class MetricImportTest(BaseTestClass):
+
+    def test_import_csv_by_company_name(self):
+        demo = self.get_id_from_POST(data1)
+        boocoo = self.get_id_from_POST(data2)
+        imported = import_metrics(io.StringIO(
+            'company,metric,week,value\n'
+            f'{data1["name"]},sales,0,10\n'
+            f'{data1["name"]},sales,1,11.5\n'
+            f'{data2["name"]},mrr,0,20\n'
+        ))
+
+        self.assertEqual(
+            imported, {'data_points': 3, 'companies': 2, 'metrics': 2})
+        self.assertEqual(self.series(Sale, demo), [(0, 10), (1, 11.5)])
+        self.assertEqual(self.series(MRR, boocoo), [(0, 20)])
+
+    def test_import_tsv_by_company_id(self):
+        company_id = self.get_id_from_POST(data1)
+        import_metrics(io.StringIO(
+            'company_id\tmetric\tweek\tvalue\n'
+            f'{company_id}\tsales\t0\t10\n'
+        ))
+        self.assertEqual(self.series(Sale, company_id), [(0, 10)])
+
+    def test_import_replaces_existing_weeks(self):
+        company_id = self.get_id_from_POST(data1)
+        for value in (1, 2):
+            Sale(company_id=company_id, value=value).save()
+
+        import_metrics(io.StringIO(
+            'company_id,metric,week,value\n'
+            f'{company_id},sales,1,20\n'
+            f'{company_id},sales,2,30\n'
+        ))
+        self.assertEqual(
+            self.series(Sale, company_id), [(0, 1), (1, 20), (2, 30)])
+
+    def test_counters_are_locked_before_the_companies(self):
+        company_id = self.get_id_from_POST(data1)
+        with self.count_queries() as statements:
+            import_metrics(io.StringIO(
+                'company_id,metric,week,value\n'
+                f'{company_id},sales,0,5\n'
+            ))
+
+        writes = [
+            statement.split()[:3] for statement in statements
+            if statement.startswith(('DELETE', 'UPDATE companies'))
+        ]
+        # the order of BaseMetric.save_all, which a POST runs alongside
+        self.assertEqual(writes, [
+            ['DELETE', 'FROM', 'metric_weeks'],
+            ['UPDATE', 'companies', 'SET'],
+            ['UPDATE', 'companies', 'SET'],
+        ])
+
+    def test_import_updates_tracked_metrics_and_weeks(self):
+        company_id = self.get_id_from_POST(data1)
+        import_metrics(io.StringIO(
+            'company_id,metric,week,value\n'
+            f'{company_id},sales,0,1\n'
+            f'{company_id},sales,4,5\n'
+        ))
+
+        self.assertEqual(
+            Company.query.get(company_id).tracked_metrics, Sale.tracked_bit())
+        self.assertEqual(
+            MetricWeek.query.get((company_id, 'sales')).next_week, 5)
+        Sale(company_id=company_id, value=6).save()
+        self.assertEqual(self.series(Sale, company_id)[-1], (5, 6))
+
+    def test_invalid_rows_import_nothing(self):
+        company_id = self.get_id_from_POST(data1)
+        with self.assertRaises(ValueError) as context:
+            import_metrics(io.StringIO(
+                'company_id,metric,week,value\n'
+                f'{company_id},sales,0,1\n'
+                f'{company_id},revenue,0,1\n'
+                f'{company_id},sales,0,2\n'
+                f'{company_id + 1000},sales,1,1\n'
+                f'{company_id},sales,-1,1\n'
+                f'{company_id},sales,one,1\n'
+            ))
+
+        self.assertEqual(str(context.exception).split('\n'), [
+            "line 3: unknown metric 'revenue'",
+            f"line 4: sales week 0 of '{company_id}' is given twice",
+            f"line 5: unknown company '{company_id + 1000}'",
+            'line 6: week must not be negative',
+            'line 7: week and value must be numbers',
+        ])
+        self.assertEqual(self.series(Sale, company_id), [])
+        # the session is usable again
+        self.assertEqual(db.session.query(Company).count(), 1)
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError) as context:
+            import_metrics(io.StringIO('name,metric,value\n'))
+        self.assertEqual(
+            str(context.exception), 'missing columns: company, week')
+
+    def test_import_points_storage(self):
+        self.app.config['METRIC_STORAGE'] = 'points'
+        company_id = self.get_id_from_POST(data1)
+        Sale(company_id=company_id, value=1).save()
+
+        import_metrics(io.StringIO(
+            'company_id,metric,week,value\n'
+            f'{company_id},sales,0,10\n'
+            f'{company_id},mrr,0,20\n'
+        ))
+        self.assertEqual(
+            {(p.metric, p.week): p.value for p in MetricPoint.query},
+            {('sales', 0): 10, ('mrr', 0): 20})
+        self.assertEqual(Sale.query.count(), 0)
@@ -0,0 +1,62 @@
+# server/tests/unit/test_queries.py
+
+from app import db, queries
+from app.models import Company, Sale, User
+from tests.base import BaseTestClass
+from tests.sample_data import data1, data2
+
+
+class HotQueriesTest(BaseTestClass):
+
+    def test_get_matches_query_get(self):
+        company_id = self.get_id_from_POST(data1)
+        db.session.expunge_all()
+
+        company = queries.get(Company, company_id)
+        self.assertEqual(company.name, data1['name'])
+        self.assertIsNone(queries.get(Company, company_id + 1000))
+
+    def test_get_uses_the_identity_map(self):
+        company_id = self.get_id_from_POST(data1)
+        company = Company.query.get(company_id)
+
+        with self.count_queries() as statements:
+            self.assertIs(queries.get(Company, company_id), company)
+        self.assertEqual(statements, [])
+
+    def test_first_by_filters_and_orders(self):
+        first = self.get_id_from_POST(data1)
+        second = self.get_id_from_POST(data2)
+        for company_id in (first, second):
+            for value in (10, 20, 30):
+                Sale(company_id=company_id, value=value).save()
+
+        last = queries.first_by(Sale, '-week', company_id=first)
+        self.assertEqual((last.company_id, last.week), (first, 2))
+        earliest = queries.first_by(Sale, 'week', company_id=second)
+        self.assertEqual((earliest.company_id, earliest.value), (second, 10))
+        self.assertIsNone(queries.first_by(Sale, company_id=second + 1000))
+
+    def test_first_by_applies_every_criterion(self):
+        first = self.get_id_from_POST(data1)
+        second = self.get_id_from_POST(data2)
+
+        self.assertEqual(
+            queries.first_by(Company, id=second, name=data2['name']).id,
+            second)
+        self.assertIsNone(
+            queries.first_by(Company, id=second, name=data1['name']))
+        self.assertIsNone(
+            queries.first_by(Company, id=first, name=data2['name']))
+
+    def test_statement_shapes_do_not_collide(self):
+        first = self.get_id_from_POST(data1)
+        second = self.get_id_from_POST(data2)
+
+        # the same criteria on another model, or another order, is another
+        # cached statement
+        self.assertEqual(queries.first_by(Company, 'id').id, first)
+        self.assertEqual(queries.first_by(Company, '-id').id, second)
+        self.assertEqual(
+            queries.first_by(Company, name=data2['name']).id, second)
+        self.assertIsNone(queries.first_by(User, name=data2['name']))